@@ -89,6 +89,57 @@ DATABASES = {
     }
 }
 
+# Cache
+# Local memory by default, shared by all processes in production with
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and CACHE_LOCATION=redis://redis:6379
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+# Reminder and tag listings are only cached in a cache shared by all processes,
+# in a process-local one a uwsgi worker would keep serving listings changed through the other workers
+LIST_CACHE_ENABLED = bool(int(os.getenv('LIST_CACHE_ENABLED', 'locmem' not in CACHES['default']['BACKEND'])))
+# Seconds for which listings and their versions are cached, they are also invalidated on every change
+LIST_CACHE_TIMEOUT = int(os.getenv('LIST_CACHE_TIMEOUT', 300))
+
+# Seconds for which access tokens are valid, and refresh tokens renewing them without the password
+AUTH_TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', 24 * 60 * 60))
+REFRESH_TOKEN_TTL = int(os.getenv('REFRESH_TOKEN_TTL', 30 * 24 * 60 * 60))
+
+# Tokens resolved by CachedTokenAuthentication are kept in process memory, bounded in size and time,
+# and optionally in a shared cache given by its alias in CACHES
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10_000))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 60))
+AUTH_TOKEN_SHARED_CACHE = os.getenv('AUTH_TOKEN_SHARED_CACHE') or None
+
+# Password hashing
+# The first hasher hashes new passwords, hashes of the others are upgraded to it on the next login.
+# argon2 needs the argon2-cffi package installed.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'scrypt')
+_PASSWORD_HASHERS = {
+    'scrypt': 'users.hashers.TunedScryptPasswordHasher',
+    'argon2': 'users.hashers.TunedArgon2PasswordHasher',
+    'pbkdf2': 'users.hashers.TunedPBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER]
+
+# Cost of the hashers, measure it for a deployment with the benchmark_hashers command
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.getenv('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.getenv('PASSWORD_SCRYPT_BLOCK_SIZE', 8))
+PASSWORD_SCRYPT_PARALLELISM = int(os.getenv('PASSWORD_SCRYPT_PARALLELISM', 1))
+PASSWORD_SCRYPT_MAXMEM = int(os.getenv('PASSWORD_SCRYPT_MAXMEM', 256 * 1024 * 1024))
+PASSWORD_ARGON2_TIME_COST = int(os.getenv('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv('PASSWORD_ARGON2_MEMORY_COST', 102_400))
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv('PASSWORD_ARGON2_PARALLELISM', 8))
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', 320_000))
+
+# Threads of each worker computing hashes, 0 computes them in the request thread.
+# Requests waiting longer than the timeout for a free thread are answered with 429.
+PASSWORD_HASH_THREADS = int(os.getenv('PASSWORD_HASH_THREADS', 2))
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -109,10 +160,8 @@ AUTH_PASSWORD_VALIDATORS = [
         'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
     },
     {
-        'NAME': 'users.validators.NumericInPasswordCustomValidator',
-    },
-    {
-        'NAME': 'users.validators.AtLeastOneCapitalLetterCustomValidator',
+        # Digits and capital letters checked in a single scan
+        'NAME': 'users.validators.PasswordRulesValidator',
     },
 ]
 
@@ -150,3 +199,41 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv('EMAIL_USERNAME')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_PASSWORD')
+
+# Emails are sent in batches over one connection, which is replaced after the message cap
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', 50))
+EMAIL_MAX_MESSAGES_PER_CONNECTION = int(os.getenv('EMAIL_MAX_MESSAGES_PER_CONNECTION', 500))
+
+# Sending limits of the mail provider, 0 turns a limit off.
+# Messages per second of each delivery process, in bursts of up to EMAIL_RATE_BURST messages.
+EMAIL_RATE_LIMIT = float(os.getenv('EMAIL_RATE_LIMIT', 0))
+EMAIL_RATE_BURST = int(os.getenv('EMAIL_RATE_BURST', 10))
+# Messages delivered in any 24 hours by all delivery processes together
+EMAIL_DAILY_QUOTA = int(os.getenv('EMAIL_DAILY_QUOTA', 0))
+# Seconds sending pauses for after the server throttled us with 421 or 451, doubling with every throttling in a row
+EMAIL_THROTTLE_BACKOFF = int(os.getenv('EMAIL_THROTTLE_BACKOFF', 30))
+EMAIL_THROTTLE_MAX_BACKOFF = int(os.getenv('EMAIL_THROTTLE_MAX_BACKOFF', 15 * 60))
+
+# Emails waiting in the outbox are retried with exponential backoff before they are marked as dead
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 8))
+EMAIL_OUTBOX_RETRY_DELAY = int(os.getenv('EMAIL_OUTBOX_RETRY_DELAY', 60))
+# Seconds for which claimed entries are leased to a worker sending them, after which another worker may take them over.
+# It has to be longer than sending a batch takes, including waits for the rate limit.
+EMAIL_OUTBOX_LEASE = int(os.getenv('EMAIL_OUTBOX_LEASE', 10 * 60))
+# Threads of each web worker delivering emails queued by requests, e.g. welcome emails
+EMAIL_OUTBOX_THREADS = int(os.getenv('EMAIL_OUTBOX_THREADS', 2))
+
+# Reminder emails are dispatched at the local midnight reminders become due at, and right after changes making them due.
+# The scheduler keeps the next upcoming days in memory, loaded in batches of the given size.
+# Web processes notify it over Postgres LISTEN/NOTIFY, with other databases it polls at the interval.
+REMINDER_WAKEUP_BATCH_SIZE = int(os.getenv('REMINDER_WAKEUP_BATCH_SIZE', 32))
+REMINDER_WAKEUP_POLL_INTERVAL = int(os.getenv('REMINDER_WAKEUP_POLL_INTERVAL', 60))
+# Seconds after which the scheduler reloads upcoming days even when it hasn't been notified
+REMINDER_WAKEUP_MAX_SLEEP = int(os.getenv('REMINDER_WAKEUP_MAX_SLEEP', 6 * 60 * 60))
+# Seconds before a failed dispatch is retried, doubled after each consecutive failure up to the maximum
+REMINDER_WAKEUP_RETRY_DELAY = int(os.getenv('REMINDER_WAKEUP_RETRY_DELAY', 10))
+REMINDER_WAKEUP_MAX_RETRY_DELAY = int(os.getenv('REMINDER_WAKEUP_MAX_RETRY_DELAY', 10 * 60))
+
+# Default and maximum number of items on a page of API listings
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 50))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 500))
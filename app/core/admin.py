@@ -11,6 +11,7 @@ class UserAdmin(BaseUserAdmin):
     list_display = ['email', 'name']
     fieldsets = (
         (None, {'fields': ('email', 'password', 'name')}),
+        ('Reminder emails', {'fields': ('digest_emails', 'timezone', 'send_hour')}),
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser')}),
         ('Importand dates', {'fields': ('last_login',)})
     )
@@ -29,8 +30,25 @@ class ReminderAdmin(admin.ModelAdmin):
     search_fields = ('title', 'user__name', 'reminder_date')
     list_filter = ('user',)
     ordering = ('user',)
+    readonly_fields = ('sent_check', 'next_notification_at')
+
+
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at')
+    search_fields = ('subject', 'to')
+    list_filter = ('status',)
+    ordering = ('-created_at',)
+
+
+class RefreshTokenAdmin(admin.ModelAdmin):
+    list_display = ('user', 'created_at', 'expires_at')
+    search_fields = ('user__email',)
+    readonly_fields = ('key_hash',)
+    ordering = ('-created_at',)
 
 
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Reminder, ReminderAdmin)
 admin.site.register(models.Tag)
+admin.site.register(models.EmailOutbox, EmailOutboxAdmin)
+admin.site.register(models.RefreshToken, RefreshTokenAdmin)
@@ -0,0 +1,65 @@
+""" Date policy of reminders """
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo, available_timezones
+
+from django.utils import timezone
+
+
+# Zones with the westernmost and the easternmost offsets, local dates anywhere lie between theirs
+EARLIEST_TIMEZONE = ZoneInfo('Etc/GMT+12')
+LATEST_TIMEZONE = ZoneInfo('Etc/GMT-14')
+
+
+@lru_cache(maxsize=None)
+def timezone_names():
+    """ Return names of all available timezones, read from the timezone database once """
+    return frozenset(available_timezones())
+
+
+def local_dates_range(now=None):
+    """ Return the earliest and the latest local date anywhere at the instant """
+    now = now or timezone.now()
+    return now.astimezone(EARLIEST_TIMEZONE).date(), now.astimezone(LATEST_TIMEZONE).date()
+
+
+class DatePolicy:
+    """
+    Minimum reminder date by timezone, computed once per local day.
+    Until the next local midnight a lookup costs a clock read and a comparison.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._thresholds = {}
+        self._lock = threading.Lock()
+
+    def min_reminder_date(self, tz=None):
+        """ Return the earliest date a reminder can be set at, tomorrow in the timezone """
+        tz = tz or timezone.get_current_timezone()
+        now = self.clock()
+        threshold = self._thresholds.get(tz)
+        if threshold is None or now >= threshold[0]:
+            threshold = self._compute(tz, now)
+        return threshold[1]
+
+    def _compute(self, tz, now):
+        """ Compute the minimum date and the local midnight it is valid until """
+        today = datetime.fromtimestamp(now, tz).date()
+        tomorrow = today + timedelta(days=1)
+        # Local midnight, taking the date's own offset, so days of DST changes have their real length
+        midnight = datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=tz).timestamp()
+        threshold = (midnight, tomorrow)
+        with self._lock:
+            self._thresholds[tz] = threshold
+        return threshold
+
+
+policy = DatePolicy()
+
+
+def min_reminder_date(tz=None):
+    """ Return the earliest allowed reminder date in the timezone, by default the active one """
+    return policy.min_reminder_date(tz)
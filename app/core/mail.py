@@ -0,0 +1,239 @@
+""" Mail delivery layer reusing SMTP connections between messages, within the sending limits of the provider """
+import logging
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Errors after which the connection is considered dead and has to be opened again
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+# Responses of a server throttling the sender, the messages are fine but have to be sent later
+THROTTLING_CODES = {421, 451}
+
+# Number of accepted messages after which a halved rate is back at its configured value
+RATE_RECOVERY_MESSAGES = 100
+
+
+def is_throttling(error):
+    """ Check if the error is a temporary rejection because of sending too much """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = {code for code, _ in error.recipients.values()}
+        return bool(codes) and codes <= THROTTLING_CODES
+    return getattr(error, 'smtp_code', None) in THROTTLING_CODES
+
+
+class TokenBucket:
+    """
+    Token bucket spacing messages at rate per second, in bursts of up to capacity messages, no limit with rate 0.
+    When the server throttles us, the rate is halved and sending pauses, for twice as long after each throttling in a row.
+    Accepted messages win the configured rate back step by step.
+    """
+
+    def __init__(self, rate, capacity, backoff, max_backoff, clock=time.monotonic, sleep=time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated_at = clock()
+        self.paused_until = 0
+        self.throttled_in_row = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """ Take a token, sleeping until there is one """
+        if not self.max_rate:
+            return
+        while True:
+            with self._lock:
+                self._refill(self.clock())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+    def pause_remaining(self):
+        """ Return seconds for which sending is paused after the server throttled us """
+        return max(self.paused_until - self.clock(), 0)
+
+    def throttled(self):
+        """ Slow down after a throttling response, return seconds after which sending can be retried """
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self.rate = max(self.rate / 2, self.max_rate / 16)
+            self.throttled_in_row += 1
+            pause = min(self.backoff * 2 ** (self.throttled_in_row - 1), self.max_backoff)
+            self.paused_until = max(self.paused_until, now + pause)
+            return self.paused_until - now
+
+    def accepted(self, count):
+        """ Speed up again after messages have been accepted """
+        if not count:
+            return
+        with self._lock:
+            self._refill(self.clock())
+            self.throttled_in_row = 0
+            self.rate = min(self.max_rate, self.rate + count * self.max_rate / RATE_RECOVERY_MESSAGES)
+
+
+# Limits are shared by all mailers of the process
+rate_limiter = TokenBucket(
+    settings.EMAIL_RATE_LIMIT, settings.EMAIL_RATE_BURST, settings.EMAIL_THROTTLE_BACKOFF, settings.EMAIL_THROTTLE_MAX_BACKOFF
+)
+
+
+class Mailer:
+    """ Send messages in batches over a persistent connection """
+
+    def __init__(self, batch_size=None, max_per_connection=None, connection_factory=get_connection, limiter=None):
+        self.batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+        self.max_per_connection = max_per_connection or settings.EMAIL_MAX_MESSAGES_PER_CONNECTION
+        self.connection_factory = connection_factory
+        self.limiter = limiter if limiter is not None else rate_limiter
+        self.connection = None
+        self.sent_on_connection = 0
+        # Errors of messages which haven't been delivered by the last send_messages() call
+        self.failures = {}
+        # Messages of the last send_messages() call held back by throttling, to be retried after retry_after seconds
+        self.deferred = {}
+        self.retry_after = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        """ Return an open connection, replacing the one which reached its message cap """
+        if self.connection is not None and self.sent_on_connection >= self.max_per_connection:
+            self.close()
+
+        if self.connection is None:
+            self.connection = self.connection_factory(fail_silently=False)
+            self.connection.open()
+            self.sent_on_connection = 0
+
+        return self.connection
+
+    def close(self):
+        """ Close the connection, ignoring errors of an already dropped one """
+        if self.connection is None:
+            return
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+
+    def send_messages(self, messages):
+        """ Send messages and return the list of messages accepted by the server """
+        messages = list(messages)
+        delivered = []
+        position = 0
+        retried = False
+        self.failures = {}
+        self.deferred = {}
+        self.retry_after = 0
+
+        while position < len(messages):
+            pause = self.limiter.pause_remaining()
+            if pause:
+                self.defer(messages[position:], pause, 'Sending is paused after the server throttled us.')
+                break
+
+            batch = messages[position:position + self._batch_room()]
+            accepted, failed, error = self._send_batch(batch)
+            delivered.extend(accepted)
+            position += len(accepted)
+            self.limiter.accepted(len(accepted))
+            if accepted:
+                retried = False
+
+            if error is None:
+                continue
+
+            if is_throttling(error):
+                # The server accepts nothing more for now, the rest is retried once the pause is over
+                self.close()
+                retry_after = self.limiter.throttled()
+                logger.warning('The server throttled sending, %s messages are retried in %.0f seconds: %s', len(messages) - position, retry_after, error)
+                self.defer(messages[position:], retry_after, str(error))
+                break
+
+            if isinstance(error, CONNECTION_ERRORS):
+                self.close()
+                if not retried:
+                    # Give the message which hit a dropped connection one more try on a fresh one
+                    retried = True
+                    continue
+
+            logger.exception('Sending a message failed.', exc_info=error)
+            if failed is None:
+                # The connection couldn't even be opened, there is no point in trying the rest
+                self.failures.update((message, str(error)) for message in messages[position:])
+                break
+
+            self.failures[failed] = str(error)
+
+            # Skip the message the server refused and carry on with the rest
+            position += 1
+            retried = False
+
+        return delivered
+
+    def defer(self, messages, retry_after, error):
+        self.deferred.update((message, error) for message in messages)
+        self.retry_after = retry_after
+
+    def _batch_room(self):
+        """ Return how many messages can be sent in the next batch """
+        if self.connection is None or self.sent_on_connection >= self.max_per_connection:
+            return min(self.batch_size, self.max_per_connection)
+        return min(self.batch_size, self.max_per_connection - self.sent_on_connection)
+
+    def _send_batch(self, batch):
+        """ Send a batch with send_messages(), return accepted messages, the failed one and the error """
+        attempted = []
+
+        def track():
+            for message in batch:
+                self.limiter.acquire()
+                attempted.append(message)
+                yield message
+
+        try:
+            connection = self.open()
+            connection.send_messages(track())
+        except Exception as error:
+            # send_messages() stops at the first failure, so only the last attempted message wasn't accepted
+            accepted = attempted[:-1]
+            self.sent_on_connection += len(accepted)
+            return accepted, attempted[-1] if attempted else None, error
+
+        self.sent_on_connection += len(attempted)
+        return attempted, None, None
+
+
+_local = threading.local()
+
+
+def get_mailer():
+    """ Return the mailer of the current worker thread """
+    if getattr(_local, 'mailer', None) is None:
+        _local.mailer = Mailer()
+    return _local.mailer
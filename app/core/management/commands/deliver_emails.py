@@ -0,0 +1,28 @@
+""" Django command to deliver emails waiting in the outbox """
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.outbox import deliver_outbox
+
+
+class Command(BaseCommand):
+    """ Django command running an outbox delivery worker """
+
+    def add_arguments(self, parser):
+        """ Add batch size, polling interval and single run options """
+        parser.add_argument('--batch-size', type=int, help="Number of emails claimed at once.")
+        parser.add_argument('--poll-interval', type=int, default=10, help="Seconds to wait when the outbox is empty.")
+        parser.add_argument('--once', action='store_true', help="Drain the outbox once and exit.")
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command """
+        while True:
+            delivered_count = deliver_outbox(options['batch_size'])
+            if delivered_count:
+                self.stdout.write(f'{delivered_count} emails have been delivered.')
+
+            if options['once']:
+                break
+            if not delivered_count:
+                time.sleep(options['poll_interval'])
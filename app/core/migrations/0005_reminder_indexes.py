@@ -0,0 +1,25 @@
+# Generated by Django 4.0.10 on 2026-10-18 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['reminder_date', 'sent_check'], name='reminder_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(condition=models.Q(('permanent', False)), fields=['reminder_date'], name='reminder_expiring_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['user', '-reminder_date'], name='reminder_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.0.10 on 2026-10-18 07:26
+
+from datetime import date, timedelta
+
+from django.db import migrations, models
+
+STAGES = [('month', 30, 8), ('week', 7, 4), ('three_days', 3, 2), ('one_day', 1, 1), ('today', 0, 0)]
+
+
+def populate_next_notification_at(apps, schema_editor):
+    """ Compute the next notification date of existing reminders """
+    Reminder = apps.get_model('core', 'Reminder')
+    today = date.today()
+    batch = []
+
+    for reminder in Reminder.objects.only('id', 'reminder_date', 'sent_check').iterator(chunk_size=2000):
+        for stage, opens, closes in STAGES:
+            if stage != reminder.sent_check and reminder.reminder_date - timedelta(days=closes) >= today:
+                reminder.next_notification_at = max(reminder.reminder_date - timedelta(days=opens), today)
+                batch.append(reminder)
+                break
+
+        if len(batch) >= 2000:
+            Reminder.objects.bulk_update(batch, ['next_notification_at'])
+            batch = []
+
+    Reminder.objects.bulk_update(batch, ['next_notification_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_reminder_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='reminder',
+            name='reminder_due_idx',
+        ),
+        migrations.AddField(
+            model_name='reminder',
+            name='next_notification_at',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['next_notification_at'], name='reminder_next_notification_idx'),
+        ),
+        migrations.RunPython(populate_next_notification_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.10 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_reminder_next_notification_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='reminder',
+            name='reminder_user_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['user', '-reminder_date', '-id'], name='reminder_user_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-name', '-id'], name='tag_user_name_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-18 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_refreshtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='html_body',
+            field=models.TextField(blank=True),
+        ),
+    ]
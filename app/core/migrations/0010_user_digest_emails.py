@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-18 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_emailoutbox_html_body'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='digest_emails',
+            field=models.BooleanField(default=False),
+        ),
+    ]
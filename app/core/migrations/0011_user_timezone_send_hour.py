@@ -0,0 +1,29 @@
+# Generated by Django 4.0.10 on 2026-10-18 07:59
+
+import core.validators
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_user_digest_emails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='send_hour',
+            field=models.PositiveSmallIntegerField(default=0, validators=[django.core.validators.MaxValueValidator(23)]),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='timezone',
+            field=models.CharField(default='UTC', max_length=63, validators=[core.validators.validate_timezone]),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['timezone', 'send_hour'], name='user_timezone_hour_idx'),
+        ),
+    ]
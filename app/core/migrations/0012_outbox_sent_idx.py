@@ -0,0 +1,17 @@
+# Generated by Django 4.0.10 on 2026-10-18 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_user_timezone_send_hour'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailoutbox',
+            index=models.Index(fields=['status', 'sent_at'], name='outbox_sent_idx'),
+        ),
+    ]
@@ -1,9 +1,15 @@
 """ Database models """
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
 from django.db import models
 from django.conf import settings
+from django.core.validators import MaxValueValidator
+from django.core.mail import EmailMultiAlternatives
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
-from core.validators import validate_reminder_date
+from core.validators import validate_reminder_date, validate_timezone
 
 
 # User Model
@@ -36,12 +42,27 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Reminders due on the same dispatch run are sent in a single email
+    digest_emails = models.BooleanField(default=False)
+    # Reminder emails are sent on local dates of the user, from the local hour on
+    timezone = models.CharField(max_length=63, default='UTC', validators=[validate_timezone])
+    send_hour = models.PositiveSmallIntegerField(default=0, validators=[MaxValueValidator(23)])
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['name']  # Only for superusers CLI
 
+    class Meta:
+        indexes = [
+            # Hourly dispatch buckets by local time
+            models.Index(fields=['timezone', 'send_hour'], name='user_timezone_hour_idx'),
+        ]
+
+    def local_today(self):
+        """ Return the current date in the timezone of the user """
+        return timezone.now().astimezone(ZoneInfo(self.timezone)).date()
+
 
 # Reminder Model
 SENT_CHECKS = [
@@ -53,6 +74,24 @@ SENT_CHECKS = [
     ('today', 'Today'),
 ]
 
+# Stages of reminder emails with the number of days before the reminder date their window opens and closes
+NOTIFICATION_STAGES = [
+    ('month', 30, 8),
+    ('week', 7, 4),
+    ('three_days', 3, 2),
+    ('one_day', 1, 1),
+    ('today', 0, 0),
+]
+
+
+def next_notification_date(reminder_date, sent_check, today):
+    """ Return the first date from today on which a stage email of the reminder is due """
+    for stage, opens, closes in NOTIFICATION_STAGES:
+        if stage == sent_check or reminder_date - timedelta(days=closes) < today:
+            continue
+        return max(reminder_date - timedelta(days=opens), today)
+    return None
+
 
 class Reminder(models.Model):
     """ Reminder object """
@@ -63,18 +102,109 @@ class Reminder(models.Model):
     reminder_date = models.DateField(validators=[validate_reminder_date])
     permanent = models.BooleanField(default=False)
     sent_check = models.CharField(max_length=255, choices=SENT_CHECKS, default='None')
+    # Denormalized, so dispatching only has to look at reminders which are actually due
+    next_notification_at = models.DateField(null=True, blank=True, editable=False)
     created_at = models.DateField(auto_now_add=True)
     updated_at = models.DateField(auto_now=True)
     tags = models.ManyToManyField('Tag', blank=True)
 
+    class Meta:
+        indexes = [
+            # Dispatch scan of reminders with a due notification
+            models.Index(fields=['next_notification_at'], name='reminder_next_notification_idx'),
+            # Clean up of non-permanent reminders from the past
+            models.Index(fields=['reminder_date'], condition=models.Q(permanent=False), name='reminder_expiring_idx'),
+            # Keyset pagination of reminders of a user
+            models.Index(fields=['user', '-reminder_date', '-id'], name='reminder_user_date_id_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+    def update_next_notification(self, today=None):
+        """ Recompute the date of the next notification, e.g. before bulk_create() which bypasses save() """
+        self.next_notification_at = next_notification_date(self.reminder_date, self.sent_check, today or self.user.local_today())
+
+    def save(self, *args, **kwargs):
+        """ Save the reminder, keeping the date of its next notification up to date """
+        self.update_next_notification()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'next_notification_at' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'next_notification_at']
+        super().save(*args, **kwargs)
+
 
 class Tag(models.Model):
     """ Tag object """
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of tags of a user
+            models.Index(fields=['user', '-name', '-id'], name='tag_user_name_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
+
+
+# Email Outbox Model
+OUTBOX_STATUSES = [
+    ('pending', 'Pending'),
+    ('sent', 'Sent'),
+    ('dead', 'Dead'),
+]
+
+
+class EmailOutbox(models.Model):
+    """ Email waiting for delivery by the outbox workers """
+    subject = models.TextField()
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.TextField()  # Comma separated list of recipients
+    status = models.CharField(max_length=16, choices=OUTBOX_STATUSES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'email outbox'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_pending_idx'),
+            # Daily quota count and purge of sent entries
+            models.Index(fields=['status', 'sent_at'], name='outbox_sent_idx'),
+        ]
+
+    def __str__(self):
+        return self.subject
+
+    @classmethod
+    def from_message(cls, message):
+        """ Create an unsaved outbox entry from an email message, keeping its HTML alternative """
+        html_body = next((content for content, mimetype in getattr(message, 'alternatives', []) if mimetype == 'text/html'), '')
+        return cls(
+            subject=message.subject, body=message.body, html_body=html_body, from_email=message.from_email or '', to=','.join(message.to)
+        )
+
+    def to_message(self):
+        """ Return the email message of the outbox entry, multipart when it has an HTML body """
+        message = EmailMultiAlternatives(self.subject, self.body, from_email=self.from_email or None, to=self.to.split(','))
+        if self.html_body:
+            message.attach_alternative(self.html_body, 'text/html')
+        return message
+
+
+# Refresh Token Model
+class RefreshToken(models.Model):
+    """ Long lived token renewing the access token of a user without the password, only its hash is stored """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='refresh_tokens')
+    key_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'Refresh token of {self.user}'
@@ -0,0 +1,157 @@
+""" Durable outbox of emails drained by delivery workers """
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.mail import get_mailer
+from core.models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(messages):
+    """ Store messages in the outbox, call it in the transaction of the change which caused them """
+    return EmailOutbox.objects.bulk_create([EmailOutbox.from_message(message) for message in messages])
+
+
+def retry_delay(attempts):
+    """ Return the delay before the next attempt, doubling with every failed one """
+    return timedelta(seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def claim_batch(batch_size, ids=None):
+    """
+    Lease pending entries due for delivery to the current worker and return them, skipping ones claimed by other workers.
+    Rows are only locked while the lease is taken, leased entries aren't due again until the lease expires,
+    so they are sent outside of a transaction, and taken over by another worker when this one dies before recording results.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        pending = EmailOutbox.objects.filter(status='pending', next_attempt_at__lte=now)
+        if ids is not None:
+            pending = pending.filter(id__in=ids)
+        pending = pending.order_by('next_attempt_at', 'id').select_for_update(skip_locked=True)
+        batch = list(pending[:batch_size])
+        leased_until = now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE)
+        EmailOutbox.objects.filter(id__in=[entry.id for entry in batch]).update(next_attempt_at=leased_until)
+    return batch
+
+
+def remaining_quota(now):
+    """ Return how many more emails the provider accepts within its daily quota, or None without a quota """
+    if not settings.EMAIL_DAILY_QUOTA:
+        return None
+    sent = EmailOutbox.objects.filter(status='sent', sent_at__gt=now - timedelta(days=1)).count()
+    return max(settings.EMAIL_DAILY_QUOTA - sent, 0)
+
+
+def record_deferred(deferred, retry_at):
+    """ Retry entries held back by throttling at the given time, throttling doesn't count as a failed attempt """
+    for entry, error in deferred.items():
+        entry.next_attempt_at = retry_at
+        entry.last_error = error
+
+    EmailOutbox.objects.bulk_update(list(deferred), ['next_attempt_at', 'last_error'])
+
+
+def record_failures(failures, now):
+    """ Schedule failed entries for a retry with backoff or move them to the dead letters """
+    for entry, error in failures.items():
+        entry.attempts += 1
+        entry.last_error = error or 'Message has not been delivered.'
+        if entry.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            entry.status = 'dead'
+        else:
+            entry.next_attempt_at = now + retry_delay(entry.attempts)
+
+    EmailOutbox.objects.bulk_update(list(failures), ['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def deliver_outbox(batch_size=None, mailer=None, ids=None):
+    """ Deliver pending outbox entries in batches and return the number of delivered emails """
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    mailer = mailer or get_mailer()
+    delivered_count = 0
+    # Concurrent workers may together exceed the quota by at most a batch each
+    quota = remaining_quota(timezone.now())
+
+    try:
+        while True:
+            if quota is not None and quota <= 0:
+                print('The daily email quota has been reached, the rest is delivered later.')
+                break
+
+            batch = claim_batch(batch_size if quota is None else min(batch_size, quota), ids)
+            if not batch:
+                break
+
+            # No transaction is held open while waiting for the rate limit and the SMTP server
+            messages = {entry: entry.to_message() for entry in batch}
+            delivered = set(mailer.send_messages(messages.values()))
+            sent_ids = [entry.id for entry, message in messages.items() if message in delivered]
+            deferred = {entry: mailer.deferred[message] for entry, message in messages.items() if message in mailer.deferred}
+            failures = {
+                entry: mailer.failures.get(message) for entry, message in messages.items()
+                if message not in delivered and message not in mailer.deferred
+            }
+            now = timezone.now()
+
+            with transaction.atomic():
+                EmailOutbox.objects.filter(id__in=sent_ids).update(status='sent', sent_at=now, attempts=F('attempts') + 1)
+                if deferred:
+                    record_deferred(deferred, now + timedelta(seconds=mailer.retry_after))
+                if failures:
+                    record_failures(failures, now)
+
+            delivered_count += len(sent_ids)
+            if quota is not None:
+                quota -= len(sent_ids)
+            if not sent_ids or deferred:
+                # Nothing got through or the server throttles us, so leave the rest for later
+                break
+    finally:
+        mailer.close()
+
+    return delivered_count
+
+
+def purge_sent(days=7):
+    """ Delete entries delivered more than given number of days ago """
+    EmailOutbox.objects.filter(status='sent', sent_at__lt=timezone.now() - timedelta(days=days)).delete()
+
+
+# Bounded pool delivering fresh entries as soon as the transaction which created them has been committed
+_executor = ThreadPoolExecutor(max_workers=settings.EMAIL_OUTBOX_THREADS, thread_name_prefix='outbox')
+_slots = threading.BoundedSemaphore(settings.EMAIL_OUTBOX_THREADS * 2)
+
+
+def deliver_in_background(entries):
+    """ Deliver entries in a background thread after the current transaction commits """
+    ids = [entry.id for entry in entries]
+    transaction.on_commit(lambda: submit_delivery(ids))
+
+
+def submit_delivery(ids):
+    """ Hand entries over to the pool, unless it is saturated """
+    if not _slots.acquire(blocking=False):
+        # The entries stay pending, so the delivery workers pick them up
+        return None
+    return _executor.submit(_deliver_in_thread, ids)
+
+
+def _deliver_in_thread(ids):
+    """ Deliver entries in a pool thread and release its slot """
+    try:
+        deliver_outbox(ids=ids)
+    except Exception:
+        # The entries stay pending, so the delivery workers pick them up
+        logger.exception('Delivering outbox entries %s in the background failed.', ids)
+    finally:
+        _slots.release()
+        connection.close()
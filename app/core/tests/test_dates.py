@@ -0,0 +1,91 @@
+""" Tests for the reminder date policy """
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
+
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from core.dates import DatePolicy
+from core.validators import validate_reminder_date
+
+# Zones with DST changes, and the ones furthest from UTC in both directions
+TIMEZONES = [ZoneInfo(name) for name in ['UTC', 'Europe/Warsaw', 'America/Santiago', 'Pacific/Kiritimati', 'Pacific/Pago_Pago']]
+
+
+class FakeClock:
+    """ Clock returning a settable timestamp """
+
+    def __init__(self, moment):
+        self.now = moment.timestamp()
+
+    def __call__(self):
+        return self.now
+
+
+def local_tomorrow(clock, tz):
+    """ Return the expected minimum date, computed without the policy """
+    return datetime.fromtimestamp(clock.now, tz).date() + timedelta(days=1)
+
+
+class DatePolicyTests(SimpleTestCase):
+    """ Test the minimum reminder date """
+
+    def test_every_hour_of_several_years(self):
+        """ Test the cached date always equals tomorrow, over leap years, month and year ends, and DST changes """
+        start = datetime(2023, 12, 1, tzinfo=dt_timezone.utc)
+        for tz in TIMEZONES:
+            clock = FakeClock(start)
+            policy = DatePolicy(clock=clock)
+            # Steps of 5 hours move through every hour of the day
+            for _ in range(0, 366 * 2 * 24, 5):
+                self.assertEqual(policy.min_reminder_date(tz), local_tomorrow(clock, tz), datetime.fromtimestamp(clock.now, tz))
+                clock.now += 5 * 3600
+
+    def test_year_and_month_ends(self):
+        """ Test the date right before and at local midnight of month and year ends """
+        for tz in TIMEZONES:
+            for year, month, day in [(2024, 12, 31), (2025, 1, 31), (2024, 2, 29), (2025, 2, 28), (2025, 4, 30)]:
+                midnight = datetime(year, month, day, tzinfo=tz) + timedelta(days=1)
+                clock = FakeClock(midnight - timedelta(microseconds=1))
+                policy = DatePolicy(clock=clock)
+
+                self.assertEqual(policy.min_reminder_date(tz), date(year, month, day) + timedelta(days=1))
+                clock.now = midnight.timestamp()
+                self.assertEqual(policy.min_reminder_date(tz), date(year, month, day) + timedelta(days=2))
+
+    def test_computed_once_per_day(self):
+        """ Test the date is computed once a day and looked up in between """
+        clock = FakeClock(datetime(2024, 12, 31, tzinfo=dt_timezone.utc))
+        policy = DatePolicy(clock=clock)
+
+        with patch.object(policy, '_compute', wraps=policy._compute) as compute:
+            for _ in range(48):
+                policy.min_reminder_date(dt_timezone.utc)
+                clock.now += 1800
+
+        self.assertEqual(compute.call_count, 1)
+
+    def test_current_timezone(self):
+        """ Test the active timezone is used by default """
+        clock = FakeClock(datetime(2024, 12, 31, 12, tzinfo=dt_timezone.utc))
+        policy = DatePolicy(clock=clock)
+
+        with timezone.override(ZoneInfo('Pacific/Kiritimati')):
+            self.assertEqual(policy.min_reminder_date(), date(2025, 1, 2))
+        with timezone.override(ZoneInfo('Pacific/Pago_Pago')):
+            self.assertEqual(policy.min_reminder_date(), date(2025, 1, 1))
+
+
+class ValidateReminderDateTests(SimpleTestCase):
+    """ Test the reminder date validator """
+
+    def test_december(self):
+        """ Test validating on the last day of December doesn't fail on the 13th month """
+        clock = FakeClock(datetime(2024, 12, 31, 12, tzinfo=dt_timezone.utc))
+
+        with patch('core.dates.policy', DatePolicy(clock=clock)):
+            validate_reminder_date(date(2025, 1, 1))
+            with self.assertRaises(ValidationError):
+                validate_reminder_date(date(2024, 12, 31))
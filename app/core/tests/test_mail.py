@@ -0,0 +1,192 @@
+""" Tests for the mail delivery layer """
+import smtplib
+
+from django.core.mail import EmailMessage
+from django.test import SimpleTestCase
+
+from core.mail import Mailer, TokenBucket
+
+
+class FakeConnection:
+    """ Connection recording sent messages, failing on messages listed in failures """
+    opened = 0
+
+    def __init__(self, failures, sent, **kwargs):
+        self.failures = failures
+        self.sent = sent
+
+    def open(self):
+        FakeConnection.opened += 1
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        for message in messages:
+            error = self.failures.pop(message.subject, None)
+            if error is not None:
+                raise error
+            self.sent.append((FakeConnection.opened, message.subject))
+
+
+class FakeClock:
+    """ Clock moved forward by sleeping """
+
+    def __init__(self):
+        self.now = 0
+        self.slept = 0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+
+def create_bucket(clock, rate=0, capacity=1, backoff=30, max_backoff=300):
+    """ Create and return a token bucket using the fake clock """
+    return TokenBucket(rate, capacity, backoff, max_backoff, clock=clock, sleep=clock.sleep)
+
+
+def create_messages(count):
+    """ Create and return a list of test messages """
+    return [EmailMessage(f'message {number}', 'Body', to=['test@example.com']) for number in range(count)]
+
+
+class MailerTests(SimpleTestCase):
+    """ Test sending messages with Mailer """
+
+    def setUp(self):
+        FakeConnection.opened = 0
+        self.failures = {}
+        self.sent = []
+
+    def create_mailer(self, **kwargs):
+        """ Create and return a mailer using fake connections """
+        kwargs.setdefault('limiter', create_bucket(FakeClock()))
+        return Mailer(connection_factory=lambda **options: FakeConnection(self.failures, self.sent), **kwargs)
+
+    def test_messages_reuse_one_connection(self):
+        """ Test all messages are sent over a single connection """
+        messages = create_messages(10)
+        delivered = self.create_mailer(batch_size=3, max_per_connection=100).send_messages(messages)
+
+        self.assertEqual(delivered, messages)
+        self.assertEqual(FakeConnection.opened, 1)
+
+    def test_connection_replaced_after_message_cap(self):
+        """ Test the connection is replaced after sending the maximum number of messages """
+        self.create_mailer(batch_size=10, max_per_connection=4).send_messages(create_messages(10))
+
+        self.assertEqual(FakeConnection.opened, 3)
+        self.assertEqual([connection for connection, _ in self.sent], [1] * 4 + [2] * 4 + [3] * 2)
+
+    def test_reconnects_when_server_drops_connection(self):
+        """ Test the message which hit a dropped connection is resent over a new one """
+        self.failures['message 2'] = smtplib.SMTPServerDisconnected()
+        messages = create_messages(5)
+
+        delivered = self.create_mailer(batch_size=5, max_per_connection=100).send_messages(messages)
+
+        self.assertEqual(delivered, messages)
+        self.assertEqual(FakeConnection.opened, 2)
+
+    def test_refused_message_skipped(self):
+        """ Test a refused message is not reported as delivered and the rest is still sent """
+        self.failures['message 1'] = smtplib.SMTPRecipientsRefused({})
+        messages = create_messages(3)
+
+        with self.assertLogs('core.mail', level='ERROR') as logs:
+            delivered = self.create_mailer(batch_size=5, max_per_connection=100).send_messages(messages)
+
+        self.assertEqual(delivered, [messages[0], messages[2]])
+        self.assertEqual(FakeConnection.opened, 1)
+        self.assertIn('SMTPRecipientsRefused', logs.output[0])
+
+    def test_throttled_messages_deferred(self):
+        """ Test messages from the one the server throttled on are deferred, not failed """
+        self.failures['message 2'] = smtplib.SMTPDataError(451, b'Too many messages, slow down')
+        messages = create_messages(5)
+        mailer = self.create_mailer(batch_size=5, max_per_connection=100)
+
+        with self.assertLogs('core.mail', level='WARNING') as logs:
+            delivered = mailer.send_messages(messages)
+
+        self.assertEqual(delivered, messages[:2])
+        self.assertEqual(list(mailer.deferred), messages[2:])
+        self.assertEqual(mailer.failures, {})
+        self.assertEqual(mailer.retry_after, 30)
+        self.assertEqual(logs.records[0].levelname, 'WARNING')
+
+    def test_sending_paused_after_throttling(self):
+        """ Test nothing is sent until the pause after throttling is over """
+        self.failures['message 0'] = smtplib.SMTPRecipientsRefused({'test@example.com': (421, b'Try again later')})
+        clock = FakeClock()
+        mailer = self.create_mailer(limiter=create_bucket(clock))
+        mailer.send_messages(create_messages(1))
+
+        clock.now = 10
+        messages = create_messages(3)
+        self.assertEqual(mailer.send_messages(messages), [])
+        self.assertEqual(list(mailer.deferred), messages)
+        self.assertEqual(mailer.retry_after, 20)
+
+        clock.now = 30
+        self.assertEqual(mailer.send_messages(messages), messages)
+
+    def test_rate_limited(self):
+        """ Test messages are spaced to the configured rate """
+        clock = FakeClock()
+        self.create_mailer(limiter=create_bucket(clock, rate=2, capacity=2)).send_messages(create_messages(6))
+
+        self.assertEqual(len(self.sent), 6)
+        self.assertEqual(clock.slept, 2)
+
+
+class TokenBucketTests(SimpleTestCase):
+    """ Test the token bucket limiting sending """
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_burst_without_waiting(self):
+        """ Test a full bucket lets a burst through at once """
+        bucket = create_bucket(self.clock, rate=1, capacity=5)
+        for _ in range(5):
+            bucket.acquire()
+
+        self.assertEqual(self.clock.slept, 0)
+        bucket.acquire()
+        self.assertEqual(self.clock.slept, 1)
+
+    def test_unlimited(self):
+        """ Test a bucket without a rate never waits """
+        bucket = create_bucket(self.clock)
+        for _ in range(100):
+            bucket.acquire()
+
+        self.assertEqual(self.clock.slept, 0)
+
+    def test_throttling_backs_off(self):
+        """ Test throttling in a row halves the rate and doubles the pause, up to their limits """
+        bucket = create_bucket(self.clock, rate=16, max_backoff=100)
+
+        self.assertEqual([bucket.throttled() for _ in range(4)], [30, 60, 100, 100])
+        self.assertEqual(bucket.rate, 1)
+        bucket.throttled()
+        self.assertEqual(bucket.rate, 1)
+
+    def test_accepted_messages_recover_rate(self):
+        """ Test accepted messages win the rate back and reset the backoff """
+        bucket = create_bucket(self.clock, rate=10)
+        bucket.throttled()
+        bucket.throttled()
+
+        bucket.accepted(50)
+
+        self.assertEqual(bucket.rate, 7.5)
+        self.clock.now = 1000
+        self.assertEqual(bucket.throttled(), 30)
+        bucket.accepted(1000)
+        self.assertEqual(bucket.rate, 10)
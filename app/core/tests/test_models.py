@@ -1,9 +1,9 @@
 """ Tests for models """
-from datetime import date
+from datetime import date, timedelta
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
-from ..models import Reminder
+from ..models import Reminder, next_notification_date
 
 
 class ModelTests(TestCase):
@@ -54,3 +54,35 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(reminder), reminder.title)
         self.assertEqual(reminder.sent_check, 'None')
+
+    def test_next_notification_date(self):
+        """ Test the next notification date follows the stage windows """
+        today = date(2024, 6, 10)
+        cases = [
+            (today + timedelta(days=60), 'None', today + timedelta(days=30)),
+            (today + timedelta(days=20), 'None', today),
+            (today + timedelta(days=20), 'month', today + timedelta(days=13)),
+            (today + timedelta(days=5), 'month', today),
+            (today + timedelta(days=5), 'week', today + timedelta(days=2)),
+            (today + timedelta(days=2), 'three_days', today + timedelta(days=1)),
+            (today + timedelta(days=1), 'one_day', today + timedelta(days=1)),
+            (today, 'one_day', today),
+            (today - timedelta(days=1), 'None', None),
+        ]
+
+        for reminder_date, sent_check, expected in cases:
+            self.assertEqual(next_notification_date(reminder_date, sent_check, today), expected)
+
+    def test_reminder_save_sets_next_notification(self):
+        """ Test saving a reminder keeps its next notification date up to date """
+        user = get_user_model().objects.create_user(email='test@example.com', password='Test1234')
+        reminder_date = date.today() + timedelta(days=60)
+        reminder = Reminder.objects.create(title='Test Reminder', reminder_date=reminder_date, user=user)
+        self.assertEqual(reminder.next_notification_at, reminder_date - timedelta(days=30))
+
+        reminder.reminder_date = date.today() + timedelta(days=10)
+        reminder.sent_check = 'month'
+        reminder.save(update_fields=['reminder_date', 'sent_check'])
+
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.next_notification_at, reminder.reminder_date - timedelta(days=7))
@@ -0,0 +1,173 @@
+""" Tests for the email outbox """
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import EmailOutbox
+from core.outbox import _deliver_in_thread, _slots, claim_batch, deliver_outbox, enqueue
+
+
+def create_messages(count):
+    """ Create and return a list of test messages """
+    return [EmailMessage(f'Message {number}', 'Body', to=['test@example.com']) for number in range(count)]
+
+
+def failing_mailer():
+    """ Create and return a mailer which doesn't deliver any message """
+    mailer = MagicMock()
+    mailer.send_messages.return_value = []
+    mailer.failures = {}
+    return mailer
+
+
+def throttling_mailer(accepted_count, retry_after):
+    """ Create and return a mailer which is throttled after delivering a number of messages """
+    mailer = MagicMock()
+
+    def send_messages(messages):
+        messages = list(messages)
+        mailer.deferred = {message: '451 Too many messages' for message in messages[accepted_count:]}
+        return messages[:accepted_count]
+
+    mailer.send_messages.side_effect = send_messages
+    mailer.failures = {}
+    mailer.retry_after = retry_after
+    return mailer
+
+
+class OutboxTests(TestCase):
+    """ Test enqueueing and delivering emails """
+
+    def test_enqueue_stores_messages(self):
+        """ Test enqueued messages are stored as pending outbox entries """
+        enqueue(create_messages(3))
+
+        self.assertEqual(EmailOutbox.objects.filter(status='pending').count(), 3)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_deliver_outbox(self):
+        """ Test pending entries are delivered and marked as sent """
+        enqueue(create_messages(5))
+
+        delivered_count = deliver_outbox(batch_size=2)
+
+        self.assertEqual(delivered_count, 5)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].to, ['test@example.com'])
+        self.assertFalse(EmailOutbox.objects.exclude(status='sent').exists())
+
+    def test_sent_entries_not_delivered_again(self):
+        """ Test delivering the outbox twice doesn't repeat emails """
+        enqueue(create_messages(2))
+
+        deliver_outbox()
+        deliver_outbox()
+
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed_entry_retried_later(self):
+        """ Test a failed entry is scheduled for a retry with backoff """
+        entry, = enqueue(create_messages(1))
+        first_attempt_at = EmailOutbox.objects.get(id=entry.id).next_attempt_at
+
+        deliver_outbox(mailer=failing_mailer())
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'pending')
+        self.assertEqual(entry.attempts, 1)
+        self.assertGreater(entry.next_attempt_at, first_attempt_at)
+        self.assertEqual(deliver_outbox(), 0)
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=1)
+    def test_entry_dead_after_max_attempts(self):
+        """ Test an entry is moved to dead letters after running out of attempts """
+        entry, = enqueue(create_messages(1))
+
+        deliver_outbox(mailer=failing_mailer())
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'dead')
+
+    def test_deliver_emails_command(self):
+        """ Test deliver_emails command drains the outbox """
+        enqueue(create_messages(3))
+
+        call_command('deliver_emails', '--once')
+
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_throttled_entries_deferred(self):
+        """ Test entries held back by throttling are retried after the pause without counting an attempt """
+        enqueue(create_messages(5))
+        started = timezone.now()
+
+        delivered_count = deliver_outbox(mailer=throttling_mailer(2, 60))
+
+        self.assertEqual(delivered_count, 2)
+        deferred = EmailOutbox.objects.filter(status='pending')
+        self.assertEqual(deferred.count(), 3)
+        for entry in deferred:
+            self.assertEqual(entry.attempts, 0)
+            self.assertEqual(entry.last_error, '451 Too many messages')
+            self.assertGreaterEqual(entry.next_attempt_at, started + timedelta(seconds=60))
+        self.assertEqual(deliver_outbox(), 0)
+
+    @override_settings(EMAIL_DAILY_QUOTA=4)
+    def test_daily_quota(self):
+        """ Test no more emails are delivered than the quota allows in 24 hours """
+        sent, = enqueue(create_messages(1))
+        EmailOutbox.objects.filter(id=sent.id).update(status='sent', sent_at=timezone.now() - timedelta(hours=23))
+        enqueue(create_messages(5))
+
+        self.assertEqual(deliver_outbox(batch_size=2), 3)
+        self.assertEqual(deliver_outbox(), 0)
+
+        EmailOutbox.objects.filter(id=sent.id).update(sent_at=timezone.now() - timedelta(hours=25))
+        self.assertEqual(deliver_outbox(), 1)
+
+    def test_entries_leased_while_sending(self):
+        """ Test entries being sent are leased, so other workers skip them without waiting for a lock """
+        enqueue(create_messages(2))
+        mailer = MagicMock()
+        mailer.failures = {}
+        mailer.deferred = {}
+        claimed_meanwhile = []
+
+        def send_messages(messages):
+            claimed_meanwhile.extend(claim_batch(10))
+            return list(messages)
+
+        mailer.send_messages.side_effect = send_messages
+
+        self.assertEqual(deliver_outbox(mailer=mailer), 2)
+        self.assertEqual(claimed_meanwhile, [])
+        self.assertFalse(EmailOutbox.objects.exclude(status='sent').exists())
+
+    @override_settings(EMAIL_OUTBOX_LEASE=600)
+    def test_expired_lease_taken_over(self):
+        """ Test entries of a worker which died while sending are delivered by another one once the lease expires """
+        entry, = enqueue(create_messages(1))
+        self.assertEqual(claim_batch(10), [entry])
+
+        self.assertEqual(deliver_outbox(), 0)
+        with patch('core.outbox.timezone.now', return_value=timezone.now() + timedelta(seconds=601)):
+            self.assertEqual(deliver_outbox(), 1)
+
+    def test_background_failure_logged(self):
+        """ Test an error of background delivery is logged with its traceback and the pool slot is released """
+        entry, = enqueue(create_messages(1))
+        self.assertTrue(_slots.acquire(blocking=False))
+
+        with patch('core.outbox.deliver_outbox', side_effect=ConnectionError('Connection refused')), patch('core.outbox.connection'):
+            with self.assertLogs('core.outbox', level='ERROR') as logs:
+                _deliver_in_thread([entry.id])
+
+        self.assertIn(str(entry.id), logs.output[0])
+        self.assertIsNotNone(logs.records[0].exc_info)
+        self.assertTrue(_slots.acquire(blocking=False))
+        _slots.release()
@@ -6,5 +6,5 @@ class RemindersConfig(AppConfig):
     name = 'reminders'
 
     def ready(self):
-        from . import manage_reminders
-        manage_reminders.start()
+        """ Connect signal receivers """
+        from reminders import signals  # noqa: F401
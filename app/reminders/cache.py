@@ -0,0 +1,104 @@
+""" Per-user cache of reminder and tag listings """
+import hashlib
+import threading
+from contextlib import contextmanager
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def version_key(user_id):
+    return f'reminders:list-version:{user_id}'
+
+
+def list_version(user_id):
+    """ Return the current version of listings of the user """
+    version = cache.get(version_key(user_id))
+    if version is None:
+        # A random version, unlike a counter, can't repeat an ETag after the key has been evicted
+        version = uuid4().hex
+        # Expiring with the listings, so a process which missed a bump can't keep an old version for longer
+        if not cache.add(version_key(user_id), version, timeout=settings.LIST_CACHE_TIMEOUT):
+            version = cache.get(version_key(user_id), version)
+    return version
+
+
+# Users whose listings are bumped at the end of the batched_list_bumps() block the current thread is in
+_batch = threading.local()
+
+
+def bump_list_versions(user_ids):
+    """ Invalidate cached listings of the users, once now and again when the current transaction commits """
+    user_ids = set(user_ids)
+    pending = getattr(_batch, 'user_ids', None)
+    if pending is not None:
+        pending.update(user_ids)
+        return
+
+    def bump():
+        cache.set_many({version_key(user_id): uuid4().hex for user_id in user_ids}, timeout=settings.LIST_CACHE_TIMEOUT)
+
+    if user_ids:
+        bump()
+        # A listing read before the commit could have been cached under the version bumped above
+        transaction.on_commit(bump)
+
+
+@contextmanager
+def batched_list_bumps():
+    """
+    Bump listings of every user once at the end of the block, instead of once per row.
+    QuerySet.delete() sends post_delete for each deleted reminder, which would otherwise bump its owner every time.
+    """
+    if getattr(_batch, 'user_ids', None) is not None:
+        yield
+        return
+
+    _batch.user_ids = set()
+    try:
+        yield
+    finally:
+        user_ids = _batch.user_ids
+        _batch.user_ids = None
+        bump_list_versions(user_ids)
+
+
+class CachedListMixin:
+    """
+    Serve list responses from a per-user cache and answer conditional requests with 304 Not Modified.
+    Without a cache shared by all processes, listings are read from the database on every request.
+    """
+    list_cache_prefix = 'list'
+
+    def list(self, request, *args, **kwargs):
+        if not settings.LIST_CACHE_ENABLED:
+            return super().list(request, *args, **kwargs)
+
+        # The version has to be read before the data, so stale data is never stored under a newer version
+        version = list_version(request.user.id)
+        fingerprint = hashlib.md5(
+            f'{self.list_cache_prefix}:{version}:{request.accepted_renderer.format}:{request.build_absolute_uri()}'.encode()
+        ).hexdigest()
+        etag = f'"{fingerprint}"'
+
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = f'reminders:{self.list_cache_prefix}:{request.user.id}:{fingerprint}'
+            data = cache.get(key)
+            if data is None:
+                data = super().list(request, *args, **kwargs).data
+                cache.set(key, data, timeout=settings.LIST_CACHE_TIMEOUT)
+            response = Response(data)
+
+        response['ETag'] = etag
+        # Clients have to revalidate, and responses differ between users
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
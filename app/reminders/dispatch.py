@@ -0,0 +1,263 @@
+""" Set-based dispatch engine putting reminder emails into the outbox """
+import calendar
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from zoneinfo import ZoneInfo
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, CharField, DateField, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from core.dates import local_dates_range
+from core.models import NOTIFICATION_STAGES, Reminder, next_notification_date
+from core.outbox import enqueue
+from reminders.cache import batched_list_bumps, bump_list_versions
+from reminders.emails import render_digest_email, render_reminder_email, reminder_row
+
+logger = logging.getLogger(__name__)
+
+# Reminders are streamed from the database and written back in chunks of this size
+CHUNK_SIZE = 2000
+
+# Reminders further than this many days from happening are not due for any stage
+DISPATCH_WINDOW_DAYS = 30
+
+# Number of days before the reminder date the window of the stage following the given one opens
+NEXT_STAGE_OPENS = {stage: opens for (stage, _, _), (_, opens, _) in zip(NOTIFICATION_STAGES, NOTIFICATION_STAGES[1:])}
+
+
+def stage_expression(today):
+    """ Return an SQL expression computing the sent_check stage a reminder should be at today """
+    return Case(
+        When(reminder_date=today, then=Value('today')),
+        When(reminder_date=today + timedelta(days=1), then=Value('one_day')),
+        When(reminder_date__lte=today + timedelta(days=3), then=Value('three_days')),
+        When(reminder_date__lte=today + timedelta(days=7), then=Value('week')),
+        default=Value('month'),
+        output_field=CharField(),
+    )
+
+
+def due_reminders(today, queryset=None):
+    """ Return reminders whose target stage email hasn't been sent yet, annotated with target_check """
+    if queryset is None:
+        queryset = Reminder.objects.all()
+
+    return (
+        queryset
+        .filter(next_notification_at__lte=today)
+        .filter(reminder_date__gte=today, reminder_date__lte=today + timedelta(days=DISPATCH_WINDOW_DAYS))
+        .annotate(target_check=stage_expression(today))
+        .exclude(sent_check=F('target_check'))
+        .select_related('user')
+    )
+
+
+def due_somewhere(now=None):
+    """
+    Return whether reminders may be due on the current local date of some timezone.
+    Dates of all timezones are checked at once, at the cost of counting reminders due in a zone where the day hasn't started yet.
+    """
+    earliest_today, latest_today = local_dates_range(now)
+    return Reminder.objects.filter(next_notification_at__lte=latest_today, reminder_date__gte=earliest_today).exists()
+
+
+def dispatch_passes(today, queryset=None):
+    """
+    Return due reminders sent one by one, and due reminders of users in digest mode ordered by user.
+    Only the second pass is sorted, the first one keeps reading rows in the order of the dispatch index.
+    """
+    due = due_reminders(today, queryset)
+    return due.filter(user__digest_emails=False), due.filter(user__digest_emails=True).order_by('user_id', 'id')
+
+
+def next_year_date(reminder_date):
+    """ Return the date of a permanent reminder in the next year, February 29 falls on February 28 outside leap years """
+    year = reminder_date.year + 1
+    if (reminder_date.month, reminder_date.day) == (2, 29) and not calendar.isleap(year):
+        return date(year, 2, 28)
+    return date(year, reminder_date.month, reminder_date.day)
+
+
+def apply_transitions(reminders, today):
+    """ Write back stage transitions of reminders whose emails have been enqueued """
+    stages = defaultdict(list)
+    rollovers = []
+    finished = []
+
+    for reminder in reminders:
+        if reminder.target_check != 'today':
+            stages[reminder.target_check].append(reminder.id)
+            continue
+
+        if not reminder.permanent:
+            finished.append(reminder.id)
+            continue
+
+        reminder.reminder_date = next_year_date(reminder.reminder_date)
+        reminder.sent_check = 'None'
+        reminder.next_notification_at = next_notification_date(reminder.reminder_date, reminder.sent_check, today)
+        reminder.updated_at = today
+        rollovers.append(reminder)
+
+    with transaction.atomic(), batched_list_bumps():
+        # A single UPDATE per stage, no matter how many reminders have reached it
+        for stage, ids in stages.items():
+            next_notification_at = ExpressionWrapper(
+                F('reminder_date') - timedelta(days=NEXT_STAGE_OPENS[stage]),
+                output_field=DateField()
+            )
+            Reminder.objects.filter(id__in=ids).update(sent_check=stage, next_notification_at=next_notification_at, updated_at=today)
+
+        if rollovers:
+            Reminder.objects.bulk_update(rollovers, ['reminder_date', 'sent_check', 'next_notification_at', 'updated_at'])
+            # Dates of rolled over reminders have changed, but bulk_update() doesn't send signals
+            bump_list_versions(reminder.user_id for reminder in rollovers)
+
+        if finished:
+            Reminder.objects.filter(id__in=finished).delete()
+
+
+def chunked(iterable, size):
+    """ Yield lists of at most size items from the iterable """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def email_groups(reminders):
+    """ Yield lists of reminders sent in one email, all due reminders of a user in digest mode, otherwise one by one """
+    digests = defaultdict(list)
+    for reminder in reminders:
+        if reminder.user.digest_emails:
+            digests[reminder.user_id].append(reminder)
+        else:
+            yield [reminder]
+    yield from digests.values()
+
+
+def render_group(reminders, today):
+    """ Return the email of a group of reminders """
+    if len(reminders) == 1:
+        reminder = reminders[0]
+        return render_reminder_email(reminder_row(reminder), (reminder.reminder_date - today).days)
+    return render_digest_email([reminder_row(reminder) for reminder in reminders], today)
+
+
+def enqueue_chunk(reminders, today):
+    """ Put emails of a chunk of reminders into the outbox and return the reminders which have been enqueued """
+    messages = []
+    enqueued = []
+    for group in email_groups(reminders):
+        try:
+            messages.append(render_group(group, today))
+            # Every reminder of a digest moves to its own stage, just like when it is sent alone
+            enqueued.extend(group)
+        except Exception:
+            # Reminders of the group stay due, so they are retried on the next run
+            logger.exception('Rendering the email of reminders %s failed.', [reminder.id for reminder in group])
+
+    enqueue(messages)
+    return enqueued
+
+
+def expire_notifications(today, queryset=None):
+    """ Clear notifications of reminders which have passed without being dispatched """
+    if queryset is None:
+        queryset = Reminder.objects.all()
+    queryset.filter(next_notification_at__lt=today, reminder_date__lt=today).update(next_notification_at=None)
+
+
+def shard_reminders(shard, shards, queryset=None, key='id'):
+    """ Return reminders belonging to one of the shards, split by id, or by user_id to keep digests in one shard """
+    if queryset is None:
+        queryset = Reminder.objects.all()
+    return queryset.annotate(shard=Mod(key, shards)).filter(shard=shard)
+
+
+def claim_chunk(today, shard, shards, chunk_size, skipped_ids=(), digests=False, queryset=None):
+    """ Lock and return due reminders of the shard, skipping rows already claimed by other workers """
+    singles, digest_reminders = dispatch_passes(today, queryset)
+    if digests:
+        queryset = shard_reminders(shard, shards, digest_reminders, key='user_id')
+    else:
+        queryset = shard_reminders(shard, shards, singles)
+    claimed = queryset.exclude(id__in=skipped_ids).select_for_update(skip_locked=True, of=('self',))
+    chunk = list(claimed[:chunk_size])
+
+    # The last digest of a full chunk may continue past the limit, the rest of it is claimed as well
+    if digests and len(chunk) == chunk_size:
+        last = chunk[-1]
+        chunk.extend(claimed.filter(user_id=last.user_id, id__gt=last.id))
+    return chunk
+
+
+def dispatch_shard(shard, shards, today=None, chunk_size=CHUNK_SIZE, queryset=None):
+    """ Drain due reminders of one shard and return the number of enqueued emails """
+    today = today or date.today()
+    expire_notifications(today, queryset)
+    failed_ids = []
+    enqueued_count = 0
+
+    for digests in [False, True]:
+        while True:
+            # Reminders stay locked until their transitions are committed, so no other worker enqueues them again
+            with transaction.atomic():
+                chunk = claim_chunk(today, shard, shards, chunk_size, failed_ids, digests, queryset)
+                if not chunk:
+                    break
+                enqueued = enqueue_chunk(chunk, today)
+                apply_transitions(enqueued, today)
+
+            enqueued_ids = {reminder.id for reminder in enqueued}
+            failed_ids.extend(reminder.id for reminder in chunk if reminder.id not in enqueued_ids)
+            enqueued_count += len(enqueued)
+
+    return enqueued_count
+
+
+def dispatch(today=None, queryset=None, chunk_size=CHUNK_SIZE):
+    """
+    Enqueue emails for all due reminders and return the number of enqueued emails.
+    Reminders are claimed like a single shard, so a run overlapping with sharded workers or another scheduler doesn't repeat them.
+    """
+    return dispatch_shard(0, 1, today, chunk_size, queryset)
+
+
+def local_buckets(now=None):
+    """
+    Return hourly buckets of users' timezones at the instant, as (local date, local hour, timezones).
+    Timezones at the same local date and hour share a bucket, so there are at most a few dozen of them.
+    """
+    now = now or timezone.now()
+    buckets = defaultdict(list)
+    timezones = get_user_model().objects.order_by().values_list('timezone', flat=True).distinct()
+    for name in timezones:
+        local = now.astimezone(ZoneInfo(name))
+        buckets[(local.date(), local.hour)].append(name)
+    return [(today, hour, names) for (today, hour), names in sorted(buckets.items())]
+
+
+def bucket_reminders(timezones, hour):
+    """
+    Return reminders of users in the timezones whose send hour has come.
+    Hours which have already passed are included, so a missed tick is caught up, while reminders dispatched before aren't due anymore.
+    """
+    return Reminder.objects.filter(user__timezone__in=timezones, user__send_hour__lte=hour)
+
+
+def dispatch_buckets(now=None, shard=0, shards=1, chunk_size=CHUNK_SIZE):
+    """ Enqueue emails of reminders due in the current local hour of their users and return the number of enqueued emails """
+    enqueued_count = 0
+    for today, hour, timezones in local_buckets(now):
+        queryset = bucket_reminders(timezones, hour)
+        enqueued_count += dispatch_shard(shard, shards, today, chunk_size, queryset)
+    return enqueued_count
@@ -1,4 +1,14 @@
-from django.core.mail import EmailMessage
+""" Rendering of reminder emails from precompiled templates """
+from collections import namedtuple
+from functools import lru_cache
+
+from django.core.mail import EmailMultiAlternatives
+from django.template import Context, engines
+
+FROM_EMAIL = 'Emailnder'
+
+# Plain row of everything a reminder email shows, e.g. straight from values_list()
+ReminderRow = namedtuple('ReminderRow', ['title', 'description', 'reminder_date', 'permanent', 'user_name', 'user_email'])
 
 
 def how_many_days_to_reminder_string(days_until_reminder):
@@ -10,19 +20,59 @@ def how_many_days_to_reminder_string(days_until_reminder):
         return f"in {days_until_reminder} days"
 
 
-def generate_reminder_email(reminder, days_until_reminder):
-    days_information = how_many_days_to_reminder_string(days_until_reminder)
-    message_title = f"{reminder.title} happens {days_information}"
+@lru_cache(maxsize=None)
+def compiled_templates(name='reminder'):
+    """ Return text and HTML templates of the email, compiled once per process """
+    engine = engines['django'].engine
+    return engine.get_template(f'reminders/email/{name}.txt'), engine.get_template(f'reminders/email/{name}.html')
+
+
+def reminder_row(reminder):
+    """ Return the row of a reminder instance with its user """
+    return ReminderRow(reminder.title, reminder.description, reminder.reminder_date, reminder.permanent, reminder.user.name, reminder.user.email)
+
 
-    message_body = f"""
-Hi {reminder.user.name}!
-We wanted to remind you, that {reminder.title} happens {days_information}, on {reminder.reminder_date}.
+def render_reminder_email(row, days_until_reminder, context=None):
+    """ Return the multipart email of a reminder row """
+    text_template, html_template = compiled_templates()
+    context = context if context is not None else Context()
+    title, description, reminder_date, permanent, user_name, user_email = row
+    days = how_many_days_to_reminder_string(days_until_reminder)
 
-"""
-    if reminder.description:
-        message_body = message_body + '\n' + 'Reminder description' + '\n' + reminder.description + '\n'
+    with context.push(title=title, description=description, reminder_date=reminder_date.isoformat(), permanent=permanent, user_name=user_name, days=days):
+        message = EmailMultiAlternatives(f'{title} happens {days}', text_template.render(context), from_email=FROM_EMAIL, to=[user_email])
+        message.attach_alternative(html_template.render(context), 'text/html')
+    return message
 
-    if reminder.permanent is False:
-        message_body = message_body + '\n' + 'Important Note: This reminder is not permanent and will be deleted after the date of the reminder.'
 
-    return EmailMessage(message_title, message_body, from_email='Emailnder', to=[reminder.user.email])
+def render_digest_email(rows, today, context=None):
+    """ Return a single multipart email of all reminder rows of one user """
+    text_template, html_template = compiled_templates('digest')
+    context = context if context is not None else Context()
+    rows = [ReminderRow(*row) for row in rows]
+    reminders = [
+        {
+            'title': row.title, 'description': row.description, 'reminder_date': row.reminder_date.isoformat(),
+            'permanent': row.permanent, 'days': how_many_days_to_reminder_string((row.reminder_date - today).days),
+        }
+        for row in rows
+    ]
+
+    with context.push(user_name=rows[0].user_name, reminders=reminders):
+        message = EmailMultiAlternatives(
+            f'You have {len(rows)} upcoming reminders', text_template.render(context), from_email=FROM_EMAIL, to=[rows[0].user_email]
+        )
+        message.attach_alternative(html_template.render(context), 'text/html')
+    return message
+
+
+def render_reminder_emails(rows, today):
+    """ Yield emails of reminder rows, rendered with one reusable template context """
+    context = Context()
+    for row in rows:
+        yield render_reminder_email(row, (ReminderRow(*row).reminder_date - today).days, context)
+
+
+def generate_reminder_email(reminder, days_until_reminder):
+    """ Return the email of a reminder instance """
+    return render_reminder_email(reminder_row(reminder), days_until_reminder)
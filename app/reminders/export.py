@@ -0,0 +1,62 @@
+""" Streaming export of reminders """
+import csv
+import json
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from core.models import Tag
+from reminders.dispatch import chunked
+
+# Number of reminders fetched from the database cursor at once
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FIELDS = ['id', 'title', 'description', 'reminder_date', 'permanent', 'tags']
+# Separator of tag names in a single CSV column
+CSV_TAGS_SEPARATOR = ';'
+
+
+def export_rows(queryset, chunk_size=None):
+    """ Yield reminders of the queryset as dicts, holding only one chunk of reminders in memory """
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    reminders = queryset.only('id', 'title', 'description', 'reminder_date', 'permanent').iterator(chunk_size=chunk_size)
+
+    for chunk in chunked(reminders, chunk_size):
+        # iterator() skips prefetch_related(), so tags are fetched with one query per chunk
+        prefetch_related_objects(chunk, Prefetch('tags', queryset=Tag.objects.only('id', 'name').order_by('name')))
+        for reminder in chunk:
+            yield {
+                'id': reminder.id,
+                'title': reminder.title,
+                'description': reminder.description,
+                'reminder_date': reminder.reminder_date.isoformat(),
+                'permanent': reminder.permanent,
+                'tags': [tag.name for tag in reminder.tags.all()],
+            }
+
+
+def ndjson_lines(rows):
+    """ Yield rows as newline delimited JSON """
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+class Echo:
+    """ File-like object returning what is written, so csv.writer can format single lines """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """ Yield rows as CSV lines preceded by a header """
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        row['tags'] = CSV_TAGS_SEPARATOR.join(row['tags'])
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+# Content type and line generator by output format
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+    'csv': ('text/csv', csv_lines),
+}
@@ -0,0 +1,118 @@
+""" Streaming import of reminders from CSV and iCalendar files """
+import csv
+import io
+import re
+from datetime import datetime
+
+from django.db import transaction
+
+from reminders.dispatch import chunked
+from reminders.export import CSV_TAGS_SEPARATOR
+from reminders.serializers import ReminderDetailSerializer
+
+# Number of rows validated and inserted in one transaction
+IMPORT_BATCH_SIZE = 1000
+# Errors reported in detail, the rest of failed rows is only counted
+IMPORT_MAX_ERRORS = 1000
+
+
+def text_lines(file, encoding='utf-8-sig'):
+    """ Wrap a binary file, e.g. an upload, to read it line by line as text """
+    return io.TextIOWrapper(file, encoding=encoding, newline='')
+
+
+def csv_rows(lines):
+    """ Yield line numbers and reminder data of CSV rows with a header, e.g. produced by the export """
+    reader = csv.DictReader(lines)
+    for row in reader:
+        data = {key: value for key, value in row.items() if key in ('title', 'description', 'reminder_date', 'permanent') and value != ''}
+        tags = (row.get('tags') or '').split(CSV_TAGS_SEPARATOR)
+        data['tags'] = [{'name': name} for name in tags if name.strip()]
+        yield reader.line_num, data
+
+
+def unfolded_lines(lines):
+    """ Yield line numbers and logical lines of an iCalendar file, joining folded continuation lines """
+    current, current_number = None, 0
+    for number, line in enumerate(lines, start=1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current_number, current
+        current, current_number = line, number
+    if current is not None:
+        yield current_number, current
+
+
+def ics_text(value):
+    """ Unescape an iCalendar text value """
+    return value.replace('\\n', '\n').replace('\\N', '\n').replace('\\,', ',').replace('\\;', ';').replace('\\\\', '\\')
+
+
+def ics_date(value):
+    """ Return the date of a DATE or DATE-TIME value in ISO format """
+    return datetime.strptime(value[:8], '%Y%m%d').date().isoformat()
+
+
+def ics_rows(lines):
+    """ Yield line numbers and reminder data of VEVENT components, one event held in memory at a time """
+    event = None
+    for number, line in unfolded_lines(lines):
+        name, _, value = line.partition(':')
+        # Parameters like VALUE=DATE are not needed to read the values
+        name = name.split(';')[0].upper()
+
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event, event_number = {'tags': []}, number
+        elif event is None:
+            continue
+        elif name == 'END' and value.upper() == 'VEVENT':
+            yield event_number, event
+            event = None
+        elif name == 'SUMMARY':
+            event['title'] = ics_text(value)
+        elif name == 'DESCRIPTION':
+            event['description'] = ics_text(value)
+        elif name == 'DTSTART':
+            try:
+                event['reminder_date'] = ics_date(value)
+            except ValueError:
+                event['reminder_date'] = value
+        elif name == 'RRULE':
+            # Yearly events are the permanent reminders
+            event['permanent'] = 'FREQ=YEARLY' in value.upper()
+        elif name == 'CATEGORIES':
+            event['tags'] += [{'name': ics_text(category)} for category in re.split(r'(?<!\\),', value) if category.strip()]
+
+
+# Row parser by file format
+IMPORT_FORMATS = {
+    'csv': csv_rows,
+    'ics': ics_rows,
+}
+
+
+def import_reminders(user, rows, batch_size=None):
+    """
+    Validate and insert rows given as (line number, data) pairs in batches, each batch in its own transaction.
+    Return the number of created reminders, the number of failed rows and errors by line number.
+    """
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    report = {'created': 0, 'failed': 0, 'errors': []}
+
+    for batch in chunked(rows, batch_size):
+        serializer = ReminderDetailSerializer(many=True)
+        valid, errors = serializer.partition([data for _, data in batch])
+
+        with transaction.atomic():
+            serializer.create([{**data, 'user': user} for data in valid.values()])
+
+        report['created'] += len(valid)
+        report['failed'] += len(errors)
+        for index, error in errors.items():
+            if len(report['errors']) < IMPORT_MAX_ERRORS:
+                report['errors'].append({'line': batch[index][0], 'errors': error})
+
+    return report
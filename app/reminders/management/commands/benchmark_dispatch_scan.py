@@ -0,0 +1,87 @@
+""" Django command to benchmark the reminder scans against a large seeded table """
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.dates import local_dates_range
+from core.models import Reminder, next_notification_date
+from reminders.dispatch import due_reminders
+
+
+# Every this many seeded reminders is a leftover from the last days, past reminders are otherwise deleted or rolled over daily
+LEFTOVER_EVERY = 1000
+
+
+class Rollback(Exception):
+    """ Raised to roll the seeded rows back """
+
+
+def seeded_date(number, today):
+    """ Return the date of a seeded reminder, upcoming within two years, or a few days in the past for leftovers """
+    if number % LEFTOVER_EVERY == 0:
+        return today - timedelta(days=number // LEFTOVER_EVERY % 7 + 2)
+    return today + timedelta(days=number % 730 + 1)
+
+
+class Command(BaseCommand):
+    """ Django command seeding reminders and checking the dispatch scans use their indexes """
+
+    def add_arguments(self, parser):
+        """ Add number of seeded rows """
+        parser.add_argument('--rows', type=int, default=1_000_000, help="Number of reminders to seed.")
+        parser.add_argument('--batch-size', type=int, default=10_000, help="Number of reminders inserted at once.")
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command """
+        try:
+            with transaction.atomic():
+                self.run_benchmark(options['rows'], options['batch_size'])
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Seeded reminders have been rolled back.')
+
+    def run_benchmark(self, rows, batch_size):
+        """ Seed reminders, time the scans and check their query plans """
+        today = date.today()
+        user = get_user_model().objects.create_user(email='benchmark@example.com', name='Benchmark User')
+
+        started = time.perf_counter()
+        for offset in range(0, rows, batch_size):
+            reminder_dates = [(number, seeded_date(number, today)) for number in range(offset, min(offset + batch_size, rows))]
+            Reminder.objects.bulk_create([
+                Reminder(
+                    user=user,
+                    title=f'Reminder {number}',
+                    reminder_date=reminder_date,
+                    permanent=bool(number % 2),
+                    next_notification_at=next_notification_date(reminder_date, 'None', today),
+                )
+                for number, reminder_date in reminder_dates
+            ], batch_size=batch_size)
+        self.stdout.write(f'Seeded {rows} reminders in {time.perf_counter() - started:.1f}s.')
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {Reminder._meta.db_table}')
+
+        # Statistics are fresh, so the planner picks a scan on its own, like it does for the real queries
+        earliest_today, _ = local_dates_range()
+        scans = [
+            ('dispatch scan', due_reminders(today), 'reminder_next_notification_idx'),
+            ('past reminders clean up', Reminder.objects.filter(reminder_date__lt=earliest_today, permanent=False), 'reminder_expiring_idx'),
+            ('reminders list page', Reminder.objects.filter(user=user).order_by('-reminder_date', '-id')[:settings.API_PAGE_SIZE], 'reminder_user_date_id_idx'),
+        ]
+
+        for name, queryset, index_name in scans:
+            started = time.perf_counter()
+            count = sum(1 for _ in queryset.values_list('id', flat=True).iterator(chunk_size=10_000))
+            elapsed = time.perf_counter() - started
+
+            plan = queryset.explain()
+            if index_name not in plan:
+                raise CommandError(f'The {name} does not use {index_name}:\n{plan}')
+            self.stdout.write(self.style.SUCCESS(f'The {name} read {count} rows in {elapsed:.3f}s using {index_name}.'))
@@ -0,0 +1,38 @@
+""" Django command to benchmark rendering of reminder emails """
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from reminders.emails import ReminderRow, compiled_templates, render_reminder_emails
+
+
+class Command(BaseCommand):
+    """ Django command rendering emails of generated reminder rows """
+
+    def add_arguments(self, parser):
+        """ Add number of rendered messages """
+        parser.add_argument('--messages', type=int, default=100_000, help="Number of rendered messages.")
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command """
+        count = options['messages']
+        today = date.today()
+        rows = [
+            ReminderRow(
+                f'Reminder {number}', 'Description <with> markup & more' if number % 2 else '',
+                today + timedelta(days=number % 31), bool(number % 3), f'User {number}', f'user{number}@example.com'
+            )
+            for number in range(count)
+        ]
+
+        started = time.perf_counter()
+        compiled_templates()
+        compiled = time.perf_counter() - started
+
+        started = time.perf_counter()
+        rendered = sum(1 for _ in render_reminder_emails(rows, today))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'Templates compiled in {compiled * 1000:.1f}ms.')
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} multipart messages in {elapsed:.2f}s, {rendered / elapsed:,.0f} messages/s.'))
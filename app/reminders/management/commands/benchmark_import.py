@@ -0,0 +1,74 @@
+""" Django command to benchmark the throughput of importing reminders from a large file """
+import csv
+import tempfile
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reminders.export import EXPORT_FIELDS
+from reminders.importer import IMPORT_BATCH_SIZE, IMPORT_FORMATS, import_reminders
+
+
+class Rollback(Exception):
+    """ Raised to roll the imported rows back """
+
+
+def write_csv(file, rows, today):
+    """ Write rows in the format of the CSV export """
+    writer = csv.writer(file)
+    writer.writerow(EXPORT_FIELDS)
+    for number in range(rows):
+        reminder_date = today + timedelta(days=1 + number % 365)
+        writer.writerow([number, f'Reminder {number}', 'Imported reminder.', reminder_date.isoformat(), number % 2 == 0, 'Imported;Benchmark'])
+
+
+def write_ics(file, rows, today):
+    """ Write rows as iCalendar events """
+    file.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\n')
+    for number in range(rows):
+        reminder_date = today + timedelta(days=1 + number % 365)
+        rrule = 'RRULE:FREQ=YEARLY\r\n' if number % 2 == 0 else ''
+        file.write(
+            f'BEGIN:VEVENT\r\nSUMMARY:Reminder {number}\r\nDESCRIPTION:Imported reminder.\r\n'
+            f'DTSTART;VALUE=DATE:{reminder_date:%Y%m%d}\r\n{rrule}CATEGORIES:Imported,Benchmark\r\nEND:VEVENT\r\n'
+        )
+    file.write('END:VCALENDAR\r\n')
+
+
+WRITERS = {'csv': write_csv, 'ics': write_ics}
+
+
+class Command(BaseCommand):
+    """ Django command generating a file and timing its import """
+
+    def add_arguments(self, parser):
+        """ Add number of rows, file format and batch size """
+        parser.add_argument('--rows', type=int, default=1_000_000, help="Number of rows in the generated file.")
+        parser.add_argument('--format', choices=list(IMPORT_FORMATS), default='csv', help="Format of the generated file.")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help="Number of rows inserted in one transaction.")
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command """
+        rows, file_format = options['rows'], options['format']
+
+        with tempfile.NamedTemporaryFile('w+', encoding='utf-8', newline='', suffix=f'.{file_format}') as file:
+            WRITERS[file_format](file, rows, date.today())
+            file.seek(0)
+
+            try:
+                with transaction.atomic():
+                    user = get_user_model().objects.create_user(email='benchmark@example.com', name='Benchmark User')
+                    started = time.perf_counter()
+                    report = import_reminders(user, IMPORT_FORMATS[file_format](file), options['batch_size'])
+                    elapsed = time.perf_counter() - started
+                    raise Rollback
+            except Rollback:
+                pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['created']} of {rows} rows in {elapsed:.1f}s, {report['created'] / elapsed:.0f} rows/s."
+        ))
+        self.stdout.write('Imported reminders have been rolled back.')
@@ -0,0 +1,40 @@
+""" Django command to import reminders of a user from a CSV or iCalendar file """
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from reminders.importer import IMPORT_BATCH_SIZE, IMPORT_FORMATS, import_reminders
+
+
+class Command(BaseCommand):
+    """ Django command streaming reminders from a file into the database in batches """
+
+    def add_arguments(self, parser):
+        """ Add the owner, the file and its format """
+        parser.add_argument('email', help="Email of the user owning imported reminders.")
+        parser.add_argument('path', help="Path of the CSV or iCalendar file.")
+        parser.add_argument('--format', choices=list(IMPORT_FORMATS), help="Format of the file, by default taken from its extension.")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help="Number of rows inserted in one transaction.")
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command """
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['email']} does not exist.")
+
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in IMPORT_FORMATS:
+            raise CommandError(f'Unknown format of {path}, use --format.')
+
+        # Dates are validated against the local date of the user, like in the API
+        with path.open(encoding='utf-8-sig', newline='') as lines, timezone.override(ZoneInfo(user.timezone)):
+            report = import_reminders(user, IMPORT_FORMATS[file_format](lines), options['batch_size'])
+
+        for error in report['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(f"{report['created']} reminders have been imported, {report['failed']} rows failed."))
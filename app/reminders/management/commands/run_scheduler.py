@@ -0,0 +1,41 @@
+""" Django command to run reminder jobs in the elected scheduler leader """
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reminders import scheduler
+
+
+class Command(BaseCommand):
+    """ Django command running the reminder scheduler once it becomes the leader """
+
+    def add_arguments(self, parser):
+        """ Add interval of checking the leadership """
+        parser.add_argument('--poll-interval', type=int, default=30, help="Seconds between leadership checks.")
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command """
+        poll_interval = options['poll_interval']
+
+        self.stdout.write('Waiting for scheduler leadership...')
+        while not scheduler.acquire_leadership():
+            time.sleep(poll_interval)
+        self.stdout.write(self.style.SUCCESS('Scheduler leadership acquired, starting jobs.'))
+
+        jobs = scheduler.create_scheduler()
+        waker = scheduler.create_waker()
+        jobs.start()
+        waker.start()
+        try:
+            while scheduler.holds_leadership():
+                # A leader whose waker has died would hold the lock without ever dispatching reminders
+                if not waker.is_alive():
+                    raise CommandError('Reminder waker has stopped, scheduler leadership has been given up.')
+                time.sleep(poll_interval)
+        finally:
+            waker.stop()
+            jobs.shutdown(wait=False)
+            scheduler.release_leadership()
+
+        # Exit, so the process supervisor restarts the command as a standby
+        raise CommandError('Scheduler leadership has been lost.')
@@ -0,0 +1,48 @@
+""" Django command to enqueue reminders due in the current local hour from parallel shards """
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from reminders.dispatch import dispatch_buckets
+
+
+def run_shard(shard, shards):
+    """ Dispatch a shard in a worker process and return the number of enqueued emails """
+    try:
+        return dispatch_buckets(shard=shard, shards=shards)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    """ Django command sending due reminders split into shards """
+
+    def add_arguments(self, parser):
+        """ Add number of workers and the shard to process """
+        parser.add_argument('--workers', type=int, default=1, help="Number of shards the due reminders are split into.")
+        parser.add_argument('--shard', type=int, help="Process only this shard, e.g. when shards are spread across hosts.")
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command """
+        workers = options['workers']
+        shard = options['shard']
+
+        if workers < 1:
+            raise CommandError('--workers needs to be at least 1.')
+        if shard is not None and not 0 <= shard < workers:
+            raise CommandError(f'--shard needs to be between 0 and {workers - 1}.')
+
+        if shard is not None:
+            enqueued_count = dispatch_buckets(shard=shard, shards=workers)
+        elif workers == 1:
+            enqueued_count = dispatch_buckets(shard=0, shards=1)
+        else:
+            # Forked workers can't share the parent's database connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                enqueued_count = sum(executor.map(run_shard, range(workers), [workers] * workers))
+
+        self.stdout.write(self.style.SUCCESS(f'{enqueued_count} reminders have been queued for delivery.'))
@@ -0,0 +1,138 @@
+""" Keyset (cursor) pagination for the reminders API """
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate by the values of the last row instead of an OFFSET, so deep pages cost as much as the first one.
+    The last ordering field has to be unique, which makes the order stable between requests.
+    """
+    ordering = ('-id',)
+    page_size = settings.API_PAGE_SIZE
+    max_page_size = settings.API_MAX_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """ Return the page of rows after (or before) the cursor """
+        self.request = request
+        self.model = queryset.model
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        backwards = bool(cursor and cursor['backwards'])
+
+        ordering = [self.reverse_field(field) for field in self.ordering] if backwards else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if cursor:
+            queryset = queryset.filter(self.after_position(ordering, cursor['position']))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        if backwards:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.first_position = self.position(rows[0]) if rows else None
+        self.last_position = self.position(rows[-1]) if rows else None
+        return rows
+
+    def get_paginated_response(self, data):
+        """ Return the page with links to the neighbouring pages """
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        """ Return the page size requested by the client, capped at max_page_size """
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self.encode_cursor(self.last_position, backwards=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first_position is None:
+            # Going back from an empty page starts from the beginning
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.first_position, backwards=True)
+
+    @staticmethod
+    def reverse_field(field):
+        """ Return the ordering field with the opposite direction """
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def position(self, obj):
+        """ Return values of ordering fields of the object as strings """
+        return [self.model._meta.get_field(field.lstrip('-')).value_to_string(obj) for field in self.ordering]
+
+    def after_position(self, ordering, position):
+        """ Return the filter of rows placed after the position in the given ordering """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        # The OR above can't bound an index scan, the inclusive bound of the leading field starts the index range at the cursor
+        leading = ordering[0]
+        bound = Q(**{f"{leading.lstrip('-')}__{'lte' if leading.startswith('-') else 'gte'}": position[0]})
+        return bound & condition
+
+    def encode_cursor(self, position, backwards):
+        """ Return the URL of the page after the position """
+        cursor = json.dumps({'p': position, 'b': backwards}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(cursor.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        """ Return the position and direction of the cursor from the request """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            position = [
+                self.model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, cursor['p'], strict=True)
+            ]
+            return {'position': position, 'backwards': bool(cursor['b'])}
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class ReminderPagination(KeysetPagination):
+    """ Pagination of reminders from the latest date """
+    ordering = ('-reminder_date', '-id')
+
+
+class TagPagination(KeysetPagination):
+    """ Pagination of tags in reverse alphabetical order """
+    ordering = ('-name', '-id')
@@ -0,0 +1,80 @@
+""" Scheduling of reminder jobs in a single elected leader process """
+from functools import partial
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from django.db import DatabaseError, close_old_connections, connection
+
+from core import outbox
+from reminders import manage_reminders
+from reminders.wakeups import DispatchWaker
+from users import tokens
+
+# Key of the Postgres advisory lock held by the scheduler leader for as long as its connection lives
+SCHEDULER_LOCK_ID = 8_031_207
+
+
+def acquire_leadership():
+    """ Try to become the scheduler leader, return whether the lock has been taken """
+    if connection.vendor != 'postgresql':
+        # Other databases are only used for development with a single process
+        return True
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [SCHEDULER_LOCK_ID])
+        return cursor.fetchone()[0]
+
+
+def holds_leadership():
+    """ Check if the current process still holds the scheduler lock """
+    if connection.vendor != 'postgresql':
+        return True
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND classid = 0 AND objid = %s "
+                "AND objsubid = 1 AND granted AND pid = pg_backend_pid())",
+                [SCHEDULER_LOCK_ID]
+            )
+            return cursor.fetchone()[0]
+    except DatabaseError:
+        # The lock is gone together with a broken connection
+        return False
+
+
+def release_leadership():
+    """ Give up the scheduler lock, so a standby process takes over """
+    if connection.vendor != 'postgresql':
+        return
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [SCHEDULER_LOCK_ID])
+    except DatabaseError:
+        # The lock is gone together with a broken connection
+        pass
+
+
+def run_job(job):
+    """ Run a job with fresh database connections of the scheduler thread """
+    close_old_connections()
+    try:
+        job()
+    finally:
+        close_old_connections()
+
+
+def create_scheduler():
+    """ Create and return a background scheduler with periodic jobs, reminder emails are sent by the waker """
+    scheduler = BackgroundScheduler(job_defaults={'max_instances': 1, 'coalesce': True})
+    scheduler.add_job(run_job, 'interval', days=1, args=[manage_reminders.delete_past_reminders])
+    scheduler.add_job(run_job, 'interval', minutes=1, args=[outbox.deliver_outbox])
+    scheduler.add_job(run_job, 'interval', days=1, args=[outbox.purge_sent])
+    scheduler.add_job(run_job, 'interval', hours=1, args=[tokens.purge_expired_tokens])
+    return scheduler
+
+
+def create_waker():
+    """ Create and return the thread sending reminder emails as soon as they become due """
+    return DispatchWaker(partial(run_job, manage_reminders.send_emails))
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from core.models import Reminder, Tag
+from reminders.cache import bump_list_versions
+from reminders.wakeups import publish
 
 
 # From Django documentation:
@@ -7,6 +9,96 @@ from core.models import Reminder, Tag
 #  If you want to support writable nested relationships you'll need to write an explicit `.create()` method.
 
 
+def normalize_tag_name(name):
+    """ Collapse whitespaces and capitalize words of a tag name """
+    return ' '.join(name.split()).title()
+
+
+def resolve_tags(user, names):
+    """ Return a dict of user's tags by normalized name, creating the missing ones in one query """
+    names = {normalize_tag_name(name) for name in names}
+    if not names:
+        return {}
+
+    tags = {tag.name: tag for tag in Tag.objects.filter(user=user, name__in=names)}
+    missing = [Tag(user=user, name=name) for name in names if name not in tags]
+    tags.update((tag.name, tag) for tag in Tag.objects.bulk_create(missing))
+    return tags
+
+
+def set_reminders_tags(reminders, tags_per_reminder, user, created=False):
+    """ Replace tags of reminders with a single delete and a single insert into the through table, just created reminders have none to delete """
+    tags = resolve_tags(user, [tag['name'] for reminder_tags in tags_per_reminder for tag in reminder_tags])
+    through = Reminder.tags.through
+
+    if not created:
+        through.objects.filter(reminder_id__in=[reminder.id for reminder in reminders]).delete()
+    through.objects.bulk_create([
+        through(reminder_id=reminder.id, tag_id=tags[name].id)
+        for reminder, reminder_tags in zip(reminders, tags_per_reminder)
+        for name in {normalize_tag_name(tag['name']) for tag in reminder_tags}
+    ])
+
+
+class ReminderListSerializer(serializers.ListSerializer):
+    """ List serializer creating and updating Reminders in bulk """
+
+    def partition(self, items):
+        """ Validate items one by one, return validated data of valid ones and errors of the others by index """
+        valid = {}
+        errors = {}
+        for index, item in enumerate(items):
+            try:
+                valid[index] = self.child.run_validation(item)
+            except serializers.ValidationError as error:
+                errors[index] = error.detail
+        return valid, errors
+
+    def create(self, validated_data):
+        """ Create Reminders with a constant number of queries """
+        tags_per_reminder = [item.pop('tags', []) for item in validated_data]
+        reminders = [Reminder(**item) for item in validated_data]
+        if reminders:
+            # Reminders of one bulk request always belong to the same user, who is already loaded
+            today = reminders[0].user.local_today()
+        for reminder in reminders:
+            reminder.update_next_notification(today)
+
+        Reminder.objects.bulk_create(reminders)
+        if reminders:
+            # Reminders of one bulk request always belong to the same user
+            set_reminders_tags(reminders, tags_per_reminder, reminders[0].user, created=True)
+            # bulk_create() doesn't send signals
+            bump_list_versions([reminders[0].user_id])
+            publish(reminder.next_notification_at for reminder in reminders)
+        return reminders
+
+    def update(self, instances, validated_data):
+        """ Update Reminders, given as a list matching validated data, with a constant number of queries """
+        today = self.context['request'].user.local_today()
+        fields = set()
+        tagged = []
+
+        for reminder, item in zip(instances, validated_data):
+            tags = item.pop('tags', None)
+            if tags is not None:
+                tagged.append((reminder, tags))
+            for attr, value in item.items():
+                setattr(reminder, attr, value)
+                fields.add(attr)
+            reminder.update_next_notification(today)
+            reminder.updated_at = today
+
+        if fields:
+            Reminder.objects.bulk_update(instances, [*fields, 'next_notification_at', 'updated_at'])
+        if tagged:
+            set_reminders_tags([reminder for reminder, _ in tagged], [tags for _, tags in tagged], self.context['request'].user)
+        # bulk_update() doesn't send signals
+        bump_list_versions(reminder.user_id for reminder in instances)
+        publish(reminder.next_notification_at for reminder in instances)
+        return instances
+
+
 class TagSerializer(serializers.ModelSerializer):
     """ Serializer for Tags """
 
@@ -24,6 +116,7 @@ class ReminderSerializer(serializers.ModelSerializer):
         model = Reminder
         fields = ['id', 'title', 'reminder_date', 'permanent', 'tags']
         extra_kwargs = {'id': {'read_only': True}}  # Redundant, but I prefered to have this included
+        list_serializer_class = ReminderListSerializer
 
     # M2M fields are read only by default
     def create(self, validated_data):
@@ -34,12 +127,10 @@ class ReminderSerializer(serializers.ModelSerializer):
         # 2. Create a new reminder with the rest of data
         reminder = self.Meta.model.objects.create(**validated_data)
 
-        # 3.Get authenticated user from the request and liip through tags from validated data
-        auth_user = self.context['request'].user
-        for tag in tags:
-            tag['name'] = ' '.join(tag['name'].split()).title()
-            tag_obj, created = Tag.objects.get_or_create(user=auth_user, **tag)
-            reminder.tags.add(tag_obj)
+        # 3. Resolve all tags of authenticated user at once and assign them
+        if tags:
+            auth_user = self.context['request'].user
+            reminder.tags.add(*resolve_tags(auth_user, [tag['name'] for tag in tags]).values())
 
         return reminder
 
@@ -48,12 +139,9 @@ class ReminderSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags', None)
 
         if tags is not None:
-            instance.tags.clear()
+            # set() only writes the difference between current and new tags
             auth_user = self.context['request'].user
-            for tag in tags:
-                tag['name'] = ' '.join(tag['name'].split()).title()
-                tag_obj, created = Tag.objects.get_or_create(user=auth_user, **tag)
-                instance.tags.add(tag_obj)
+            instance.tags.set(resolve_tags(auth_user, [tag['name'] for tag in tags]).values())
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
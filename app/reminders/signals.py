@@ -0,0 +1,37 @@
+""" Signal receivers invalidating cached listings and waking the reminder dispatch up """
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Reminder, Tag
+from reminders.cache import bump_list_versions
+from reminders.wakeups import publish
+
+
+@receiver(post_save, sender=Reminder)
+@receiver(post_delete, sender=Reminder)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_owner_listings(sender, instance, **kwargs):
+    """ Invalidate listings of the owner of a saved or deleted reminder or tag, including cascade deletes """
+    bump_list_versions([instance.user_id])
+
+
+@receiver(post_save, sender=Reminder)
+def wake_dispatch(sender, instance, **kwargs):
+    """ Let the scheduler know the date the saved reminder gets notified on """
+    publish([instance.next_notification_at])
+
+
+@receiver(m2m_changed, sender=Reminder.tags.through)
+def invalidate_tagged_listings(sender, instance, action, **kwargs):
+    """ Invalidate listings after tags of a reminder have changed, from either side of the relation """
+    if action.startswith('post_'):
+        bump_list_versions([instance.user_id])
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_new_user_listings(sender, instance, created, **kwargs):
+    """ Start listings of a new user with a fresh version, in case the id has been used before """
+    if created:
+        bump_list_versions([instance.id])
@@ -0,0 +1,200 @@
+""" Tests for cached reminder and tag listings """
+import time
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Reminder, Tag
+from reminders.cache import list_version
+from reminders.dispatch import apply_transitions, due_reminders
+
+REMINDERS_URL = reverse('reminders:reminders-list')
+TAGS_URL = reverse('reminders:tags-list')
+
+
+def create_user(email='test@example.com'):
+    """ Create and return a test user """
+    return get_user_model().objects.create_user(email=email, password='Test1234')
+
+
+def create_reminder(user, days=30, **params):
+    """ Create and return a reminder the given number of days from today """
+    return Reminder.objects.create(user=user, title='Reminder', reminder_date=date.today() + timedelta(days=days), **params)
+
+
+@override_settings(LIST_CACHE_ENABLED=True)
+class CachedListingsTests(TestCase):
+    """ Test listings are cached per user and invalidated on changes """
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.reminder = create_reminder(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Family')
+        self.reminder.tags.add(self.tag)
+
+    def titles(self):
+        return [reminder['title'] for reminder in self.client.get(REMINDERS_URL).data['results']]
+
+    def test_repeated_list_served_from_cache(self):
+        """ Test an unchanged listing is not read from the database again """
+        first = self.client.get(REMINDERS_URL)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(REMINDERS_URL)
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_not_modified(self):
+        """ Test a request with the current ETag gets 304 without touching the database """
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_etag_changes_after_save(self):
+        """ Test saving a reminder makes the previous ETag stale """
+        etag = self.client.get(REMINDERS_URL)['ETag']
+
+        self.client.patch(reverse('reminders:reminders-detail', args=[self.reminder.id]), {'title': 'Updated'})
+        res = self.client.get(REMINDERS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['title'], 'Updated')
+
+    def test_tags_change_invalidates(self):
+        """ Test changing tags of a reminder through the API invalidates both listings """
+        self.client.get(REMINDERS_URL)
+        self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.client.patch(reverse('reminders:reminders-detail', args=[self.reminder.id]), {'tags': []}, format='json')
+
+        self.assertEqual(self.client.get(REMINDERS_URL).data['results'][0]['tags'], [])
+        self.assertEqual(self.client.get(TAGS_URL, {'assigned_only': 1}).data['results'], [])
+
+    def test_tag_delete_invalidates(self):
+        """ Test deleting a tag, which cascades to tags of reminders, invalidates the reminders listing """
+        self.client.get(REMINDERS_URL)
+
+        self.tag.delete()
+
+        self.assertEqual(self.client.get(REMINDERS_URL).data['results'][0]['tags'], [])
+
+    def test_bulk_create_invalidates(self):
+        """ Test reminders created in bulk show up in the cached listing """
+        self.client.get(REMINDERS_URL)
+
+        payload = [{'title': 'Bulk', 'reminder_date': str(date.today() + timedelta(days=40))}]
+        self.client.post(reverse('reminders:reminders-bulk'), payload, format='json')
+
+        self.assertIn('Bulk', self.titles())
+
+    def test_dispatch_rollover_invalidates(self):
+        """ Test rolling a permanent reminder over to the next year invalidates the listing """
+        reminder = create_reminder(self.user, days=0, permanent=True)
+        self.client.get(REMINDERS_URL)
+
+        apply_transitions(list(due_reminders(date.today())), date.today())
+
+        reminder.refresh_from_db()
+        dates = [item['reminder_date'] for item in self.client.get(REMINDERS_URL).data['results']]
+        self.assertIn(str(reminder.reminder_date), dates)
+
+    def test_listings_isolated_between_users(self):
+        """ Test cached listings of one user are never served to another """
+        self.client.get(REMINDERS_URL)
+        other_user = create_user(email='other@example.com')
+        self.client.force_authenticate(other_user)
+
+        self.assertEqual(self.client.get(REMINDERS_URL).data['results'], [])
+
+    def test_user_delete_bumps_version(self):
+        """ Test reminders deleted by cascade with their user invalidate the listing """
+        version = list_version(self.user.id)
+        user_id = self.user.id
+
+        self.user.delete()
+
+        self.assertNotEqual(list_version(user_id), version)
+
+    def test_bulk_delete_bumps_once(self):
+        """ Test deleting many reminders at once bumps the owner's listings once, not once per reminder """
+        reminders = [create_reminder(self.user) for _ in range(5)]
+        self.client.get(REMINDERS_URL)
+
+        with patch('reminders.cache.cache.set_many', wraps=cache.set_many) as set_many:
+            self.client.delete(reverse('reminders:reminders-bulk'), [reminder.id for reminder in reminders], format='json')
+
+        self.assertEqual(set_many.call_count, 1)
+        self.assertEqual(self.titles(), ['Reminder'])
+
+    def test_delete_me_bumps_once(self):
+        """ Test deleting the user through the API bumps their listings once for all cascaded reminders and tags """
+        for _ in range(5):
+            create_reminder(self.user)
+        version = list_version(self.user.id)
+        user_id = self.user.id
+
+        with patch('reminders.cache.cache.set_many', wraps=cache.set_many) as set_many:
+            res = self.client.delete(reverse('users:delete_me'), {'password': 'Test1234'})
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(set_many.call_count, 1)
+        self.assertNotEqual(list_version(user_id), version)
+
+
+class ProcessLocalCacheTests(TestCase):
+    """ Test listings changed through another process, each process having its own cache """
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.worker_cache = LocMemCache('worker', {})
+        self.other_worker_cache = LocMemCache('other-worker', {})
+
+    def get_list(self, worker_cache, **headers):
+        with patch('reminders.cache.cache', worker_cache):
+            return self.client.get(REMINDERS_URL, **headers)
+
+    def create_through_other_worker(self):
+        with patch('reminders.cache.cache', self.other_worker_cache), self.captureOnCommitCallbacks(execute=True):
+            payload = {'title': 'Other Worker', 'reminder_date': str(date.today() + timedelta(days=40))}
+            self.client.post(REMINDERS_URL, payload)
+
+    @override_settings(LIST_CACHE_ENABLED=False)
+    def test_process_local_cache_not_used(self):
+        """ Test listings are read from the database when the cache isn't shared between processes """
+        self.get_list(self.worker_cache)
+
+        self.create_through_other_worker()
+        res = self.get_list(self.worker_cache)
+
+        self.assertEqual([reminder['title'] for reminder in res.data['results']], ['Other Worker'])
+        self.assertNotIn('ETag', res)
+
+    @override_settings(LIST_CACHE_ENABLED=True, LIST_CACHE_TIMEOUT=300)
+    def test_version_expires_with_listings(self):
+        """ Test a process which missed a change stops serving the old listing and ETag once the cache timeout passes """
+        etag = self.get_list(self.worker_cache)['ETag']
+        self.create_through_other_worker()
+
+        with patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + 301):
+            res = self.get_list(self.worker_cache, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([reminder['title'] for reminder in res.data['results']], ['Other Worker'])
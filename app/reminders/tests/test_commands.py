@@ -1,11 +1,13 @@
 """ Tests for remanders commands """
-from datetime import date
+from datetime import date, timedelta
+from io import StringIO
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
 from django.test import TestCase
 from django.core.management import CommandError
 
-from core.models import Reminder
+from core.models import EmailOutbox, Reminder
 
 
 class CommandsTest(TestCase):
@@ -32,3 +34,47 @@ class CommandsTest(TestCase):
         reminder = Reminder.objects.all()[0]
 
         self.assertEqual(reminder.reminder_date, self.today)
+
+
+class SendRemindersCommandTest(TestCase):
+    """ Test send_reminders command """
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='test@example.com', password='Test1234', name='Test User')
+        self.reminders = [
+            Reminder.objects.create(user=user, title=f'Reminder {number}', reminder_date=date.today() + timedelta(days=5))
+            for number in range(4)
+        ]
+
+    def test_command_sends_all_due_reminders(self):
+        """ Test running the command without a shard sends all due reminders """
+        call_command('send_reminders')
+
+        self.assertEqual(EmailOutbox.objects.count(), 4)
+        self.assertFalse(Reminder.objects.exclude(sent_check='week').exists())
+
+    def test_command_sends_selected_shard(self):
+        """ Test --shard option sends reminders of a single shard """
+        call_command('send_reminders', '--workers', '2', '--shard', '0')
+
+        expected = [reminder.id for reminder in self.reminders if reminder.id % 2 == 0]
+        self.assertEqual(EmailOutbox.objects.count(), len(expected))
+        self.assertQuerysetEqual(Reminder.objects.filter(sent_check='week').order_by('id'), expected, transform=lambda r: r.id)
+
+    def test_command_invalid_shard_returns_error(self):
+        """ Test --shard outside of the number of workers returns Command Error """
+        with self.assertRaises(CommandError):
+            call_command('send_reminders', '--workers', '2', '--shard', '2')
+
+
+class BenchmarkDispatchScanCommandTest(TestCase):
+    """ Test benchmark_dispatch_scan command """
+
+    def test_scans_use_indexes(self):
+        """ Test the dispatch, clean up and list scans use their indexes and seeded rows are removed """
+        out = StringIO()
+        call_command('benchmark_dispatch_scan', '--rows', '2000', '--batch-size', '500', stdout=out)
+
+        for index_name in ['reminder_next_notification_idx', 'reminder_expiring_idx', 'reminder_user_date_id_idx']:
+            self.assertIn(f'using {index_name}', out.getvalue())
+        self.assertFalse(Reminder.objects.exists())
@@ -0,0 +1,386 @@
+""" Tests for dispatching reminder emails """
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.models import EmailOutbox, Reminder
+from reminders.dispatch import claim_chunk, dispatch, dispatch_buckets, dispatch_shard, due_reminders, local_buckets, next_year_date
+
+TODAY = date.today()
+
+
+def create_reminder(user, days, **kwargs):
+    """ Create and return a reminder happening in given number of days from TODAY """
+    defaults = {
+        'title': 'Test Reminder',
+        'reminder_date': TODAY + timedelta(days=days),
+    }
+    defaults.update(**kwargs)
+    return Reminder.objects.create(user=user, **defaults)
+
+
+def queued_subjects():
+    """ Return subjects of emails waiting in the outbox """
+    return list(EmailOutbox.objects.values_list('subject', flat=True))
+
+
+class DispatchTests(TestCase):
+    """ Test the set-based dispatch engine """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='test@example.com', password='Test1234', name='Test User')
+
+    def test_target_stage_computed_in_sql(self):
+        """ Test due reminders are annotated with the stage they should be at """
+        expected = {30: 'month', 8: 'month', 7: 'week', 4: 'week', 3: 'three_days', 2: 'three_days', 1: 'one_day', 0: 'today'}
+        reminders = {days: create_reminder(self.user, days) for days in expected}
+
+        targets = dict(due_reminders(TODAY).values_list('id', 'target_check'))
+
+        for days, stage in expected.items():
+            self.assertEqual(targets[reminders[days].id], stage)
+
+    def test_reminders_outside_window_not_due(self):
+        """ Test reminders in the past or further than 30 days are not due """
+        create_reminder(self.user, 31)
+        create_reminder(self.user, -1)
+
+        self.assertFalse(due_reminders(TODAY).exists())
+
+    def test_already_sent_stage_not_due(self):
+        """ Test reminders which already got the email of their stage are skipped """
+        create_reminder(self.user, 10, sent_check='month')
+        create_reminder(self.user, 5, sent_check='week')
+
+        self.assertEqual(dispatch(TODAY), 0)
+        self.assertEqual(len(queued_subjects()), 0)
+
+    def test_dispatch_updates_stages(self):
+        """ Test dispatch enqueues emails and moves reminders to their stages """
+        month = create_reminder(self.user, 20)
+        week = create_reminder(self.user, 6, sent_check='month')
+        three_days = create_reminder(self.user, 3, sent_check='week')
+        one_day = create_reminder(self.user, 1, sent_check='three_days')
+
+        self.assertEqual(dispatch(TODAY), 4)
+        self.assertEqual(len(queued_subjects()), 4)
+
+        for reminder, stage in [(month, 'month'), (week, 'week'), (three_days, 'three_days'), (one_day, 'one_day')]:
+            reminder.refresh_from_db()
+            self.assertEqual(reminder.sent_check, stage)
+            self.assertGreater(reminder.next_notification_at, TODAY)
+
+    def test_reminders_not_due_before_next_notification(self):
+        """ Test only reminders whose next notification date has come are scanned """
+        reminder = create_reminder(self.user, 20)
+        Reminder.objects.filter(id=reminder.id).update(next_notification_at=TODAY + timedelta(days=1))
+
+        self.assertFalse(due_reminders(TODAY).exists())
+
+    def test_passed_notifications_expired(self):
+        """ Test reminders which have passed without being dispatched are no longer scanned """
+        reminder = create_reminder(self.user, -3, permanent=True)
+        Reminder.objects.filter(id=reminder.id).update(next_notification_at=TODAY - timedelta(days=3))
+
+        dispatch(TODAY)
+
+        reminder.refresh_from_db()
+        self.assertIsNone(reminder.next_notification_at)
+
+    def test_dispatch_rolls_over_permanent_reminders(self):
+        """ Test permanent reminders happening today are moved to the next year """
+        reminder = create_reminder(self.user, 0, permanent=True, sent_check='one_day')
+
+        dispatch(TODAY)
+
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.reminder_date, next_year_date(TODAY))
+        self.assertEqual(reminder.sent_check, 'None')
+        self.assertEqual(reminder.next_notification_at, reminder.reminder_date - timedelta(days=30))
+        self.assertEqual(len(queued_subjects()), 1)
+
+    def test_leap_day_rolled_over_to_february_28(self):
+        """ Test a permanent reminder on February 29 moves to February 28 of a year which isn't a leap year """
+        leap_day = date(2028, 2, 29)
+        reminder = create_reminder(self.user, 0, reminder_date=leap_day, permanent=True, sent_check='one_day')
+
+        self.assertEqual(dispatch(leap_day), 1)
+
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.reminder_date, date(2029, 2, 28))
+        self.assertEqual(reminder.sent_check, 'None')
+        self.assertEqual(next_year_date(date(2031, 2, 28)), date(2032, 2, 28))
+
+    def test_render_failure_logged(self):
+        """ Test a reminder whose email can't be rendered is logged and stays due for the next run """
+        reminder = create_reminder(self.user, 20)
+
+        with patch('reminders.dispatch.render_group', side_effect=ValueError('Broken template')):
+            with self.assertLogs('reminders.dispatch', level='ERROR') as logs:
+                self.assertEqual(dispatch(TODAY), 0)
+
+        self.assertIn(str(reminder.id), logs.output[0])
+        self.assertTrue(due_reminders(TODAY).filter(id=reminder.id).exists())
+
+    def test_dispatch_deletes_non_permanent_reminders(self):
+        """ Test non-permanent reminders happening today are deleted after enqueueing their email """
+        reminder = create_reminder(self.user, 0, sent_check='one_day')
+
+        dispatch(TODAY)
+
+        self.assertFalse(Reminder.objects.filter(id=reminder.id).exists())
+        self.assertEqual(len(queued_subjects()), 1)
+
+    def test_query_count_independent_of_due_reminders(self):
+        """ Test the number of queries doesn't grow with the number of due reminders """
+        def seed(count):
+            for _ in range(count):
+                create_reminder(self.user, 20)
+                create_reminder(self.user, 5)
+                create_reminder(self.user, 0, permanent=True)
+
+        seed(2)
+        with CaptureQueriesContext(connection) as small_run:
+            dispatch(TODAY)
+
+        Reminder.objects.all().delete()
+        seed(10)
+        with CaptureQueriesContext(connection) as large_run:
+            dispatch(TODAY)
+
+        self.assertEqual(len(large_run), len(small_run))
+
+
+class ShardedDispatchTests(TestCase):
+    """ Test dispatching reminders split into shards """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='test@example.com', password='Test1234', name='Test User')
+
+    def test_shard_sends_only_its_reminders(self):
+        """ Test a shard only sends reminders with matching id """
+        reminders = [create_reminder(self.user, 10, title=f'Reminder {number}') for number in range(6)]
+
+        dispatch_shard(1, 3, TODAY)
+
+        expected = sorted(reminder.title for reminder in reminders if reminder.id % 3 == 1)
+        self.assertEqual(sorted(subject.split(' happens')[0] for subject in queued_subjects()), expected)
+
+    def test_every_stage_sent_once_across_shards(self):
+        """ Test running all shards, each of them twice, sends every stage email exactly once """
+        for number in range(12):
+            create_reminder(self.user, number % 9, title=f'Reminder {number}', permanent=True)
+
+        for shard in [0, 1, 2, 3, 0, 1, 2, 3]:
+            dispatch_shard(shard, 4, TODAY)
+
+        subjects = Counter(queued_subjects())
+        self.assertEqual(len(subjects), 12)
+        self.assertEqual(set(subjects.values()), {1})
+
+
+class DigestDispatchTests(TestCase):
+    """ Test users in digest mode getting all due reminders in one email """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='test@example.com', password='Test1234', name='Test User', digest_emails=True)
+        self.other_user = get_user_model().objects.create_user(email='other@example.com', password='Test1234', name='Other User')
+
+    def test_due_reminders_sent_in_one_email(self):
+        """ Test reminders of a digest user are collapsed into one email, while other users get one email per reminder """
+        for days in [0, 1, 5, 20]:
+            create_reminder(self.user, days, title=f'Digest {days}')
+        create_reminder(self.other_user, 1, title='Single 1')
+        create_reminder(self.other_user, 5, title='Single 5')
+
+        self.assertEqual(dispatch(TODAY), 6)
+
+        self.assertEqual(sorted(queued_subjects()), ['Single 1 happens tomorrow', 'Single 5 happens in 5 days', 'You have 4 upcoming reminders'])
+        digest = EmailOutbox.objects.get(to='test@example.com')
+        for days in [0, 1, 5, 20]:
+            self.assertIn(f'Digest {days} happens', digest.body)
+
+    def test_digest_transitions(self):
+        """ Test every reminder of a digest moves to its own stage """
+        reminders = {days: create_reminder(self.user, days, permanent=days == 0) for days in [0, 1, 3, 7, 30]}
+        expected = {1: 'one_day', 3: 'three_days', 7: 'week', 30: 'month'}
+
+        dispatch(TODAY)
+
+        for days, stage in expected.items():
+            self.assertEqual(Reminder.objects.get(id=reminders[days].id).sent_check, stage)
+        rolled_over = Reminder.objects.get(id=reminders[0].id)
+        self.assertEqual(rolled_over.sent_check, 'None')
+        self.assertEqual(rolled_over.reminder_date.year, TODAY.year + 1)
+
+        dispatch(TODAY)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    def test_single_due_reminder_sent_alone(self):
+        """ Test a digest user with one due reminder gets the regular email """
+        create_reminder(self.user, 1, title='Birthday')
+
+        dispatch(TODAY)
+
+        self.assertEqual(queued_subjects(), ['Birthday happens tomorrow'])
+
+    def test_digest_not_split_between_chunks(self):
+        """ Test chunks end at user boundaries, so a digest is never split """
+        for days in range(5):
+            create_reminder(self.user, days)
+        create_reminder(self.other_user, 1)
+
+        dispatch(TODAY, chunk_size=2)
+
+        self.assertEqual(sorted(queued_subjects()), ['Test Reminder happens tomorrow', 'You have 5 upcoming reminders'])
+
+    def test_digest_in_one_shard(self):
+        """ Test reminders of a digest user belong to a single shard, which doesn't split them between its chunks """
+        for days in range(5):
+            create_reminder(self.user, days)
+        for days in range(3):
+            create_reminder(self.other_user, days)
+
+        for shard in range(3):
+            dispatch_shard(shard, 3, TODAY, chunk_size=4)
+
+        self.assertEqual(Counter(queued_subjects())['You have 5 upcoming reminders'], 1)
+        self.assertEqual(EmailOutbox.objects.count(), 4)
+        self.assertFalse(due_reminders(TODAY).exists())
+
+
+class BucketDispatchTests(TestCase):
+    """ Test dispatching reminders in hourly buckets by local time of their users """
+
+    def setUp(self):
+        # 1 June 2030 00:30 UTC is 09:30 in Tokyo and 31 May 17:30 in Los Angeles
+        self.now = datetime(2030, 6, 1, 0, 30, tzinfo=dt_timezone.utc)
+        self.tokyo_user = get_user_model().objects.create_user(
+            email='tokyo@example.com', password='Test1234', name='Tokyo User', timezone='Asia/Tokyo', send_hour=9
+        )
+        self.la_user = get_user_model().objects.create_user(
+            email='la@example.com', password='Test1234', name='LA User', timezone='America/Los_Angeles', send_hour=18
+        )
+
+    def create_reminder(self, user, reminder_date, title):
+        return Reminder.objects.create(user=user, title=title, reminder_date=reminder_date)
+
+    def test_local_buckets(self):
+        """ Test timezones are grouped by their local date and hour """
+        get_user_model().objects.create_user(email='utc@example.com', password='Test1234', name='UTC User')
+        get_user_model().objects.create_user(email='london@example.com', password='Test1234', name='London User', timezone='Europe/Lisbon')
+
+        buckets = local_buckets(self.now)
+
+        self.assertEqual(buckets, [
+            (date(2030, 5, 31), 17, ['America/Los_Angeles']),
+            (date(2030, 6, 1), 0, ['UTC']),
+            (date(2030, 6, 1), 1, ['Europe/Lisbon']),
+            (date(2030, 6, 1), 9, ['Asia/Tokyo']),
+        ])
+
+    def test_emails_use_local_dates(self):
+        """ Test stages are computed from the local date of each user """
+        self.create_reminder(self.tokyo_user, date(2030, 6, 1), 'Tokyo')
+        self.create_reminder(self.la_user, date(2030, 6, 1), 'Los Angeles')
+
+        dispatch_buckets(self.now)
+        dispatch_buckets(self.now + timedelta(minutes=29))
+
+        self.assertEqual(queued_subjects(), ['Tokyo happens today'])
+
+        dispatch_buckets(self.now + timedelta(hours=1))
+
+        self.assertEqual(sorted(queued_subjects()), ['Los Angeles happens tomorrow', 'Tokyo happens today'])
+
+    def test_missed_bucket_caught_up(self):
+        """ Test reminders of users whose send hour passed without a dispatch are sent at the next tick """
+        self.create_reminder(self.tokyo_user, date(2030, 6, 3), 'Tokyo')
+
+        dispatch_buckets(self.now + timedelta(hours=5), shard=0, shards=1)
+
+        self.assertEqual(queued_subjects(), ['Tokyo happens in 2 days'])
+
+    def test_unsharded_run_claims_reminders(self):
+        """ Test the scheduler's run locks the reminders it sends like a shard does, instead of reading them unlocked """
+        self.create_reminder(self.tokyo_user, date(2030, 6, 3), 'Tokyo')
+
+        with patch('reminders.dispatch.claim_chunk', wraps=claim_chunk) as claim:
+            dispatch_buckets(self.now)
+
+        self.assertTrue(claim.called)
+        self.assertEqual(queued_subjects(), ['Tokyo happens in 2 days'])
+
+    def test_early_users_not_expired_by_late_ones(self):
+        """ Test clearing passed notifications only looks at users of the dispatched bucket """
+        reminder = self.create_reminder(self.la_user, date(2030, 5, 31), 'Los Angeles')
+
+        dispatch_buckets(self.now)
+
+        reminder.refresh_from_db()
+        self.assertIsNotNone(reminder.next_notification_at)
+        self.assertEqual(queued_subjects(), [])
+
+
+@skipUnless(connection.features.has_select_for_update_skip_locked, 'Claiming shards needs SELECT ... FOR UPDATE SKIP LOCKED.')
+class ConcurrentDispatchTests(TransactionTestCase):
+    """ Test concurrent workers draining the same shards """
+
+    def test_concurrent_workers_send_each_stage_once(self):
+        """ Test two workers per shard running at the same time never send the same stage twice """
+        user = get_user_model().objects.create_user(email='test@example.com', password='Test1234', name='Test User')
+        for number in range(200):
+            create_reminder(user, number % 31, title=f'Reminder {number}', permanent=True)
+
+        barrier = threading.Barrier(8)
+
+        def worker(shard):
+            barrier.wait()
+            try:
+                dispatch_shard(shard, 4, TODAY, chunk_size=5)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=[shard % 4]) for shard in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        subjects = Counter(queued_subjects())
+        self.assertEqual(len(subjects), 200)
+        self.assertEqual(set(subjects.values()), {1})
+
+    def test_scheduler_alongside_workers_sends_each_stage_once(self):
+        """ Test the scheduler's unsharded run overlapping with sharded workers doesn't send the same stage twice """
+        user = get_user_model().objects.create_user(email='test@example.com', password='Test1234', name='Test User')
+        now = datetime.now(dt_timezone.utc)
+        for number in range(200):
+            Reminder.objects.create(user=user, title=f'Reminder {number}', reminder_date=now.date() + timedelta(days=number % 31), permanent=True)
+
+        barrier = threading.Barrier(6)
+
+        def worker(run):
+            barrier.wait()
+            try:
+                run()
+            finally:
+                connection.close()
+
+        runs = [lambda: dispatch_buckets(now, chunk_size=5)] * 2 + [lambda shard=shard: dispatch_buckets(now, shard, 4, chunk_size=5) for shard in range(4)]
+        threads = [threading.Thread(target=worker, args=[run]) for run in runs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        subjects = Counter(queued_subjects())
+        self.assertEqual(len(subjects), 200)
+        self.assertEqual(set(subjects.values()), {1})
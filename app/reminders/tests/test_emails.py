@@ -0,0 +1,99 @@
+""" Tests for rendering reminder emails """
+from datetime import date
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import EmailOutbox, Reminder
+from core.outbox import deliver_outbox, enqueue
+from reminders.emails import ReminderRow, generate_reminder_email, render_digest_email, render_reminder_email, render_reminder_emails
+
+TODAY = date(2030, 1, 1)
+
+
+def html_body(message):
+    """ Return the HTML alternative of a message """
+    return next(content for content, mimetype in message.alternatives if mimetype == 'text/html')
+
+
+class RenderReminderEmailTests(TestCase):
+    """ Test emails rendered from precompiled templates """
+
+    def setUp(self):
+        self.row = ReminderRow('Birthday', 'Buy a cake', date(2030, 1, 3), False, 'Test User', 'test@example.com')
+
+    def test_text_body(self):
+        """ Test the text body tells the user about the reminder """
+        message = render_reminder_email(self.row, 2)
+
+        self.assertEqual(message.subject, 'Birthday happens in 2 days')
+        self.assertEqual(message.to, ['test@example.com'])
+        self.assertIn('Hi Test User!', message.body)
+        self.assertIn('We wanted to remind you, that Birthday happens in 2 days, on 2030-01-03.', message.body)
+        self.assertIn('Buy a cake', message.body)
+        self.assertIn('This reminder is not permanent', message.body)
+
+    def test_permanent_without_description(self):
+        """ Test optional parts are left out of the email """
+        message = render_reminder_email(self.row._replace(description='', permanent=True), 0)
+
+        self.assertEqual(message.subject, 'Birthday happens today')
+        self.assertNotIn('Reminder description', message.body)
+        self.assertNotIn('not permanent', message.body)
+        self.assertNotIn('not permanent', html_body(message))
+
+    def test_html_alternative_escaped(self):
+        """ Test the HTML alternative escapes values entered by the user, while the text body keeps them as they are """
+        message = render_reminder_email(self.row._replace(title='<b>Party</b> & more'), 1)
+
+        self.assertIn('&lt;b&gt;Party&lt;/b&gt; &amp; more', html_body(message))
+        self.assertIn('<b>Party</b> & more happens tomorrow', message.body)
+
+    def test_rows_rendered_with_shared_context(self):
+        """ Test values of one row don't leak into emails of the next ones """
+        rows = [self.row, ('Meeting', '', date(2030, 1, 2), True, 'Other User', 'other@example.com')]
+
+        messages = list(render_reminder_emails(rows, TODAY))
+
+        self.assertEqual([message.subject for message in messages], ['Birthday happens in 2 days', 'Meeting happens tomorrow'])
+        self.assertNotIn('Buy a cake', messages[1].body)
+        self.assertIn('Hi Other User!', messages[1].body)
+
+    def test_digest_email(self):
+        """ Test a digest email lists every reminder with its own date """
+        rows = [self.row, self.row._replace(title='<Meeting>', description='', reminder_date=date(2030, 1, 1), permanent=True)]
+
+        message = render_digest_email(rows, TODAY)
+
+        self.assertEqual(message.subject, 'You have 2 upcoming reminders')
+        self.assertEqual(message.to, ['test@example.com'])
+        self.assertIn('Birthday happens in 2 days, on 2030-01-03.\nBuy a cake', message.body)
+        self.assertIn('<Meeting> happens today, on 2030-01-01.', message.body)
+        self.assertEqual(message.body.count('not permanent'), 1)
+        self.assertIn('&lt;Meeting&gt;', html_body(message))
+
+    def test_generate_from_instance(self):
+        """ Test emails are still rendered from reminder instances """
+        user = get_user_model().objects.create_user(email='test@example.com', password='Test1234', name='Test User')
+        reminder = Reminder.objects.create(user=user, title='Birthday', reminder_date=date(2030, 1, 3))
+
+        self.assertEqual(generate_reminder_email(reminder, 2).body, render_reminder_email(self.row._replace(description=''), 2).body)
+
+    def test_outbox_keeps_html_alternative(self):
+        """ Test the HTML alternative is delivered from the outbox """
+        enqueue([render_reminder_email(self.row, 2)])
+
+        self.assertIn('Buy a cake', EmailOutbox.objects.get().html_body)
+        deliver_outbox()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(html_body(mail.outbox[0]), html_body(render_reminder_email(self.row, 2)))
+
+    def test_benchmark_email_rendering_command(self):
+        """ Test the benchmark reports the rendering throughput """
+        out = StringIO()
+        call_command('benchmark_email_rendering', '--messages', '10', stdout=out)
+
+        self.assertIn('Rendered 10 multipart messages', out.getvalue())
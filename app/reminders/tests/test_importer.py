@@ -0,0 +1,192 @@
+""" Tests for importing reminders from files """
+import io
+import tempfile
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Reminder, Tag
+from reminders.importer import csv_rows, ics_rows, import_reminders
+
+IMPORT_URL = reverse('reminders:reminders-import')
+TOMORROW = date.today() + timedelta(days=1)
+
+
+def create_user(email='test@example.com'):
+    """ Create and return a test user """
+    return get_user_model().objects.create_user(email=email, password='Test1234')
+
+
+def csv_file(*rows):
+    """ Return lines of a CSV file with a header and the given rows """
+    return io.StringIO('\n'.join(['title,description,reminder_date,permanent,tags', *rows]) + '\n')
+
+
+ICS = '\r\n'.join([
+    'BEGIN:VCALENDAR',
+    'VERSION:2.0',
+    'BEGIN:VEVENT',
+    'SUMMARY:Mom\\, birthday',
+    'DESCRIPTION:Buy flowers\\nand a cake',
+    f'DTSTART;VALUE=DATE:{TOMORROW:%Y%m%d}',
+    'RRULE:FREQ=YEARLY',
+    'CATEGORIES:Family,Birth',
+    ' day',
+    'END:VEVENT',
+    'BEGIN:VEVENT',
+    'SUMMARY:Dentist',
+    f'DTSTART:{TOMORROW:%Y%m%d}T093000Z',
+    'END:VEVENT',
+    'END:VCALENDAR',
+    '',
+])
+
+
+class ParserTests(TestCase):
+    """ Test parsing rows of import files """
+
+    def test_csv_rows(self):
+        """ Test CSV rows are parsed with their line numbers and tags """
+        rows = list(csv_rows(csv_file(f'Birthday,,{TOMORROW},True,Family;Important', f'Dentist,Checkup,{TOMORROW},,')))
+
+        self.assertEqual(rows[0], (2, {
+            'title': 'Birthday', 'reminder_date': str(TOMORROW), 'permanent': 'True',
+            'tags': [{'name': 'Family'}, {'name': 'Important'}],
+        }))
+        self.assertEqual(rows[1], (3, {'title': 'Dentist', 'description': 'Checkup', 'reminder_date': str(TOMORROW), 'tags': []}))
+
+    def test_ics_rows(self):
+        """ Test events are parsed with unfolded lines and unescaped text """
+        rows = list(ics_rows(io.StringIO(ICS)))
+
+        self.assertEqual(rows[0], (3, {
+            'title': 'Mom, birthday',
+            'description': 'Buy flowers\nand a cake',
+            'reminder_date': TOMORROW.isoformat(),
+            'permanent': True,
+            'tags': [{'name': 'Family'}, {'name': 'Birthday'}],
+        }))
+        self.assertEqual(rows[1], (11, {'title': 'Dentist', 'reminder_date': TOMORROW.isoformat(), 'tags': []}))
+
+
+class ImportRemindersTests(TestCase):
+    """ Test importing parsed rows """
+
+    def setUp(self):
+        self.user = create_user()
+
+    def test_import_reports_errors_by_line(self):
+        """ Test valid rows are created and invalid ones are reported with their line numbers """
+        lines = csv_file(
+            f'First,,{TOMORROW},,Family',
+            f'Past,,{date.today() - timedelta(days=1)},,',
+            f'Second,,{TOMORROW},True,Family;Work',
+            ',,not-a-date,,',
+        )
+
+        report = import_reminders(self.user, csv_rows(lines), batch_size=2)
+
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(report['failed'], 2)
+        self.assertEqual([error['line'] for error in report['errors']], [3, 5])
+        self.assertIn('reminder_date', report['errors'][0]['errors'])
+        self.assertEqual(set(Reminder.objects.filter(user=self.user).values_list('title', flat=True)), {'First', 'Second'})
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertIsNotNone(Reminder.objects.get(title='Second').next_notification_at)
+
+    def test_export_imported_back(self):
+        """ Test a CSV export can be imported again """
+        client = APIClient()
+        client.force_authenticate(self.user)
+        reminder = Reminder.objects.create(user=self.user, title='Exported', reminder_date=TOMORROW, permanent=True)
+        reminder.tags.add(Tag.objects.create(user=self.user, name='Family'))
+        exported = b''.join(client.get(reverse('reminders:reminders-export'), {'output': 'csv'}).streaming_content).decode()
+
+        other_user = create_user(email='other@example.com')
+        report = import_reminders(other_user, csv_rows(io.StringIO(exported)))
+
+        self.assertEqual(report['created'], 1)
+        imported = Reminder.objects.get(user=other_user)
+        self.assertEqual((imported.title, imported.reminder_date, imported.permanent), ('Exported', TOMORROW, True))
+        self.assertEqual([tag.name for tag in imported.tags.all()], ['Family'])
+
+
+class ImportAPITests(TestCase):
+    """ Test the import upload endpoint """
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_upload_ics(self):
+        """ Test events of an uploaded iCalendar file are created """
+        upload = SimpleUploadedFile('calendar.ics', ICS.encode(), content_type='text/calendar')
+
+        res = self.client.post(IMPORT_URL, {'file': upload}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['created'], 2)
+        self.assertTrue(Reminder.objects.get(user=self.user, title='Mom, birthday').permanent)
+
+    def test_upload_partial_failure(self):
+        """ Test a file with some invalid rows returns multi status with errors """
+        upload = SimpleUploadedFile('reminders.csv', csv_file(f'Valid,,{TOMORROW},,', 'Invalid,,,,').getvalue().encode())
+
+        res = self.client.post(IMPORT_URL, {'file': upload}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(res.data['errors'][0]['line'], 3)
+
+    def test_upload_unknown_extension(self):
+        """ Test files other than CSV and iCalendar are rejected """
+        upload = SimpleUploadedFile('reminders.xlsx', b'data')
+
+        res = self.client.post(IMPORT_URL, {'file': upload}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Reminder.objects.exists())
+
+
+class ImportCommandsTests(TestCase):
+    """ Test import management commands """
+
+    def test_import_reminders_command(self):
+        """ Test the command imports a file for the given user """
+        user = create_user()
+        with tempfile.NamedTemporaryFile('w', suffix='.ics', newline='') as file:
+            file.write(ICS)
+            file.flush()
+            out = io.StringIO()
+            call_command('import_reminders', user.email, file.name, stdout=out)
+
+        self.assertEqual(Reminder.objects.filter(user=user).count(), 2)
+        self.assertIn('2 reminders have been imported', out.getvalue())
+
+    def test_import_command_uses_local_dates(self):
+        """ Test the command validates dates against the local date of each user, not the UTC one """
+        for zone, days, created in [('Etc/GMT-14', 0, 0), ('Etc/GMT+12', 1, 1)]:
+            user = get_user_model().objects.create_user(email=f'{days}@example.com', password='Test1234', timezone=zone)
+            local_date = user.local_today() + timedelta(days=days)
+            with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='') as file:
+                file.write(csv_file(f'Local,,{local_date},,').getvalue())
+                file.flush()
+                call_command('import_reminders', user.email, file.name, stdout=io.StringIO(), stderr=io.StringIO())
+
+            self.assertEqual(Reminder.objects.filter(user=user).count(), created, zone)
+
+    def test_benchmark_import_command(self):
+        """ Test the benchmark imports the generated rows and rolls them back """
+        for file_format in ['csv', 'ics']:
+            out = io.StringIO()
+            call_command('benchmark_import', '--rows', '50', '--format', file_format, '--batch-size', '20', stdout=out)
+
+            self.assertIn('Imported 50 of 50 rows', out.getvalue())
+        self.assertFalse(Reminder.objects.exists())
@@ -1,7 +1,14 @@
 # """ Test for the reminders API """
-from datetime import date
-
+import csv
+import json
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
@@ -9,9 +16,12 @@ from rest_framework.test import APIClient
 from rest_framework import status
 
 from core.models import Reminder, Tag
+from ..pagination import ReminderPagination
 from ..serializers import ReminderSerializer, ReminderDetailSerializer
 
 REMINDERS_URL = reverse('reminders:reminders-list')
+BULK_URL = reverse('reminders:reminders-bulk')
+EXPORT_URL = reverse('reminders:reminders-export')
 
 
 def detail_url(reminder_id):
@@ -72,11 +82,11 @@ class PrivateRecipeAPITests(TestCase):
 
         res = self.client.get(REMINDERS_URL)
 
-        reminders = Reminder.objects.all()
+        reminders = Reminder.objects.order_by('-reminder_date', '-id')
         serializer = ReminderSerializer(reminders, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_reminders_limited_to_a_user(self):
         """ Test retrieved reminders are limited to the authenticated user """
@@ -86,11 +96,11 @@ class PrivateRecipeAPITests(TestCase):
 
         res = self.client.get(REMINDERS_URL)
 
-        reminders = Reminder.objects.filter(user_id=self.user.id)
+        reminders = Reminder.objects.filter(user_id=self.user.id).order_by('-reminder_date', '-id')
         serializer = ReminderSerializer(reminders, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_get_specific_reminder(self):
         """ Test retrieving a specific reinder works """
@@ -279,6 +289,40 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(reminder.tags.count(), 0)
 
+    def test_create_reminder_tags_constant_queries(self):
+        """ Test creating a reminder takes the same number of queries for any number of tags """
+        for count in [1, 5, 20]:
+            Tag.objects.create(user=self.user, name=f'Existing {count}')
+            payload = {
+                'title': f'Reminder with {count} tags',
+                'reminder_date': date(self.today.year + 1, 1, 1),
+                'tags': [{'name': f'Existing {count}'}] + [{'name': f'New {count} {number}'} for number in range(count)]
+            }
+
+            # add() looks up existing rows first, because m2m_changed has a listener invalidating cached listings
+            with self.assertNumQueries(6):
+                res = self.client.post(REMINDERS_URL, payload, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(res.data['tags']), count + 1)
+
+    def test_update_reminder_tags_constant_queries(self):
+        """ Test updating tags of a reminder takes the same number of queries for any number of tags """
+        for count in [1, 5, 20]:
+            reminder = create_reminder(user=self.user)
+            kept_tag = Tag.objects.create(user=self.user, name=f'Kept {count}')
+            reminder.tags.add(kept_tag, Tag.objects.create(user=self.user, name=f'Removed {count}'))
+            payload = {
+                'tags': [{'name': f'Kept {count}'}] + [{'name': f'New {count} {number}'} for number in range(count)]
+            }
+
+            with self.assertNumQueries(9):
+                res = self.client.patch(detail_url(reminder.id), payload, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(reminder.tags.count(), count + 1)
+            self.assertIn(kept_tag, reminder.tags.all())
+
     def test_tags_saved_uppercase(self):
         """ Test saving tags is not case and whitespace sensitive """
         tag = Tag.objects.create(user=self.user, name='Very Important')
@@ -314,7 +358,329 @@ class PrivateRecipeAPITests(TestCase):
         serializer2 = ReminderSerializer(reminder2)
         serializer3 = ReminderSerializer(reminder3)
 
-        self.assertEqual(len(res.data), 2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+
+    def test_filter_by_tags_unique(self):
+        """ Test a reminder with many of the filtered tags is listed once """
+        reminder = create_reminder(user=self.user)
+        tag1 = Tag.objects.create(user=self.user, name='Family')
+        tag2 = Tag.objects.create(user=self.user, name='Work')
+        reminder.tags.add(tag1, tag2)
+
+        res = self.client.get(REMINDERS_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_list_queries_independent_of_reminders_and_tags(self):
+        """ Test listing reminders takes two queries no matter how many reminders and tags there are """
+        for count in [2, 10]:
+            tags = [Tag.objects.create(user=self.user, name=f'Tag {count} {number}') for number in range(count)]
+            for _ in range(count):
+                create_reminder(user=self.user).tags.add(*tags)
+
+            with self.assertNumQueries(2):
+                res = self.client.get(REMINDERS_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+            with self.assertNumQueries(2):
+                res = self.client.get(REMINDERS_URL, {'tags': f'{tags[0].id},{tags[1].id}'})
+            self.assertEqual(len(res.data['results']), count)
+
+    def test_reminder_date_validated_in_user_timezone(self):
+        """ Test the earliest reminder date is tomorrow on the local date of the user """
+        # A timezone which is on another date than UTC right now
+        name = 'Pacific/Kiritimati' if datetime.now(dt_timezone.utc).hour >= 10 else 'Pacific/Pago_Pago'
+        self.user.timezone = name
+        self.user.save()
+        local_tomorrow = datetime.now(ZoneInfo(name)).date() + timedelta(days=1)
+
+        res = self.client.post(REMINDERS_URL, {'title': 'Local', 'reminder_date': local_tomorrow})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = self.client.post(REMINDERS_URL, {'title': 'Local', 'reminder_date': local_tomorrow - timedelta(days=1)})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PaginatedRemindersAPITests(TestCase):
+    """ Test keyset pagination of the reminders list """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='test@example.com', password='Test1234')
+        self.client.force_authenticate(self.user)
+        today = date.today()
+        # Pairs of reminders share a date, so the order has to be settled by id
+        self.reminders = [
+            create_reminder(user=self.user, title=f'Reminder {number}', reminder_date=date(today.year + 1, 1, 1 + number // 2))
+            for number in range(7)
+        ]
+        self.expected_ids = list(Reminder.objects.order_by('-reminder_date', '-id').values_list('id', flat=True))
+
+    def walk(self, url, params=None, link='next'):
+        """ Follow the links of pages and return ids of the returned reminders """
+        ids = []
+        res = self.client.get(url, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            ids.extend(reminder['id'] for reminder in res.data['results'])
+            if not res.data[link]:
+                return ids, res
+            res = self.client.get(res.data[link])
+
+    def test_pages_cover_all_reminders_in_order(self):
+        """ Test following next links returns every reminder once in a stable order """
+        ids, res = self.walk(REMINDERS_URL, {'page_size': 3})
+
+        self.assertEqual(ids, self.expected_ids)
+        self.assertIsNone(res.data['next'])
+
+    def test_previous_link(self):
+        """ Test previous links go back through the same pages """
+        first_page = self.client.get(REMINDERS_URL, {'page_size': 3})
+        self.assertIsNone(first_page.data['previous'])
+        second_page = self.client.get(first_page.data['next'])
+        third_page = self.client.get(second_page.data['next'])
+
+        res = self.client.get(third_page.data['previous'])
+
+        self.assertEqual(res.data['results'], second_page.data['results'])
+        back_to_first = self.client.get(res.data['previous'])
+        self.assertEqual(back_to_first.data['results'], first_page.data['results'])
+        self.assertIsNone(back_to_first.data['previous'])
+
+    def test_page_size_capped(self):
+        """ Test the requested page size is limited by the maximum page size """
+        with patch.object(ReminderPagination, 'max_page_size', 2):
+            res = self.client.get(REMINDERS_URL, {'page_size': 1000})
+
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_invalid_cursor(self):
+        """ Test a malformed cursor returns not found """
+        res = self.client.get(REMINDERS_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deep_page_queries(self):
+        """ Test a deep page costs the same number of queries as the first one """
+        res = self.client.get(REMINDERS_URL, {'page_size': 2})
+        for _ in range(2):
+            res = self.client.get(res.data['next'])
+
+        # Measure the database, not the listings cache
+        cache.clear()
+        with self.assertNumQueries(2):
+            self.client.get(REMINDERS_URL, {'page_size': 2})
+        with self.assertNumQueries(2):
+            res = self.client.get(res.data['next'])
+        self.assertEqual([reminder['id'] for reminder in res.data['results']], self.expected_ids[6:])
+
+    def test_cursor_bounds_leading_field(self):
+        """ Test the cursor filter bounds the date on its own, so the index scan starts at the cursor instead of filtering rows up to it """
+        res = self.client.get(REMINDERS_URL, {'page_size': 2})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(res.data['next'])
+
+        page_query = next(query['sql'] for query in queries if 'ORDER BY' in query['sql'])
+        self.assertIn('"core_reminder"."reminder_date" <=', page_query)
+
+
+class ExportRemindersAPITests(TestCase):
+    """ Test streaming export of reminders """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='test@example.com', password='Test1234')
+        self.client.force_authenticate(self.user)
+        self.reminder = create_reminder(user=self.user, title='Birthday, Mom')
+        self.reminder.tags.add(Tag.objects.create(user=self.user, name='Family'), Tag.objects.create(user=self.user, name='Birthday'))
+        create_reminder(user=self.user, title='No tags')
+        create_reminder(user=create_user(email='other@example.com'), title='Other user')
+
+    def test_export_ndjson(self):
+        """ Test reminders are streamed as one JSON document per line """
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(res['X-Accel-Buffering'], 'no')
+        rows = [json.loads(line) for line in b''.join(res.streaming_content).decode().splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['No tags', 'Birthday, Mom'])
+        self.assertEqual(rows[1]['tags'], ['Birthday', 'Family'])
+        self.assertEqual(rows[1]['reminder_date'], self.reminder.reminder_date.isoformat())
+
+    def test_export_csv(self):
+        """ Test reminders are streamed as CSV with a header """
+        res = self.client.get(EXPORT_URL, {'output': 'csv'})
+
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(b''.join(res.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1]['title'], 'Birthday, Mom')
+        self.assertEqual(rows[1]['tags'], 'Birthday;Family')
+
+    def test_export_tags_fetched_per_chunk(self):
+        """ Test tags are fetched with one query per chunk of reminders """
+        for number in range(10):
+            create_reminder(user=self.user, title=f'Reminder {number}').tags.add(Tag.objects.get(name='Family'))
+
+        with patch('reminders.export.EXPORT_CHUNK_SIZE', 5), self.assertNumQueries(4):
+            res = self.client.get(EXPORT_URL)
+            rows = b''.join(res.streaming_content).decode().splitlines()
+
+        self.assertEqual(len(rows), 12)
+
+    def test_export_invalid_output(self):
+        """ Test an unknown output format is rejected """
+        res = self.client.get(EXPORT_URL, {'output': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkRemindersAPITests(TestCase):
+    """ Test bulk reminder endpoints """
+
+    def setUp(self):
+        self.today = date.today()
+        self.client = APIClient()
+        self.user = create_user(email='test@example.com', password='Test1234')
+        self.client.force_authenticate(self.user)
+
+    def create_payload(self, count, tags=('Birthday', 'Family')):
+        """ Create and return a list of reminders to create in bulk """
+        return [
+            {
+                'title': f'Reminder {number}',
+                'reminder_date': date_to_string(date(self.today.year + 1, 1, 1)),
+                'tags': [{'name': name} for name in tags],
+            }
+            for number in range(count)
+        ]
+
+    def test_bulk_create(self):
+        """ Test creating many reminders with their tags """
+        res = self.client.post(BULK_URL, self.create_payload(3), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Reminder.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        for reminder in Reminder.objects.filter(user=self.user):
+            self.assertEqual(reminder.tags.count(), 2)
+            self.assertIsNotNone(reminder.next_notification_at)
+        self.assertEqual([result['data']['title'] for result in res.data['results']], ['Reminder 0', 'Reminder 1', 'Reminder 2'])
+
+    def test_bulk_create_reuses_existing_tags(self):
+        """ Test existing tags are assigned instead of being created again """
+        tag = Tag.objects.create(user=self.user, name='Birthday')
+
+        self.client.post(BULK_URL, self.create_payload(2, tags=['birthday ', 'Work']), format='json')
+
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(tag.reminder_set.count(), 2)
+
+    def test_bulk_create_query_count_constant(self):
+        """ Test the number of queries doesn't depend on the number of reminders """
+        with CaptureQueriesContext(connection) as small_import:
+            self.client.post(BULK_URL, self.create_payload(5), format='json')
+        with CaptureQueriesContext(connection) as large_import:
+            self.client.post(BULK_URL, self.create_payload(100, tags=['Birthday', 'Family', 'Work']), format='json')
+
+        self.assertEqual(len(large_import), len(small_import))
+        self.assertLess(len(large_import), 15)
+        through_table = Reminder.tags.through._meta.db_table
+        self.assertFalse([query for query in large_import if query['sql'].startswith(f'DELETE FROM "{through_table}"')])
+
+    def test_bulk_create_partial_failure(self):
+        """ Test valid items are created and errors are reported for invalid ones """
+        payload = self.create_payload(2)
+        payload.insert(1, {'title': 'Past reminder', 'reminder_date': date_to_string(self.today)})
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result['status'] for result in res.data['results']], [201, 400, 201])
+        self.assertIn('reminder_date', res.data['results'][1]['errors'])
+        self.assertEqual(Reminder.objects.count(), 2)
+
+    def test_bulk_create_all_invalid(self):
+        """ Test a bad request is returned when none of the items is valid """
+        res = self.client.post(BULK_URL, [{'title': 'No date'}], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Reminder.objects.exists())
+
+    def test_bulk_request_requires_list(self):
+        """ Test a bulk request which isn't a list is rejected """
+        res = self.client.post(BULK_URL, {'title': 'Not a list'}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update(self):
+        """ Test updating many reminders and their tags """
+        reminders = [create_reminder(user=self.user, title=f'Reminder {number}') for number in range(2)]
+        other_reminder = create_reminder(user=create_user(email='other@example.com'))
+        payload = [
+            {'id': reminders[0].id, 'title': 'Updated', 'tags': [{'name': 'Work'}]},
+            {'id': reminders[1].id, 'reminder_date': date_to_string(date(self.today.year + 2, 1, 1))},
+            {'id': other_reminder.id, 'title': 'Not mine'},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result['status'] for result in res.data['results']], [200, 200, 404])
+        for reminder in reminders:
+            reminder.refresh_from_db()
+        other_reminder.refresh_from_db()
+        self.assertEqual(reminders[0].title, 'Updated')
+        self.assertEqual([tag.name for tag in reminders[0].tags.all()], ['Work'])
+        self.assertEqual(reminders[1].reminder_date, date(self.today.year + 2, 1, 1))
+        self.assertEqual(reminders[1].title, 'Reminder 1')
+        self.assertNotEqual(other_reminder.title, 'Not mine')
+
+    def test_bulk_update_repeated_id(self):
+        """ Test every item of a repeated id is reported as invalid, while the other items are updated """
+        reminders = [create_reminder(user=self.user, title=f'Reminder {number}') for number in range(2)]
+        payload = [
+            {'id': reminders[0].id, 'title': 'First', 'tags': [{'name': 'Work'}]},
+            {'id': reminders[1].id, 'title': 'Updated'},
+            {'id': reminders[0].id, 'title': 'Second', 'tags': [{'name': 'Work'}]},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result['status'] for result in res.data['results']], [400, 200, 400])
+        self.assertIn('id', res.data['results'][0]['errors'])
+        reminders[0].refresh_from_db()
+        self.assertEqual(reminders[0].title, 'Reminder 0')
+        self.assertEqual(Reminder.objects.get(id=reminders[1].id).title, 'Updated')
+
+    def test_bulk_delete(self):
+        """ Test deleting many reminders and reporting missing ones """
+        reminders = [create_reminder(user=self.user) for _ in range(2)]
+        other_reminder = create_reminder(user=create_user(email='other@example.com'))
+
+        res = self.client.delete(BULK_URL, [reminder.id for reminder in reminders] + [other_reminder.id], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result['status'] for result in res.data['results']], [204, 204, 404])
+        self.assertFalse(Reminder.objects.filter(user=self.user).exists())
+        self.assertTrue(Reminder.objects.filter(id=other_reminder.id).exists())
+
+    def test_bulk_booleans_not_ids(self):
+        """ Test JSON booleans aren't taken for the ids 1 and 0 """
+        reminder = create_reminder(user=self.user)
+        Reminder.objects.filter(id=reminder.id).update(id=1)
+
+        res = self.client.delete(BULK_URL, [True, False], format='json')
+        self.assertEqual([result['status'] for result in res.data['results']], [404, 404])
+        res = self.client.patch(BULK_URL, [{'id': True, 'title': 'Updated'}], format='json')
+        self.assertEqual([result['status'] for result in res.data['results']], [404])
+
+        self.assertEqual(Reminder.objects.get(id=1).title, reminder.title)
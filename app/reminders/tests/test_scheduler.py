@@ -0,0 +1,75 @@
+""" Tests for the reminder scheduler """
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase
+
+from reminders import scheduler
+
+
+@patch('reminders.scheduler.create_waker')
+@patch('reminders.scheduler.create_scheduler')
+@patch('reminders.scheduler.holds_leadership')
+@patch('reminders.scheduler.acquire_leadership')
+@patch('time.sleep')
+class RunSchedulerCommandTests(SimpleTestCase):
+    """ Test run_scheduler command """
+
+    def test_waits_for_leadership(self, patched_sleep, patched_acquire, patched_holds, patched_create, patched_waker):
+        """ Test jobs start only after the leadership has been acquired """
+        patched_acquire.side_effect = [False, False, True]
+        patched_holds.return_value = False
+
+        with self.assertRaises(CommandError):
+            call_command('run_scheduler')
+
+        self.assertEqual(patched_acquire.call_count, 3)
+        patched_create.return_value.start.assert_called_once()
+        patched_waker.return_value.start.assert_called_once()
+
+    def test_stops_jobs_when_leadership_lost(self, patched_sleep, patched_acquire, patched_holds, patched_create, patched_waker):
+        """ Test jobs are shut down when the leadership is lost """
+        patched_acquire.return_value = True
+        patched_holds.side_effect = [True, True, False]
+
+        with self.assertRaises(CommandError):
+            call_command('run_scheduler')
+
+        self.assertEqual(patched_holds.call_count, 3)
+        patched_create.return_value.shutdown.assert_called_once()
+        patched_waker.return_value.stop.assert_called_once()
+
+    def test_gives_up_leadership_when_waker_stopped(self, patched_sleep, patched_acquire, patched_holds, patched_create, patched_waker):
+        """ Test the leader exits and releases the lock when its waker thread has died """
+        patched_acquire.return_value = True
+        patched_holds.return_value = True
+        patched_waker.return_value.is_alive.side_effect = [True, False]
+
+        with patch('reminders.scheduler.release_leadership') as patched_release:
+            with self.assertRaisesMessage(CommandError, 'waker has stopped'):
+                call_command('run_scheduler')
+
+        self.assertEqual(patched_holds.call_count, 2)
+        patched_create.return_value.shutdown.assert_called_once()
+        patched_release.assert_called_once()
+
+
+class SchedulerTests(TestCase):
+    """ Test scheduler setup """
+
+    def test_acquire_leadership(self):
+        """ Test the only scheduler process becomes and stays the leader """
+        self.assertTrue(scheduler.acquire_leadership())
+        self.assertTrue(scheduler.holds_leadership())
+        scheduler.release_leadership()
+
+    def test_scheduler_has_reminder_jobs(self):
+        """ Test the scheduler runs cleaning up reminders, while the waker sends them """
+        jobs = scheduler.create_scheduler().get_jobs()
+        functions = [job.args[0].__name__ for job in jobs]
+
+        self.assertNotIn('send_emails', functions)
+        self.assertEqual(scheduler.create_waker().job.args[0].__name__, 'send_emails')
+        self.assertIn('delete_past_reminders', functions)
+        self.assertIn('purge_expired_tokens', functions)
@@ -52,9 +52,9 @@ class PrivateTagsAPITests(TestCase):
         res = self.client.get(TAGS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
-        tags = Tag.objects.all().order_by('-name')
+        tags = Tag.objects.all().order_by('-name', '-id')
         serializer = TagSerializer(tags, many=True)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """ Test list of tags is limited to the authenticated user """
@@ -65,9 +65,25 @@ class PrivateTagsAPITests(TestCase):
         res = self.client.get(TAGS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
-        self.assertEqual(res.data[0]['id'], tag.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+        self.assertEqual(res.data['results'][0]['id'], tag.id)
+
+    def test_tags_paginated(self):
+        """ Test tags are paginated by name and id, including tags with the same name """
+        for name in ['Birthday', 'Anniversary', 'Birthday', 'Work', 'Family']:
+            Tag.objects.create(name=name, user=self.user)
+        expected_ids = list(Tag.objects.order_by('-name', '-id').values_list('id', flat=True))
+
+        ids = []
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+        while True:
+            ids.extend(tag['id'] for tag in res.data['results'])
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(ids, expected_ids)
 
     def test_update_tag(self):
         """ Test updating tag """
@@ -111,8 +127,8 @@ class PrivateTagsAPITests(TestCase):
 
         serialized_tag1 = TagSerializer(tag1)
         serialized_tag2 = TagSerializer(tag2)
-        self.assertIn(serialized_tag1.data, res.data)
-        self.assertNotIn(serialized_tag2.data, res.data)
+        self.assertIn(serialized_tag1.data, res.data['results'])
+        self.assertNotIn(serialized_tag2.data, res.data['results'])
 
     def test_filtered_tags_unique(self):
         """ Test filtered tags return a unique list """
@@ -136,4 +152,4 @@ class PrivateTagsAPITests(TestCase):
         reminder2.tags.add(tag1)
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
@@ -0,0 +1,221 @@
+""" Tests for exact-time wake ups of the reminder dispatch """
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest.mock import MagicMock, patch
+from zoneinfo import ZoneInfo
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.models import Reminder
+from reminders.dispatch import dispatch_buckets
+from reminders.wakeups import DispatchWaker, WakeupQueue, day_instant, next_hour_instant, wakeup_queue
+
+TODAY = date.today()
+
+
+class FakeClock:
+    """ Clock moved forward by tests """
+
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class WakeupQueueTests(SimpleTestCase):
+    """ Test the heap of wake up instants """
+
+    def test_passed_instants_popped(self):
+        """ Test waiting returns at once when instants have passed, popping all of them """
+        clock = FakeClock(25)
+        queue = WakeupQueue(clock=clock)
+        for instant in [30, 10, 20]:
+            queue.push(instant)
+
+        self.assertTrue(queue.wait_due(60))
+        self.assertEqual(queue.next_instant(), 30)
+
+    def test_instants_not_repeated(self):
+        """ Test the same instant is queued once """
+        queue = WakeupQueue()
+        queue.push(10)
+        queue.push(10)
+
+        self.assertEqual(len(queue), 1)
+
+    def test_wait_times_out(self):
+        """ Test waiting returns after the maximum sleep when no instant has passed """
+        queue = WakeupQueue()
+        queue.push(time.time() + 60)
+
+        self.assertFalse(queue.wait_due(0.01))
+        self.assertEqual(len(queue), 1)
+
+    def test_push_wakes_waiting_thread(self):
+        """ Test a pushed instant which has passed wakes the waiting thread up at once """
+        queue = WakeupQueue()
+        queue.push(time.time() + 60)
+        threading.Timer(0.05, lambda: queue.push(time.time())).start()
+
+        started = time.monotonic()
+        self.assertTrue(queue.wait_due(10))
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_day_instant(self):
+        """ Test days start at the midnight of the easternmost timezone """
+        start = datetime.fromtimestamp(day_instant(TODAY), ZoneInfo('Pacific/Kiritimati'))
+
+        self.assertEqual((start.date(), start.hour, start.minute), (TODAY, 0, 0))
+        self.assertEqual(datetime.fromtimestamp(day_instant(TODAY), dt_timezone.utc).hour, 10)
+
+    def test_next_hour_instant(self):
+        """ Test ticks happen at full hours """
+        moment = datetime(2030, 1, 1, 10, 59, 59, tzinfo=dt_timezone.utc).timestamp()
+
+        self.assertEqual(next_hour_instant(moment), datetime(2030, 1, 1, 11, tzinfo=dt_timezone.utc).timestamp())
+        self.assertEqual(next_hour_instant(moment + 1), datetime(2030, 1, 1, 12, tzinfo=dt_timezone.utc).timestamp())
+
+
+class DispatchWakerTests(TestCase):
+    """ Test the thread running the dispatch when reminders become due """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='test@example.com', password='Test1234', name='Test User')
+
+    def tearDown(self):
+        wakeup_queue.active = False
+        wakeup_queue.clear()
+
+    def create_reminder(self, days):
+        return Reminder.objects.create(user=self.user, title='Test Reminder', reminder_date=TODAY + timedelta(days=days))
+
+    @override_settings(REMINDER_WAKEUP_BATCH_SIZE=2)
+    def test_reload_loads_next_days(self):
+        """ Test the queue is loaded with a batch of the nearest upcoming days, and the next hour while reminders are due """
+        for days in [50, 40, 40, 37, 12]:
+            self.create_reminder(days)
+        clock = FakeClock(time.time())
+        waker = DispatchWaker(MagicMock(), WakeupQueue(clock=clock))
+
+        waker.reload()
+
+        # Month emails are due 30 days before the reminder, the one in 12 days is due today already
+        self.assertEqual(len(waker.queue), 3)
+        self.assertEqual(waker.queue.next_instant(), next_hour_instant(clock.now))
+        clock.now = day_instant(TODAY + timedelta(days=7))
+        self.assertTrue(waker.queue.wait_due(0))
+        self.assertEqual(waker.queue.next_instant(), day_instant(TODAY + timedelta(days=10)))
+
+    def test_reload_finds_due_reminders(self):
+        """ Test due reminders are dispatched at the next hour, or at once when they have been found by polling """
+        self.create_reminder(1)
+        clock = FakeClock(time.time())
+        waker = DispatchWaker(MagicMock(), WakeupQueue(clock=clock))
+
+        waker.reload()
+        self.assertEqual(waker.queue.next_instant(), next_hour_instant(clock.now))
+
+        waker.reload(check_due=True)
+        self.assertEqual(waker.queue.next_instant(), clock.now)
+
+    def test_due_until_day_ends_in_westernmost_timezones(self):
+        """ Test hourly ticks go on after the day has ended in the easternmost timezone, while it is still due in the west """
+        self.user.timezone = 'America/Los_Angeles'
+        self.user.send_hour = 18
+        self.user.save()
+        reminder = self.create_reminder(1)
+        Reminder.objects.filter(id=reminder.id).update(
+            reminder_date=date(2030, 6, 10), sent_check='one_day', next_notification_at=date(2030, 6, 10)
+        )
+        # 18:30 on 2030-06-10 in Los Angeles, already 2030-06-11 from 10:00 UTC on in the easternmost timezone
+        now = datetime(2030, 6, 11, 1, 30, tzinfo=dt_timezone.utc)
+        waker = DispatchWaker(MagicMock(), WakeupQueue(clock=FakeClock(now.timestamp())))
+
+        waker.reload()
+
+        self.assertEqual(waker.queue.next_instant(), next_hour_instant(now.timestamp()))
+        self.assertEqual(dispatch_buckets(now), 1)
+
+    def test_idle_without_due_reminders(self):
+        """ Test nothing is queued when no reminder is due anywhere """
+        self.create_reminder(50)
+        waker = DispatchWaker(MagicMock(), WakeupQueue())
+
+        waker.reload(check_due=True)
+
+        self.assertEqual(waker.queue.next_instant(), day_instant(TODAY + timedelta(days=20)))
+
+    def test_saved_reminder_wakes_dispatch(self):
+        """ Test saving a reminder queues its notification date once the change has been committed """
+        wakeup_queue.active = True
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reminder = self.create_reminder(20)
+            self.assertEqual(len(wakeup_queue), 0)
+
+        self.assertEqual(wakeup_queue.next_instant(), day_instant(reminder.next_notification_at))
+
+    def test_inactive_queue_not_filled(self):
+        """ Test processes without a waker don't collect wake ups """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_reminder(20)
+
+        self.assertEqual(len(wakeup_queue), 0)
+
+    def test_runs_job_when_due(self):
+        """ Test the job runs on start and again when a queued instant passes, reloading the queue after each run """
+        queue = WakeupQueue()
+        queue.push(time.time() - 1)
+        job = MagicMock()
+        waker = DispatchWaker(job, queue)
+        job.side_effect = lambda: job.call_count == 2 and waker.stop()
+
+        with patch.object(waker, 'reload') as patched_reload:
+            waker.run()
+
+        self.assertEqual(job.call_count, 2)
+        self.assertEqual(patched_reload.call_count, 2)
+        self.assertFalse(queue.active)
+
+    @override_settings(REMINDER_WAKEUP_RETRY_DELAY=10, REMINDER_WAKEUP_MAX_RETRY_DELAY=15)
+    def test_failures_retried_with_backoff(self):
+        """ Test a failing job or reload doesn't kill the thread, the failed step is retried after a growing delay """
+        job = MagicMock(side_effect=[OperationalError('Database restarting'), OperationalError('Database restarting'), None])
+        waker = DispatchWaker(job, WakeupQueue())
+        reload_errors = [OperationalError('Database restarting')]
+
+        def reload(check_due=False):
+            if reload_errors:
+                raise reload_errors.pop()
+            waker.stop()
+
+        with patch.object(waker, 'reload', side_effect=reload) as patched_reload, patch.object(waker.stopped, 'wait') as patched_wait:
+            with self.assertLogs('reminders.wakeups', level='ERROR') as logs:
+                waker.run()
+
+        self.assertEqual(len(logs.records), 3)
+
+        self.assertEqual(job.call_count, 3)
+        self.assertEqual([args[0] for args, _ in patched_wait.call_args_list], [10, 15, 15])
+        patched_reload.assert_called_with(check_due=True)
+        self.assertFalse(waker.queue.active)
+
+    @override_settings(REMINDER_WAKEUP_POLL_INTERVAL=0)
+    def test_polls_without_notifications(self):
+        """ Test the database is polled when no instant passes within the poll interval """
+        waker = DispatchWaker(MagicMock(), WakeupQueue())
+
+        def reload(check_due=False):
+            if check_due:
+                waker.stop()
+                waker.queue.clear()
+
+        with patch.object(waker, 'reload', side_effect=reload) as patched_reload:
+            waker.run()
+
+        patched_reload.assert_called_with(check_due=True)
+        self.assertEqual(waker.job.call_count, 1)
@@ -1,17 +1,52 @@
-from rest_framework import viewsets, mixins
-from rest_framework.authentication import TokenAuthentication
+from collections import Counter
+from zoneinfo import ZoneInfo
+
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.db.models import Exists, OuterRef, Prefetch
+
+from rest_framework import viewsets, mixins, status
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
 from core.models import Reminder, Tag
 from reminders import serializers
+from reminders.cache import CachedListMixin, batched_list_bumps
+from reminders.export import EXPORT_FORMATS, export_rows
+from reminders.importer import IMPORT_FORMATS, import_reminders, text_lines
+from reminders.pagination import ReminderPagination, TagPagination
+from users.authentication import CachedTokenAuthentication
+
+# Maximum number of items accepted by a single bulk request
+BULK_MAX_ITEMS = 1000
+
 
+def is_id(value):
+    """ Check if a value of a bulk request is a reminder id, JSON booleans are ints in Python but not ids """
+    return type(value) is int
 
-class ReminderViewSet(viewsets.ModelViewSet):
+
+class ReminderViewSet(CachedListMixin, viewsets.ModelViewSet):
     """ View for managing reminders API """
     queryset = Reminder.objects.all()
     # serializer_class = serializers.ReminderSerializer # We use get_serializer_class()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = ReminderPagination
+    list_cache_prefix = 'reminders'
+
+    def initial(self, request, *args, **kwargs):
+        """ Validate reminder dates against the local date of the authenticated user """
+        super().initial(request, *args, **kwargs)
+        timezone.activate(ZoneInfo(request.user.timezone))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        timezone.deactivate()
+        return super().finalize_response(request, response, *args, **kwargs)
 
     def _params_to_ints(self, query_string):
         """ Convert a list of strings to integers """
@@ -20,13 +55,19 @@ class ReminderViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """ Retrieve only reminders of authenticated user """
         tags = self.request.query_params.get('tags')
-        queryset = self.queryset
+        queryset = self.queryset.filter(user=self.request.user)
 
         if tags:
+            # EXISTS doesn't multiply rows like a join, so there is nothing to deduplicate with distinct()
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            tagged = Reminder.tags.through.objects.filter(reminder_id=OuterRef('pk'), tag_id__in=tag_ids)
+            queryset = queryset.filter(Exists(tagged))
 
-        return queryset.filter(user=self.request.user).order_by('-reminder_date').distinct()
+        if self.action == 'list':
+            # Tags of the whole page are fetched with one query instead of one query per reminder
+            queryset = queryset.prefetch_related(Prefetch('tags', queryset=Tag.objects.only('id', 'name')))
+
+        return queryset.order_by('-reminder_date', '-id')
 
     def get_serializer_class(self):
         """ Return the serializer class based on request action """
@@ -38,13 +79,152 @@ class ReminderViewSet(viewsets.ModelViewSet):
         """ Create a new reminder """
         serializer.save(user=self.request.user)
 
+    def perform_update(self, serializer):
+        """ Update a reminder, its owner is the already loaded authenticated user """
+        serializer.save(user=self.request.user)
+
+    def _bulk_items(self):
+        """ Return the list of items of a bulk request """
+        items = self.request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        if len(items) > BULK_MAX_ITEMS:
+            raise ValidationError({'non_field_errors': [f'A bulk request accepts at most {BULK_MAX_ITEMS} items.']})
+        return items
+
+    def _bulk_response(self, results, success_status):
+        """ Return per item results with a status telling if all, some or none of the items succeeded """
+        failed = sum(1 for result in results if 'errors' in result)
+        if not failed:
+            response_status = success_status
+        elif failed == len(results):
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response({'results': results}, status=response_status)
+
+    def _serialized_reminders(self, reminders):
+        """ Serialize reminders by id with their tags fetched in a single query """
+        reminders = Reminder.objects.filter(id__in=[reminder.id for reminder in reminders]).prefetch_related('tags')
+        return {reminder.id: serializers.ReminderDetailSerializer(reminder).data for reminder in reminders}
+
+    @action(methods=['get'], detail=False, url_path='export')
+    def export(self, request):
+        """ Stream all reminders of the user as NDJSON or CSV """
+        # 'format' query param is taken by DRF's content negotiation
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({'output': [f'Choose one of: {", ".join(EXPORT_FORMATS)}.']})
+
+        content_type, lines = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(lines(export_rows(self.get_queryset())), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="reminders.{output}"'
+        # Tell nginx to pass chunks through instead of buffering the whole export
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @action(methods=['post'], detail=False, url_path='import', url_name='import', parser_classes=[MultiPartParser])
+    def import_file(self, request):
+        """ Create reminders from an uploaded CSV or iCalendar file and report errors of the rows by line """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['No file was submitted.']})
+        file_format = upload.name.rpartition('.')[2].lower()
+        if file_format not in IMPORT_FORMATS:
+            raise ValidationError({'file': [f'Supported file extensions: {", ".join(IMPORT_FORMATS)}.']})
+
+        report = import_reminders(request.user, IMPORT_FORMATS[file_format](text_lines(upload.file)))
+
+        if not report['failed']:
+            response_status = status.HTTP_201_CREATED
+        elif not report['created']:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response(report, status=response_status)
+
+    @action(methods=['post', 'patch', 'delete'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """ Create, update or delete many reminders with one request """
+        if request.method == 'POST':
+            return self._bulk_create()
+        if request.method == 'PATCH':
+            return self._bulk_update()
+        return self._bulk_delete()
+
+    def _bulk_create(self):
+        """ Create valid items and report errors of the others """
+        items = self._bulk_items()
+        serializer = self.get_serializer(data=items, many=True)
+        valid, errors = serializer.partition(items)
+
+        with transaction.atomic():
+            reminders = serializer.create([{**data, 'user': self.request.user} for data in valid.values()])
+        created = dict(zip(valid, reminders))
+        serialized = self._serialized_reminders(reminders)
+
+        results = [
+            {'index': index, 'status': status.HTTP_201_CREATED, 'data': serialized[created[index].id]}
+            if index in created else {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': errors[index]}
+            for index in range(len(items))
+        ]
+        return self._bulk_response(results, status.HTTP_201_CREATED)
+
+    def _bulk_update(self):
+        """ Partially update items found by id and report errors of the others """
+        items = self._bulk_items()
+        ids = [item.get('id') for item in items if isinstance(item, dict)]
+        instances = Reminder.objects.filter(user=self.request.user).in_bulk([reminder_id for reminder_id in ids if is_id(reminder_id)])
+        serializer = self.get_serializer(data=items, many=True, partial=True)
+        valid, errors = serializer.partition(items)
+
+        not_found = {index for index in valid if not is_id(items[index].get('id')) or items[index]['id'] not in instances}
+        for index in not_found:
+            del valid[index]
+            errors[index] = {'id': ['Reminder not found.']}
+
+        # Which of the changes of a repeated id should win is unclear, so none of them is applied
+        counts = Counter(reminder_id for reminder_id in ids if is_id(reminder_id))
+        for index in [index for index in valid if counts[items[index]['id']] > 1]:
+            del valid[index]
+            errors[index] = {'id': ['Reminder is repeated in the request.']}
+
+        targets = [instances[items[index]['id']] for index in valid]
+        with transaction.atomic():
+            serializer.update(targets, list(valid.values()))
+        serialized = self._serialized_reminders(targets)
+
+        results = [
+            {'index': index, 'status': status.HTTP_200_OK, 'data': serialized[items[index]['id']]} if index in valid else
+            {'index': index, 'status': status.HTTP_404_NOT_FOUND if index in not_found else status.HTTP_400_BAD_REQUEST, 'errors': errors[index]}
+            for index in range(len(items))
+        ]
+        return self._bulk_response(results, status.HTTP_200_OK)
+
+    def _bulk_delete(self):
+        """ Delete reminders by id and report the ones which couldn't be found """
+        items = self._bulk_items()
+        reminders = Reminder.objects.filter(user=self.request.user, id__in=[item for item in items if is_id(item)])
+        existing = set(reminders.values_list('id', flat=True))
+        with batched_list_bumps():
+            Reminder.objects.filter(id__in=existing).delete()
+
+        results = [
+            {'index': index, 'status': status.HTTP_204_NO_CONTENT}
+            if is_id(item) and item in existing else {'index': index, 'status': status.HTTP_404_NOT_FOUND, 'errors': {'id': ['Reminder not found.']}}
+            for index, item in enumerate(items)
+        ]
+        return self._bulk_response(results, status.HTTP_200_OK)
+
 
-class TagViewSet(mixins.ListModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+class TagViewSet(CachedListMixin, mixins.ListModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
     """ View for managing Tags API """
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = TagPagination
+    list_cache_prefix = 'tags'
 
     def get_queryset(self):
         """ Retrieve only tags of authenticated user """
@@ -53,4 +233,4 @@ class TagViewSet(mixins.ListModelMixin, mixins.UpdateModelMixin, mixins.DestroyM
         if assigned_only:
             queryset = queryset.filter(reminder__isnull=False)
 
-        return queryset.filter(user=self.request.user).order_by('-name').distinct()
+        return queryset.filter(user=self.request.user).order_by('-name', '-id').distinct()
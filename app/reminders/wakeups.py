@@ -0,0 +1,216 @@
+""" Exact-time wake ups of the reminder dispatch """
+import heapq
+import logging
+import select
+import threading
+import time
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections, transaction
+
+from core.dates import LATEST_TIMEZONE, local_dates_range
+from core.models import Reminder
+from reminders.dispatch import due_somewhere
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel web processes notify the scheduler on about dates reminders get notified on
+CHANNEL = 'reminder_wakeups'
+
+# Seconds the listener blocks waiting for a notification before checking whether it has been stopped
+LISTEN_TIMEOUT = 5
+
+
+def day_instant(day):
+    """ Return the timestamp of the first midnight the day starts at, in the easternmost timezone """
+    return datetime(day.year, day.month, day.day, tzinfo=LATEST_TIMEZONE).timestamp()
+
+
+def next_hour_instant(now):
+    """ Return the timestamp of the next full hour, when the next hourly bucket is dispatched """
+    return (int(now) // 3600 + 1) * 3600
+
+
+class WakeupQueue:
+    """ Min-heap of instants the dispatch has to run at, waking up the waiting thread when an instant is pushed """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        # Set by the waker consuming the queue, other processes only notify the scheduler
+        self.active = False
+        self._heap = []
+        self._changed = threading.Condition()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, instant):
+        with self._changed:
+            # Instants are local midnights, so the heap holds at most one entry per upcoming day
+            if instant not in self._heap:
+                heapq.heappush(self._heap, instant)
+                self._changed.notify_all()
+
+    def next_instant(self):
+        with self._changed:
+            return self._heap[0] if self._heap else None
+
+    def clear(self):
+        with self._changed:
+            self._heap.clear()
+
+    def wait_due(self, max_sleep):
+        """ Sleep until the earliest instant, but at most max_sleep seconds, return whether any instant has passed and pop them """
+        deadline = self.clock() + max_sleep
+        with self._changed:
+            while True:
+                now = self.clock()
+                if self._heap and self._heap[0] <= now:
+                    while self._heap and self._heap[0] <= now:
+                        heapq.heappop(self._heap)
+                    return True
+                if now >= deadline:
+                    return False
+                until = min(self._heap[0], deadline) if self._heap else deadline
+                self._changed.wait(until - now)
+
+
+wakeup_queue = WakeupQueue()
+
+
+def publish(days):
+    """ Wake the dispatch up at the days reminders get notified on, once the current transaction commits """
+    days = {day for day in days if day is not None}
+    if not days:
+        return
+
+    def notify():
+        if wakeup_queue.active:
+            for day in days:
+                wakeup_queue.push(day_instant(day))
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for day in days:
+                    cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, day.isoformat()])
+
+    transaction.on_commit(notify)
+
+
+def upcoming_days(after, limit):
+    """ Return the next dates reminders get notified on after the given one, read from the dispatch index """
+    return list(
+        Reminder.objects
+        .filter(next_notification_at__gt=after)
+        .order_by('next_notification_at')
+        .values_list('next_notification_at', flat=True)
+        .distinct()[:limit]
+    )
+
+
+def listen(queue, stopped):
+    """ Push days notified by web processes until stopped, over a dedicated Postgres connection """
+    wrapper = connections['default']
+    listener = wrapper.get_new_connection(wrapper.get_connection_params())
+    listener.autocommit = True
+    try:
+        with listener.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        while not stopped.is_set():
+            if not select.select([listener], [], [], LISTEN_TIMEOUT)[0]:
+                continue
+            listener.poll()
+            while listener.notifies:
+                queue.push(day_instant(date.fromisoformat(listener.notifies.pop(0).payload)))
+    finally:
+        listener.close()
+
+
+class DispatchWaker(threading.Thread):
+    """
+    Run the dispatch job when reminders become due, instead of polling for them.
+    The next upcoming days are loaded from the database in batches, further ones are loaded after each run.
+    While reminders are due on some local date, the job runs every hour, sending emails of the users whose send hour has come.
+    Changes are pushed by web processes over Postgres LISTEN/NOTIFY, other databases are polled.
+    Deleted reminders are not removed from the queue, at worst they cause a dispatch run with nothing to send.
+    Failed runs are logged and retried with a growing delay.
+    """
+
+    def __init__(self, job, queue=None):
+        super().__init__(name='reminder-wakeups', daemon=True)
+        self.job = job
+        self.queue = queue if queue is not None else wakeup_queue
+        self.stopped = threading.Event()
+        self.listener = None
+
+    def stop(self):
+        self.stopped.set()
+        # Wake the thread up, the instant is dropped with the queue
+        self.queue.push(self.queue.clock())
+
+    def listening(self):
+        return self.listener is not None and self.listener.is_alive()
+
+    def start_listener(self):
+        if connection.vendor == 'postgresql':
+            self.listener = threading.Thread(target=listen, args=[self.queue, self.stopped], name='reminder-wakeups-listener', daemon=True)
+            self.listener.start()
+
+    def reload(self, check_due=False):
+        """
+        Replace the queue with the next upcoming days, and with the next hour while reminders are due somewhere.
+        With check_due, due reminders are dispatched at once, e.g. when they have been found by polling.
+        """
+        close_old_connections()
+        now = self.queue.clock()
+        moment = datetime.fromtimestamp(now, dt_timezone.utc)
+        _, latest_today = local_dates_range(moment)
+        # Cleared before reading, so days notified meanwhile aren't lost
+        self.queue.clear()
+        try:
+            days = upcoming_days(latest_today, settings.REMINDER_WAKEUP_BATCH_SIZE)
+            # Reminders stay due until the day ends in the westernmost timezone, not only on the latest local date
+            due = due_somewhere(moment)
+        finally:
+            close_old_connections()
+
+        for day in days:
+            self.queue.push(day_instant(day))
+        if due:
+            self.queue.push(now if check_due else next_hour_instant(now))
+
+    def retry_delay(self, failures):
+        """ Return seconds to wait before retrying after the given number of consecutive failures """
+        return min(settings.REMINDER_WAKEUP_RETRY_DELAY * 2 ** (failures - 1), settings.REMINDER_WAKEUP_MAX_RETRY_DELAY)
+
+    def run(self):
+        self.queue.active = True
+        self.start_listener()
+        failures = 0
+        # Catch up with reminders which became due while no scheduler was running
+        due = True
+
+        try:
+            while not self.stopped.is_set():
+                try:
+                    if due:
+                        self.job()
+                        due = False
+                        # Dispatch moves reminders to their next dates with bulk updates, which don't send signals
+                        self.reload()
+                    else:
+                        # Without notifications, changes made by other processes are only found by polling
+                        self.reload(check_due=True)
+                except Exception:
+                    # E.g. the database restarting, the thread must not die while the process holds leadership
+                    failures += 1
+                    delay = self.retry_delay(failures)
+                    logger.exception('Reminder dispatch failed, retrying in %s seconds.', delay)
+                    self.stopped.wait(delay)
+                    continue
+                failures = 0
+
+                max_sleep = settings.REMINDER_WAKEUP_MAX_SLEEP if self.listening() else settings.REMINDER_WAKEUP_POLL_INTERVAL
+                due = self.queue.wait_due(max_sleep)
+        finally:
+            self.queue.active = False
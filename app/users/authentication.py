@@ -0,0 +1,128 @@
+""" Token authentication with cached token lookups """
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+class TokenCache:
+    """ Bounded least recently used cache of tokens by key, with entries expiring after a time to live """
+
+    def __init__(self, max_size, ttl, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """ Return a copy of the cached token with its user, or None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            pickled, _, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # Requests may modify their user, e.g. changing the password, so each one gets its own instance
+        return pickle.loads(pickled)
+
+    def set(self, key, token):
+        """ Cache the token, evicting the least recently used one when full """
+        pickled = pickle.dumps(token)
+        with self._lock:
+            self._entries[key] = (pickled, token.user_id, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_user(self, user_id):
+        """ Remove all tokens of the user """
+        with self._lock:
+            for key in [key for key, (_, token_user_id, _) in self._entries.items() if token_user_id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL)
+
+
+def shared_cache():
+    """ Return the cache shared between processes, or None when only the process memory is used """
+    alias = settings.AUTH_TOKEN_SHARED_CACHE
+    return caches[alias] if alias else None
+
+
+def shared_key(key):
+    # Raw tokens are credentials, they are not stored in the cache as keys
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_token(key):
+    """ Remove the token from every cache tier """
+    token_cache.discard(key)
+    shared = shared_cache()
+    if shared is not None:
+        shared.delete(shared_key(key))
+
+
+def token_expires_at(token):
+    """ Return the time the access token stops being valid """
+    return token.created + timedelta(seconds=settings.AUTH_TOKEN_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication resolving tokens from process memory, then from the optional shared cache, then from the database.
+    Entries are invalidated when the user is saved or deleted, other processes drop theirs after AUTH_TOKEN_CACHE_TTL.
+    Tokens older than AUTH_TOKEN_TTL are rejected and have to be renewed with a refresh token.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            token = self.shared_token(key)
+        if token is None:
+            _, token = super().authenticate_credentials(key)
+            self.cache_token(key, token)
+
+        if token_expires_at(token) <= timezone.now():
+            raise AuthenticationFailed('Token has expired.')
+        return token.user, token
+
+    def shared_token(self, key):
+        """ Return the token from the shared cache, keeping it in process memory as well """
+        shared = shared_cache()
+        if shared is None:
+            return None
+        token = shared.get(shared_key(key))
+        if token is not None:
+            token_cache.set(key, token)
+        return token
+
+    def cache_token(self, key, token):
+        token_cache.set(key, token)
+        shared = shared_cache()
+        if shared is not None:
+            shared.set(shared_key(key), token, timeout=settings.AUTH_TOKEN_CACHE_TTL)
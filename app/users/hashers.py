@@ -0,0 +1,78 @@
+""" Password hashers with the cost configured in settings, computing hashes in a bounded thread pool """
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    """ Raised when no hashing thread became free in time, answered with 429 by the API views """
+
+
+def get_pool():
+    """
+    Return the hashing thread pool of the process with a semaphore of its free threads,
+    created on first use, e.g. after uwsgi has forked workers
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_THREADS, thread_name_prefix='password-hash')
+            _pool = executor, threading.BoundedSemaphore(settings.PASSWORD_HASH_THREADS)
+        return _pool
+
+
+def offload(func, *args):
+    """
+    Run a CPU bound hash function in the thread pool and wait for its result.
+    The calling thread is blocked until the hash has been computed, so a sync uwsgi worker isn't freed meanwhile,
+    the pool only bounds the number of concurrent hashes of the process and the memory of memory-hard ones.
+    PASSWORD_HASH_TIMEOUT limits waiting for a free hashing thread, not computing the hash.
+    """
+    if not settings.PASSWORD_HASH_THREADS:
+        return func(*args)
+
+    executor, free_threads = get_pool()
+    if not free_threads.acquire(timeout=settings.PASSWORD_HASH_TIMEOUT):
+        raise HashingBusy('Too many password checks at once.')
+    try:
+        return executor.submit(func, *args).result()
+    finally:
+        free_threads.release()
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """ Memory-hard scrypt hasher, verify() is computed by encode() """
+    work_factor = settings.PASSWORD_SCRYPT_WORK_FACTOR
+    block_size = settings.PASSWORD_SCRYPT_BLOCK_SIZE
+    parallelism = settings.PASSWORD_SCRYPT_PARALLELISM
+    # OpenSSL refuses more than 32MB by default, which is exceeded by work factors from 2 ** 15
+    maxmem = settings.PASSWORD_SCRYPT_MAXMEM
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        return offload(super().encode, password, salt, n, r, p)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """ Memory-hard Argon2 hasher """
+    time_cost = settings.PASSWORD_ARGON2_TIME_COST
+    memory_cost = settings.PASSWORD_ARGON2_MEMORY_COST
+    parallelism = settings.PASSWORD_ARGON2_PARALLELISM
+
+    def encode(self, password, salt):
+        return offload(super().encode, password, salt)
+
+    def verify(self, password, encoded):
+        return offload(super().verify, password, encoded)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """ PBKDF2 hasher, still verifying hashes of users who haven't logged in since the switch """
+    iterations = settings.PASSWORD_PBKDF2_ITERATIONS
+
+    def encode(self, password, salt, iterations=None):
+        return offload(super().encode, password, salt, iterations)
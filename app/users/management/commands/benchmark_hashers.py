@@ -0,0 +1,50 @@
+""" Django command to measure the latency of configured password hashers """
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+
+PASSWORD = 'Benchmark1234'
+
+
+class Command(BaseCommand):
+    """ Django command timing hashing and verifying a password with each hasher of PASSWORD_HASHERS """
+
+    def add_arguments(self, parser):
+        """ Add number of rounds and concurrent requests """
+        parser.add_argument('--rounds', type=int, default=10, help="Number of hashes timed for each hasher.")
+        parser.add_argument('--concurrency', type=int, default=1, help="Number of threads verifying passwords at once, like request threads of a worker.")
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command """
+        rounds, concurrency = options['rounds'], options['concurrency']
+
+        for hasher in get_hashers():
+            try:
+                encoded = hasher.encode(PASSWORD, hasher.salt())
+            except ValueError as error:
+                # e.g. a missing optional library
+                self.stdout.write(self.style.WARNING(f'{hasher.algorithm}: skipped, {error}'))
+                continue
+
+            latencies = []
+
+            def verify():
+                started = time.perf_counter()
+                hasher.verify(PASSWORD, encoded)
+                latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for _ in range(rounds):
+                    executor.submit(verify)
+            elapsed = time.perf_counter() - started
+
+            params = ', '.join(f'{name}={value}' for name, value in hasher.safe_summary(encoded).items() if name not in ('algorithm', 'salt', 'hash'))
+            p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+            self.stdout.write(
+                f'{hasher.algorithm} ({params}): mean {statistics.mean(latencies) * 1000:.1f}ms, '
+                f'p95 {p95 * 1000:.1f}ms, {rounds / elapsed:.1f} verifications/s with {concurrency} threads.'
+            )
@@ -0,0 +1,41 @@
+""" Django command to measure the throughput of password validators """
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.password_validation import get_default_password_validators, validate_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+
+# Passwords passing all rules, failing them early, and long ones
+PASSWORDS = ['Test1234', 'password', 'A' + 'b' * 62 + '1', 'x' * 128]
+
+
+class Command(BaseCommand):
+    """ Django command timing each configured password validator and the whole pipeline """
+
+    def add_arguments(self, parser):
+        """ Add number of validations """
+        parser.add_argument('--iterations', type=int, default=20_000, help="Number of validations of each password.")
+
+    def time_validation(self, validate, iterations):
+        """ Return validations per second of the function """
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for password in PASSWORDS:
+                try:
+                    validate(password)
+                except ValidationError:
+                    pass
+        return iterations * len(PASSWORDS) / (time.perf_counter() - started)
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command """
+        iterations = options['iterations']
+        user = get_user_model()(email='benchmark@example.com', name='Benchmark User')
+
+        for validator in get_default_password_validators():
+            rate = self.time_validation(lambda password: validator.validate(password, user), iterations)
+            self.stdout.write(f'{type(validator).__name__}: {rate:,.0f} validations/s')
+
+        rate = self.time_validation(lambda password: validate_password(password, user), iterations)
+        self.stdout.write(self.style.SUCCESS(f'Whole pipeline: {rate:,.0f} validations/s'))
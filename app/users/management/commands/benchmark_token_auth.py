@@ -0,0 +1,65 @@
+""" Django command to compare database queries of plain and cached token authentication """
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from users.authentication import CachedTokenAuthentication, token_cache
+
+
+class Rollback(Exception):
+    """ Raised to roll the benchmark user back """
+
+
+class QueryCounter:
+    """ Database execute wrapper counting queries, without the size limit of the debug queries log """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    """ Django command authenticating the same token many times with each authentication class """
+
+    def add_arguments(self, parser):
+        """ Add number of authenticated requests """
+        parser.add_argument('--requests', type=int, default=10_000, help="Number of authenticated requests.")
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command """
+        try:
+            with transaction.atomic():
+                self.run_benchmark(options['requests'])
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Benchmark user has been rolled back.')
+
+    def run_benchmark(self, requests):
+        """ Authenticate requests with both classes and report queries and time per request """
+        user = get_user_model().objects.create_user(email='benchmark@example.com', password='Benchmark1234', name='Benchmark User')
+        token = Token.objects.create(user=user)
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {token.key}')
+        token_cache.discard(token.key)
+
+        for authentication in [TokenAuthentication(), CachedTokenAuthentication()]:
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                started = time.perf_counter()
+                for _ in range(requests):
+                    authentication.authenticate(request)
+                elapsed = time.perf_counter() - started
+
+            self.stdout.write(
+                f'{type(authentication).__name__}: {queries.count / requests:.4f} queries '
+                f'and {elapsed / requests * 1_000_000:.1f}us per request.'
+            )
+        token_cache.discard(token.key)
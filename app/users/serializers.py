@@ -5,6 +5,8 @@ from django.core.exceptions import ValidationError
 
 from rest_framework import serializers
 
+from users.tokens import refresh_tokens
+
 
 def validate_passwords(password, password_confirm):
     """ Validate passwords are the same, and password meets requirements """
@@ -96,12 +98,26 @@ class ChangePasswordSerializer(serializers.Serializer):
         return instance
 
 
+class RefreshTokenSerializer(serializers.Serializer):
+    """ Serializer renewing tokens with a refresh token """
+    refresh_token = serializers.CharField(trim_whitespace=False)
+
+    def validate(self, data):
+        """ Exchange the refresh token for new tokens """
+        tokens = refresh_tokens(data['refresh_token'])
+        if tokens is None:
+            raise serializers.ValidationError('Refresh token is invalid or has expired.', code='authorization')
+
+        data['tokens'] = tokens
+        return data
+
+
 class ManageUserSerializer(serializers.ModelSerializer):
     """ Serializer for changing safe User fields, don't use it for passwords """
 
     class Meta:
         model = get_user_model()
-        fields = ['email', 'name']
+        fields = ['email', 'name', 'digest_emails', 'timezone', 'send_hour']
 
 
 class DeleteMeSerializer(serializers.Serializer):
@@ -110,8 +126,7 @@ class DeleteMeSerializer(serializers.Serializer):
 
     def validate_password(self, value):
         """ Check if user's password is correct """
-        user = self.context['request'].user
-        if user.check_password(value) is False:
+        if self.instance.check_password(value) is False:
             raise ValidationError('Incorrect password. Please try again.')
 
         return value
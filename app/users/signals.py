@@ -0,0 +1,35 @@
+""" Signal receivers invalidating cached tokens and revoking tokens of users """
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from users.authentication import invalidate_token, shared_cache, token_cache
+from users.tokens import revoke_tokens
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, created=False, **kwargs):
+    """ Drop cached tokens of a user who has changed the password, been deactivated, updated or deleted """
+    if created:
+        return
+    token_cache.discard_user(instance.pk)
+    if shared_cache() is not None:
+        for key in Token.objects.filter(user_id=instance.pk).values_list('key', flat=True):
+            invalidate_token(key)
+
+
+@receiver(post_save, sender=get_user_model())
+def revoke_user_tokens(sender, instance, created, **kwargs):
+    """ Sign out all clients of a user who has changed the password or been deactivated, refresh tokens included """
+    # set_password() keeps the raw password until the user is saved, unlike the upgrade of the hash on login
+    if not created and (instance._password is not None or not instance.is_active):
+        revoke_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """ Drop a revoked token, also when it is deleted together with its user """
+    invalidate_token(instance.key)
@@ -0,0 +1,214 @@
+""" Tests for cached token authentication """
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users.authentication import TokenCache, token_cache
+
+ME_URL = reverse('users:me')
+CHANGE_PASSWORD_URL = reverse('users:change_password')
+DELETE_ME_URL = reverse('users:delete_me')
+REMINDERS_URL = reverse('reminders:reminders-list')
+
+
+class FakeClock:
+    """ Clock moved forward by tests """
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenCacheTests(TestCase):
+    """ Test the bounded token cache """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='test@example.com', password='Test1234')
+        self.token = Token.objects.create(user=self.user)
+
+    def test_returns_copies(self):
+        """ Test changes of a returned user don't affect the cached one """
+        cache = TokenCache(max_size=10, ttl=60)
+        cache.set('key', self.token)
+
+        cache.get('key').user.name = 'Changed'
+
+        self.assertEqual(cache.get('key').user.name, '')
+
+    def test_entries_expire(self):
+        """ Test entries are dropped after their time to live """
+        clock = FakeClock()
+        cache = TokenCache(max_size=10, ttl=60, clock=clock)
+        cache.set('key', self.token)
+
+        clock.now = 59
+        self.assertIsNotNone(cache.get('key'))
+        clock.now = 60
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_evicted(self):
+        """ Test the cache doesn't grow over its size, evicting the least recently used entry """
+        cache = TokenCache(max_size=2, ttl=60)
+        cache.set('first', self.token)
+        cache.set('second', self.token)
+        cache.get('first')
+
+        cache.set('third', self.token)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('second'))
+        self.assertIsNotNone(cache.get('first'))
+
+    def test_discard_user(self):
+        """ Test all tokens of a user can be dropped at once """
+        cache = TokenCache(max_size=10, ttl=60)
+        cache.set('first', self.token)
+        cache.set('second', self.token)
+
+        cache.discard_user(self.user.id)
+
+        self.assertEqual(len(cache), 0)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """ Test requests authenticated with cached tokens """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='test@example.com', password='Test1234', name='Test')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_resolved_once(self):
+        """ Test only the first request looks the token up in the database """
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_invalid_token_rejected(self):
+        """ Test unknown tokens are still rejected """
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """ Test a cached user who has been deactivated can't authenticate """
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidates(self):
+        """ Test a cached token stops working after changing the password """
+        self.client.get(ME_URL)
+
+        payload = {'password': 'NewPassword1234', 'password_confirm': 'NewPassword1234'}
+        res = self.client.patch(CHANGE_PASSWORD_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def stale_cache(self, **changes):
+        """ Cache the token, then change the user as another worker would, without invalidating this worker's cache """
+        self.client.get(ME_URL)
+        get_user_model().objects.filter(id=self.user.id).update(**changes)
+        self.assertIsNotNone(token_cache.get(self.token.key))
+
+    def test_stale_user_password_not_reverted(self):
+        """ Test updating the user through a stale cached copy doesn't write the old password hash back """
+        new_hash = make_password('NewPassword1234')
+        self.stale_cache(password=new_hash)
+
+        res = self.client.patch(ME_URL, {'name': 'Updated'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, new_hash)
+        self.assertEqual(self.user.name, 'Updated')
+
+    def test_stale_user_not_reactivated(self):
+        """ Test a user deactivated through another worker can't write a cached active copy back """
+        self.stale_cache(is_active=False)
+
+        res = self.client.patch(ME_URL, {'name': 'Updated'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(self.user.name, 'Test')
+
+    def test_revoked_token_cannot_write(self):
+        """ Test a token revoked through another worker can't change the user while it is still cached """
+        self.client.get(ME_URL)
+        Token.objects.filter(key=self.token.key).delete()
+        token_cache.set(self.token.key, self.token)
+
+        res = self.client.patch(ME_URL, {'name': 'Updated'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Test')
+
+    def test_delete_me_invalidates(self):
+        """ Test the token of a deleted user stops working at once """
+        self.client.get(ME_URL)
+
+        res = self.client.delete(DELETE_ME_URL, {'password': 'Test1234'})
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.assertEqual(self.client.get(REMINDERS_URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoked_token_rejected(self):
+        """ Test a deleted token stops working at once """
+        self.client.get(ME_URL)
+
+        self.token.delete()
+
+        self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_TOKEN_SHARED_CACHE='default')
+    def test_shared_cache(self):
+        """ Test a token cached by another process is resolved without the database """
+        self.client.get(ME_URL)
+        # As seen by another process with an empty memory cache
+        token_cache.clear()
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.user.is_active = False
+        self.user.save()
+        token_cache.clear()
+        self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_401_UNAUTHORIZED)
+        caches['default'].clear()
+
+    def test_benchmark_token_auth_command(self):
+        """ Test the benchmark reports queries per request of both classes """
+        out = StringIO()
+        call_command('benchmark_token_auth', '--requests', '20', stdout=out)
+
+        self.assertIn('TokenAuthentication: 1.0000 queries', out.getvalue())
+        self.assertIn('CachedTokenAuthentication: 0.0500 queries', out.getvalue())
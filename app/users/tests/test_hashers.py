@@ -0,0 +1,111 @@
+""" Tests for the password hasher policy """
+import threading
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from users.hashers import HashingBusy, TunedScryptPasswordHasher, offload
+
+TOKEN_URL = reverse('users:token')
+
+
+class HasherPolicyTests(TestCase):
+    """ Test new hashes and upgrades of old ones """
+
+    def test_new_passwords_hashed_with_preferred_hasher(self):
+        """ Test passwords are hashed with scrypt by default """
+        user = get_user_model().objects.create_user(email='test@example.com', password='Test1234')
+
+        self.assertEqual(identify_hasher(user.password).algorithm, 'scrypt')
+
+    def test_old_hash_upgraded_on_login(self):
+        """ Test a PBKDF2 hash is replaced by the preferred hasher when the user logs in """
+        user = get_user_model().objects.create_user(email='test@example.com')
+        user.password = make_password('Test1234', hasher='pbkdf2_sha256')
+        user.save()
+
+        res = APIClient().post(TOKEN_URL, {'email': 'test@example.com', 'password': 'Test1234'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertEqual(identify_hasher(user.password).algorithm, 'scrypt')
+        self.assertTrue(user.check_password('Test1234'))
+
+    def test_hash_upgraded_after_cost_change(self):
+        """ Test a hash computed with a lower cost is recomputed on login """
+        user = get_user_model().objects.create_user(email='test@example.com', password='Test1234')
+
+        with patch.object(TunedScryptPasswordHasher, 'work_factor', 2 ** 15):
+            APIClient().post(TOKEN_URL, {'email': 'test@example.com', 'password': 'Test1234'})
+
+        user.refresh_from_db()
+        self.assertEqual(TunedScryptPasswordHasher().decode(user.password)['work_factor'], 2 ** 15)
+
+
+class OffloadTests(TestCase):
+    """ Test hashes computed in the thread pool """
+
+    def test_offload_runs_in_pool(self):
+        """ Test hash functions run in a pool thread """
+        self.assertTrue(offload(lambda: threading.current_thread().name).startswith('password-hash'))
+
+    @override_settings(PASSWORD_HASH_THREADS=0)
+    def test_offload_disabled(self):
+        """ Test hashes are computed in the calling thread when there are no hashing threads """
+        self.assertEqual(offload(lambda: threading.current_thread()), threading.current_thread())
+
+    @override_settings(PASSWORD_HASH_TIMEOUT=0.01)
+    def test_busy_pool(self):
+        """ Test waiting too long for a free hashing thread raises an error """
+        release = threading.Event()
+        started = threading.Barrier(settings.PASSWORD_HASH_THREADS + 1)
+
+        def hash_until_released():
+            started.wait()
+            release.wait(5)
+
+        busy = [threading.Thread(target=offload, args=[hash_until_released]) for _ in range(settings.PASSWORD_HASH_THREADS)]
+        for thread in busy:
+            thread.start()
+        started.wait(5)
+        try:
+            with self.assertRaises(HashingBusy):
+                offload(lambda: None)
+        finally:
+            release.set()
+            for thread in busy:
+                thread.join()
+
+    @override_settings(PASSWORD_HASH_TIMEOUT=0.01)
+    def test_timeout_excludes_hashing(self):
+        """ Test a hash taking longer than the timeout isn't interrupted, only waiting for a thread is limited """
+        self.assertEqual(offload(lambda: time.sleep(0.05) or 'hash'), 'hash')
+
+    def test_busy_pool_answered_with_429(self):
+        """ Test the token endpoint answers 429 when hashing is overloaded """
+        get_user_model().objects.create_user(email='test@example.com', password='Test1234')
+
+        with patch('users.hashers.offload', side_effect=HashingBusy('Too many password checks at once.')):
+            res = APIClient().post(TOKEN_URL, {'email': 'test@example.com', 'password': 'Test1234'})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_benchmark_hashers_command(self):
+        """ Test the benchmark reports the latency of available hashers """
+        out = StringIO()
+
+        with patch.object(TunedScryptPasswordHasher, 'work_factor', 2 ** 10):
+            call_command('benchmark_hashers', '--rounds', '2', '--concurrency', '2', stdout=out)
+
+        self.assertIn('scrypt (work factor=1024', out.getvalue())
+        self.assertIn('verifications/s with 2 threads', out.getvalue())
@@ -0,0 +1,171 @@
+""" Tests for expiring access tokens and refresh tokens """
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import RefreshToken
+from users.tokens import hash_refresh_token, purge_expired_tokens
+
+TOKEN_URL = reverse('users:token')
+REFRESH_URL = reverse('users:token_refresh')
+ME_URL = reverse('users:me')
+
+
+def age_token(key, seconds):
+    """ Move creation of the access token back in time """
+    Token.objects.filter(key=key).update(created=timezone.now() - timedelta(seconds=seconds))
+
+
+class TokenAPITests(TestCase):
+    """ Test issuing and renewing tokens """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='test@example.com', password='Test1234')
+        self.client = APIClient()
+        self.tokens = self.client.post(TOKEN_URL, {'email': 'test@example.com', 'password': 'Test1234'}).data
+
+    def get_me(self, key):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        return self.client.get(ME_URL)
+
+    def test_login_returns_refresh_token(self):
+        """ Test logging in returns an expiring access token and a refresh token stored as a hash """
+        self.assertIn('token', self.tokens)
+        self.assertIn('expires_at', self.tokens)
+        self.assertTrue(RefreshToken.objects.filter(user=self.user, key_hash=hash_refresh_token(self.tokens['refresh_token'])).exists())
+        self.assertFalse(RefreshToken.objects.filter(key_hash=self.tokens['refresh_token']).exists())
+
+    @override_settings(AUTH_TOKEN_TTL=60)
+    def test_expired_token_rejected(self):
+        """ Test an access token stops working after its time to live, also when cached """
+        self.assertEqual(self.get_me(self.tokens['token']).status_code, status.HTTP_200_OK)
+
+        with patch('users.authentication.timezone.now', return_value=timezone.now() + timedelta(seconds=61)):
+            res = self.get_me(self.tokens['token'])
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_without_password(self):
+        """ Test tokens are renewed without checking the password, a fresh access token is kept without being extended """
+        age_token(self.tokens['token'], 60)
+
+        with patch('users.hashers.offload') as offload:
+            res = self.client.post(REFRESH_URL, {'refresh_token': self.tokens['refresh_token']})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        offload.assert_not_called()
+        self.assertEqual(res.data['token'], self.tokens['token'])
+        self.assertLess(res.data['expires_at'], self.tokens['expires_at'])
+        self.assertEqual(self.get_me(res.data['token']).status_code, status.HTTP_200_OK)
+
+    @override_settings(AUTH_TOKEN_TTL=60)
+    def test_refresh_replaces_stale_token(self):
+        """ Test an access token past half of its time to live is replaced with a new key """
+        age_token(self.tokens['token'], 40)
+
+        res = self.client.post(REFRESH_URL, {'refresh_token': self.tokens['refresh_token']})
+
+        self.assertNotEqual(res.data['token'], self.tokens['token'])
+        self.assertEqual(self.get_me(self.tokens['token']).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_TOKEN_TTL=60)
+    def test_login_issues_new_key(self):
+        """ Test logging in again replaces the access token, so a leaked key expires even while the user keeps logging in """
+        age_token(self.tokens['token'], 50)
+
+        res = self.client.post(TOKEN_URL, {'email': 'test@example.com', 'password': 'Test1234'})
+
+        self.assertNotEqual(res.data['token'], self.tokens['token'])
+        self.assertFalse(Token.objects.filter(key=self.tokens['token']).exists())
+        self.assertEqual(self.get_me(self.tokens['token']).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.get_me(res.data['token']).status_code, status.HTTP_200_OK)
+
+    @override_settings(AUTH_TOKEN_TTL=60)
+    def test_refresh_replaces_expired_token(self):
+        """ Test an expired access token is replaced with a new key """
+        age_token(self.tokens['token'], 120)
+
+        res = self.client.post(REFRESH_URL, {'refresh_token': self.tokens['refresh_token']})
+
+        self.assertNotEqual(res.data['token'], self.tokens['token'])
+        self.assertEqual(self.get_me(res.data['token']).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_me(self.tokens['token']).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_token_used_once(self):
+        """ Test a refresh token is rotated and can't be used again """
+        res = self.client.post(REFRESH_URL, {'refresh_token': self.tokens['refresh_token']})
+        self.assertNotEqual(res.data['refresh_token'], self.tokens['refresh_token'])
+
+        res = self.client.post(REFRESH_URL, {'refresh_token': self.tokens['refresh_token']})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_refresh_token_rejected(self):
+        """ Test an expired refresh token can't renew tokens """
+        RefreshToken.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        res = self.client.post(REFRESH_URL, {'refresh_token': self.tokens['refresh_token']})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_refresh_token_of_inactive_user_rejected(self):
+        """ Test deactivating a user revokes their access and refresh tokens """
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.post(REFRESH_URL, {'refresh_token': self.tokens['refresh_token']})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        self.assertFalse(RefreshToken.objects.filter(user=self.user).exists())
+
+    def test_password_change_revokes_tokens(self):
+        """ Test a refresh token stolen before the password has been changed can't renew tokens """
+        self.user.set_password('NewPassword1234')
+        self.user.save()
+
+        res = self.client.post(REFRESH_URL, {'refresh_token': self.tokens['refresh_token']})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.get_me(self.tokens['token']).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_update_keeps_tokens(self):
+        """ Test saving the user without changing the password, e.g. upgrading its hash on login, keeps tokens """
+        self.user.name = 'Updated'
+        self.user.password = make_password('Test1234', hasher='pbkdf2_sha256')
+        self.user.save()
+        self.assertTrue(self.user.check_password('Test1234'))
+        self.assertEqual(identify_hasher(self.user.password).algorithm, 'scrypt')
+
+        res = self.client.post(REFRESH_URL, {'refresh_token': self.tokens['refresh_token']})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class PurgeExpiredTokensTests(TestCase):
+    """ Test the clean up of expired tokens """
+
+    @override_settings(AUTH_TOKEN_TTL=60)
+    def test_purge_in_batches(self):
+        """ Test only expired tokens are deleted, in batches """
+        now = timezone.now()
+        users = [get_user_model().objects.create_user(email=f'user{number}@example.com') for number in range(5)]
+        for number, user in enumerate(users):
+            token = Token.objects.create(user=user)
+            age_token(token.key, 120 if number < 3 else 0)
+            RefreshToken.objects.create(user=user, key_hash=f'hash{number}', expires_at=now + timedelta(days=1 if number % 2 else -1))
+
+        access_count, refresh_count = purge_expired_tokens(batch_size=2)
+
+        self.assertEqual((access_count, refresh_count), (3, 3))
+        self.assertEqual(Token.objects.count(), 2)
+        self.assertEqual(RefreshToken.objects.count(), 2)
@@ -1,4 +1,7 @@
 """ Tests for the users API """
+import threading
+from unittest.mock import patch
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
@@ -7,6 +10,8 @@ from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.models import EmailOutbox
+
 CREATE_USER_URL = reverse('users:register')
 TOKEN_URL = reverse('users:token')
 ME_URL = reverse('users:me')
@@ -42,6 +47,53 @@ class PublicUsersAPITests(TestCase):
         self.assertNotIn('password', res.data)
         self.assertNotIn('password_confirm', res.data)
 
+    def test_create_user_queues_welcome_email(self):
+        """ Test registering a user puts a welcome email into the outbox """
+        payload = {
+            'email': 'testuser@example.com',
+            'password': 'Test1234',
+            'password_confirm': 'Test1234',
+            'name': 'Test Name'
+        }
+
+        res = self.client.post(CREATE_USER_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        entry = EmailOutbox.objects.get()
+        self.assertEqual(entry.to, payload['email'])
+        self.assertEqual(entry.status, 'pending')
+
+    @patch('core.outbox.deliver_outbox')
+    def test_create_user_returns_before_welcome_email_delivered(self, patched_deliver):
+        """ Test registration doesn't wait for the welcome email to be delivered """
+        started = threading.Event()
+        release = threading.Event()
+        delivered = threading.Event()
+
+        def slow_delivery(**kwargs):
+            started.set()
+            release.wait(5)
+            delivered.set()
+
+        patched_deliver.side_effect = slow_delivery
+        payload = {
+            'email': 'testuser@example.com',
+            'password': 'Test1234',
+            'password_confirm': 'Test1234',
+            'name': 'Test Name'
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(CREATE_USER_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(started.wait(5))
+        self.assertFalse(delivered.is_set())
+
+        release.set()
+        self.assertTrue(delivered.wait(5))
+        patched_deliver.assert_called_once_with(ids=[EmailOutbox.objects.get().id])
+
     def test_user_with_email_exists_error(self):
         """ Test an error returned if user with email exists """
         payload = {
@@ -150,6 +202,29 @@ class PrivateUsersAPITests(TestCase):
         self.assertEqual(payload['name'], self.user.name)
         self.assertNotIn('password', res.data)
 
+    def test_enable_digest_emails(self):
+        """ Test the user can opt in to digest emails """
+        res = self.client.patch(ME_URL, {'digest_emails': True})
+        self.user.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.user.digest_emails)
+
+    def test_update_timezone_and_send_hour(self):
+        """ Test the user can set the timezone and the hour reminder emails are sent from """
+        res = self.client.patch(ME_URL, {'timezone': 'Asia/Tokyo', 'send_hour': 9})
+        self.user.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual((self.user.timezone, self.user.send_hour), ('Asia/Tokyo', 9))
+
+    def test_invalid_timezone_and_send_hour_rejected(self):
+        """ Test unknown timezones and hours outside of a day are rejected """
+        for payload in [{'timezone': 'Mars/Olympus'}, {'send_hour': 24}]:
+            res = self.client.patch(ME_URL, payload)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_change_password(self):
         """ Test changing passwords works and no password in response """
         newpass = 'NewPassTest12345'
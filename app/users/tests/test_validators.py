@@ -0,0 +1,74 @@
+""" Tests for password validators """
+from io import StringIO
+
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from users.validators import AtLeastOneCapitalLetterCustomValidator, NumericInPasswordCustomValidator, PasswordRulesValidator
+
+
+def error_codes(validator, password):
+    """ Return codes of errors raised by the validator """
+    try:
+        validator.validate(password)
+    except ValidationError as error:
+        return [item.code for item in error.error_list]
+    return []
+
+
+class PasswordRulesValidatorTests(SimpleTestCase):
+    """ Test checking all character rules at once """
+
+    def test_valid_password(self):
+        """ Test a password with a digit and a capital letter passes """
+        self.assertEqual(error_codes(PasswordRulesValidator(), 'Test1234'), [])
+
+    def test_all_failures_reported(self):
+        """ Test every failed rule is reported with its code """
+        self.assertEqual(error_codes(PasswordRulesValidator(), 'password'), ['password_no_digit', 'password_no_capital_letters'])
+        self.assertEqual(error_codes(PasswordRulesValidator(), 'password1'), ['password_no_capital_letters'])
+        self.assertEqual(error_codes(PasswordRulesValidator(), 'Password'), ['password_no_digit'])
+
+    def test_minimum_counts(self):
+        """ Test rules can require more than one character """
+        validator = PasswordRulesValidator(min_digits=3, min_capital_letters=2)
+
+        self.assertEqual(error_codes(validator, 'PAssword12'), ['password_no_digit'])
+        self.assertEqual(error_codes(validator, 'PAssword123'), [])
+
+    def test_messages(self):
+        """ Test messages and help texts are the ones of the previous validators """
+        with self.assertRaises(ValidationError) as context:
+            PasswordRulesValidator().validate('password')
+
+        self.assertEqual(context.exception.messages, [
+            'This password must contain at least 1 digits.',
+            'This password must contain at least 1 capital letter.',
+        ])
+        self.assertEqual(NumericInPasswordCustomValidator(2).get_help_text(), 'Your password must contain at least 2 digits.')
+        self.assertEqual(AtLeastOneCapitalLetterCustomValidator().get_help_text(), 'Your password must contain at least 1 uppercase letter.')
+
+    def test_single_rule_validators(self):
+        """ Test the previous validators still check only their own rule """
+        self.assertEqual(error_codes(NumericInPasswordCustomValidator(), 'password'), ['password_no_digit'])
+        self.assertEqual(error_codes(AtLeastOneCapitalLetterCustomValidator(), 'password'), ['password_no_capital_letters'])
+
+    def test_configured_pipeline(self):
+        """ Test the configured validators report both rules """
+        with self.assertRaises(ValidationError) as context:
+            validate_password('longpassword')
+
+        codes = [error.code for error in context.exception.error_list]
+        self.assertIn('password_no_digit', codes)
+        self.assertIn('password_no_capital_letters', codes)
+
+    def test_benchmark_command(self):
+        """ Test the benchmark reports throughput of each validator and the pipeline """
+        out = StringIO()
+
+        call_command('benchmark_password_validators', '--iterations', '10', stdout=out)
+
+        self.assertIn('PasswordRulesValidator:', out.getvalue())
+        self.assertIn('Whole pipeline:', out.getvalue())
@@ -0,0 +1,95 @@
+""" Issuing, renewing and cleaning up expiring access tokens and their refresh tokens """
+import hashlib
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core.models import RefreshToken
+from users.authentication import token_expires_at
+
+# Number of expired tokens deleted by one query of the clean up
+PURGE_BATCH_SIZE = 1000
+
+
+def hash_refresh_token(key):
+    """ Return the stored hash of a refresh token, a fast hash is enough for random keys """
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def access_token(user, now, keep_fresh=False):
+    """
+    Return a new access token of the user replacing the previous one, valid tokens are never extended.
+    With keep_fresh, a token younger than half of its time to live is returned as it is,
+    so other clients of the user renewing their tokens after a replacement share the new key instead of replacing it again.
+    """
+    token = Token.objects.filter(user=user).first()
+    if token is not None:
+        if keep_fresh and token_expires_at(token) - now > timedelta(seconds=settings.AUTH_TOKEN_TTL / 2):
+            return token
+        token.delete()
+    return Token.objects.create(user=user)
+
+
+def issue_tokens(user, keep_fresh=False):
+    """ Return an access token and a new refresh token of the user """
+    now = timezone.now()
+    refresh_key = secrets.token_urlsafe(48)
+
+    with transaction.atomic():
+        token = access_token(user, now, keep_fresh)
+        refresh_token = RefreshToken.objects.create(
+            user=user,
+            key_hash=hash_refresh_token(refresh_key),
+            expires_at=now + timedelta(seconds=settings.REFRESH_TOKEN_TTL),
+        )
+
+    return {
+        'token': token.key,
+        'expires_at': token_expires_at(token),
+        'refresh_token': refresh_key,
+        'refresh_expires_at': refresh_token.expires_at,
+    }
+
+
+def refresh_tokens(refresh_key):
+    """ Exchange a refresh token, which can be used only once, for new tokens, return None for an invalid one """
+    with transaction.atomic():
+        refresh_token = (
+            RefreshToken.objects.select_for_update().select_related('user')
+            .filter(key_hash=hash_refresh_token(refresh_key), expires_at__gt=timezone.now(), user__is_active=True)
+            .first()
+        )
+        if refresh_token is None:
+            return None
+        refresh_token.delete()
+        return issue_tokens(refresh_token.user, keep_fresh=True)
+
+
+def revoke_tokens(user_id):
+    """ Delete access and refresh tokens of the user, signing out all of their clients """
+    Token.objects.filter(user_id=user_id).delete()
+    RefreshToken.objects.filter(user_id=user_id).delete()
+
+
+def delete_in_batches(queryset, batch_size):
+    """ Delete rows of the queryset with short queries of at most batch_size rows, return the number of rows """
+    deleted = 0
+    while True:
+        keys = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=keys).delete()[1].get(queryset.model._meta.label, 0)
+
+
+def purge_expired_tokens(batch_size=PURGE_BATCH_SIZE):
+    """ Delete expired access and refresh tokens """
+    now = timezone.now()
+    refresh_count = delete_in_batches(RefreshToken.objects.filter(expires_at__lte=now), batch_size)
+    access_count = delete_in_batches(Token.objects.filter(created__lte=now - timedelta(seconds=settings.AUTH_TOKEN_TTL)), batch_size)
+    print(f'{access_count} expired access tokens and {refresh_count} expired refresh tokens have been deleted.')
+    return access_count, refresh_count
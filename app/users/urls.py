@@ -8,6 +8,7 @@ app_name = 'users'
 urlpatterns = [
     path('register/', views.RegisterNewUserView.as_view(), name='register'),
     path('token/', views.CreateAuthTokenView.as_view(), name='token'),
+    path('token/refresh/', views.RefreshAuthTokenView.as_view(), name='token_refresh'),
     path('me/', views.ManageUserView.as_view(), name='me'),
     path('me/delete/', views.DeleteMeView.as_view(), name='delete_me'),
     path('me/changepassword/', views.ChangeUserPasswordView.as_view(), name='change_password'),
@@ -3,30 +3,62 @@ import re
 from django.core.exceptions import ValidationError
 
 
-class NumericInPasswordCustomValidator:
-    def __init__(self, min_digits=1):
-        self.min_digits = min_digits
+# Character rules checked by PasswordRulesValidator: name, pattern of a single character, error code and messages
+PASSWORD_RULES = [
+    (
+        'digit', r'\d', 'password_no_digit',
+        'This password must contain at least %(min_count)d digits.',
+        'Your password must contain at least %(min_count)d digits.',
+    ),
+    (
+        'capital', r'[A-Z]', 'password_no_capital_letters',
+        'This password must contain at least %(min_count)d capital letter.',
+        'Your password must contain at least %(min_count)d uppercase letter.',
+    ),
+]
 
-    def validate(self, password, user=None):
-        if len(re.findall(r"\d", password)) < self.min_digits:
-            raise ValidationError(
-                'This password must contain at least %(min_digits)d digits.',
-                code='password_no_digit',
-                params={'min_digits': self.min_digits}
-            )
 
-    def get_help_text(self):
-        return 'Your password must contain at least %(min_digits)d digits.' % {'min_digits': self.min_digits}
+class PasswordRulesValidator:
+    """
+    Check all character rules with one precompiled pattern, scanning the password once
+    and stopping as soon as every rule is met. Failed rules are reported together.
+    """
 
+    def __init__(self, min_digits=1, min_capital_letters=1):
+        min_counts = {'digit': min_digits, 'capital': min_capital_letters}
+        self.rules = [(name, code, message, help_text, min_counts[name]) for name, _, code, message, help_text in PASSWORD_RULES if min_counts[name]]
+        self.pattern = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern, *_ in PASSWORD_RULES if min_counts[name]))
 
-class AtLeastOneCapitalLetterCustomValidator:
     def validate(self, password, user=None):
-        if len(re.findall("[A-Z]", password)) < 1:
-            # Standard way of raising errors with serializers, if we raise the error, view translates it into HTTP 400 bad request reponse
-            raise ValidationError(
-                'This password must contain at least 1 capital letter.',
-                code='password_no_capital_letters'
-            )
+        if not self.rules:
+            return
+
+        missing = {name: min_count for name, _, _, _, min_count in self.rules}
+        for match in self.pattern.finditer(password):
+            name = match.lastgroup
+            if name in missing:
+                missing[name] -= 1
+                if missing[name] <= 0:
+                    del missing[name]
+                    if not missing:
+                        return
+
+        errors = [
+            ValidationError(message, code=code, params={'min_count': min_count, 'min_digits': min_count})
+            for name, code, message, _, min_count in self.rules if name in missing
+        ]
+        raise errors[0] if len(errors) == 1 else ValidationError(errors)
 
     def get_help_text(self):
-        return 'Your password must contain at least 1 uppercase letter.'
+        return ' '.join(help_text % {'min_count': min_count} for _, _, _, help_text, min_count in self.rules)
+
+
+class NumericInPasswordCustomValidator(PasswordRulesValidator):
+    def __init__(self, min_digits=1):
+        super().__init__(min_digits=min_digits, min_capital_letters=0)
+        self.min_digits = min_digits
+
+
+class AtLeastOneCapitalLetterCustomValidator(PasswordRulesValidator):
+    def __init__(self):
+        super().__init__(min_digits=0, min_capital_letters=1)
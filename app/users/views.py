@@ -1,6 +1,12 @@
 """ Views for the Users API """
-from rest_framework import generics, authentication, permissions
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed, Throttled
 from rest_framework.settings import api_settings
 from rest_framework.response import Response
 from rest_framework import status
@@ -10,43 +16,95 @@ from users.serializers import (
     ManageUserSerializer,
     ChangePasswordSerializer,
     DeleteMeSerializer,
-    AuthTokenSerializer
+    AuthTokenSerializer,
+    RefreshTokenSerializer
 )
+from core.outbox import deliver_in_background, enqueue
+from reminders.cache import batched_list_bumps
+from users.authentication import CachedTokenAuthentication
 from users.emails import welcome_email
+from users.hashers import HashingBusy
+from users.tokens import issue_tokens
+
+
+class HashingViewMixin:
+    """ Answer with 429 Too Many Requests when views hashing passwords find the hashing pool busy """
+
+    def handle_exception(self, exc):
+        if isinstance(exc, HashingBusy):
+            exc = Throttled(wait=settings.PASSWORD_HASH_TIMEOUT, detail='Too many password checks at once, please try again.')
+        return super().handle_exception(exc)
+
 
+class CurrentUserMixin:
+    """
+    Views writing the authenticated user, who is read from the database instead of the token cache.
+    A cached copy can be stale when another worker has changed the user, and saving it would write the old columns back,
+    e.g. the previous password hash or is_active of a user who has just been deactivated.
+    """
 
-class RegisterNewUserView(generics.CreateAPIView):
+    def get_object(self):
+        """ Retrieve and return the authenticated user, as currently stored for writes, rejecting revoked tokens """
+        if self.request.method in permissions.SAFE_METHODS:
+            return self.request.user
+
+        users = get_user_model().objects.filter(pk=self.request.user.pk, is_active=True)
+        if isinstance(self.request.auth, Token):
+            # A token revoked through another worker may still be cached
+            users = users.filter(auth_token=self.request.auth.key)
+        user = users.first()
+        if user is None:
+            raise AuthenticationFailed('Invalid token.')
+        return user
+
+
+class RegisterNewUserView(HashingViewMixin, generics.CreateAPIView):
     """ Create a new user in the system """
     serializer_class = RegisterNewUserSerializer
 
     def perform_create(self, serializer):
-        """ Create a new user and send a welcoming e-mail """
-        user = serializer.save()
-        if user:
-            welcome_email(user).send()
+        """ Create a new user and send a welcoming e-mail in the background """
+        with transaction.atomic():
+            user = serializer.save()
+            if user:
+                deliver_in_background(enqueue([welcome_email(user)]))
 
 
-class CreateAuthTokenView(ObtainAuthToken):
+class CreateAuthTokenView(HashingViewMixin, ObtainAuthToken):
     """ Create a new Auth Token for validated users """
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        """ Return an expiring access token with a refresh token renewing it """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(issue_tokens(serializer.validated_data['user']))
+
+
+class RefreshAuthTokenView(generics.GenericAPIView):
+    """ Renew the Auth Token with a refresh token instead of the password """
+    serializer_class = RefreshTokenSerializer
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request, *args, **kwargs):
+        """ Return a valid access token and a new refresh token, the used one stops working """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.validated_data['tokens'])
+
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(CurrentUserMixin, generics.RetrieveUpdateAPIView):
     """ Manage the authenticated user """
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ManageUserSerializer
 
-    # Thanks to Token Auth, user will be added to the request
-    def get_object(self):
-        """ Retrieve and return the authenticated user """
-        return self.request.user
-
 
-class ChangeUserPasswordView(generics.UpdateAPIView):
+class ChangeUserPasswordView(CurrentUserMixin, HashingViewMixin, generics.UpdateAPIView):
     """ View for changing the authenticated user's password """
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ChangePasswordSerializer
 
@@ -66,14 +124,10 @@ class ChangeUserPasswordView(generics.UpdateAPIView):
 
         return Response({'msg': 'Password has been changed.'})
 
-    def get_object(self):
-        """ Retrieve and return the authenticated user """
-        return self.request.user
 
-
-class DeleteMeView(generics.DestroyAPIView):
+class DeleteMeView(CurrentUserMixin, HashingViewMixin, generics.DestroyAPIView):
     """ View for deleting the authenticated user """
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = DeleteMeSerializer
 
@@ -87,6 +141,7 @@ class DeleteMeView(generics.DestroyAPIView):
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    def get_object(self):
-        """ Retrieve and return the authenticated user """
-        return self.request.user
+    def perform_destroy(self, instance):
+        """ Delete the user with reminders and tags, bumping their listings once instead of once per deleted row """
+        with batched_list_bumps():
+            instance.delete()
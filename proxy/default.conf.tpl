@@ -5,9 +5,25 @@ server {
         alias /vol/static;
     }
 
+    location /api/reminders/reminders/export/ {
+        uwsgi_pass            ${APP_HOST}:${APP_PORT};
+        include               /etc/nginx/uwsgi_params;
+        # Exports are streamed, pass chunks to the client as they come
+        uwsgi_buffering       off;
+        uwsgi_read_timeout    300s;
+    }
+
+    location /api/reminders/reminders/import/ {
+        uwsgi_pass            ${APP_HOST}:${APP_PORT};
+        include               /etc/nginx/uwsgi_params;
+        # Organisations import files much larger than other requests
+        client_max_body_size  200M;
+        uwsgi_read_timeout    600s;
+    }
+
     location / {
         uwsgi_pass            ${APP_HOST}:${APP_PORT};
         include               /etc/nginx/uwsgi_params;
         client_max_body_size  10M;
     }
-}
\ No newline at end of file
+}